@@ -0,0 +1,119 @@
+'''
+Adder design
+------------
+
+The N-bit Adder and its errors. It only depends on nMigen and stream.py, the cocotb tests of the Adder are in
+adder_tests.py.
+'''
+from nmigen import *
+
+from stream import Stream
+
+
+class InvalidArgument(RuntimeError):
+    def __init__(self, arg):
+           super().__init__()
+           self.arg = arg
+
+
+class Adder(Elaboratable):
+    '''
+    Module Description
+    ------------------
+    A sync N-bit adder with an async reset. The output port have N+1 bits to store the sum.
+
+
+    Module Diagram
+    --------------
+
+                       |--------------|
+             a_data -->|              |
+            a_valid -->|              |
+            a_ready <--|              |
+                       |              |-->  r_data
+                       |    Adder     |--> r_valid
+                       |              |<--  r_ready
+             b_data -->|              |
+            b_valid -->|              |
+            b_ready <--|              |
+                       |--------------|
+                           ^       ^
+                           |       |
+                          rst     clk
+
+    Parameters
+    ----------
+    N : int
+        Number of bits of a_data/b_data.
+
+    Attributes
+    ----------
+    rst : Signal, in
+        The result of the sum will be '0' if 'rst = 1'.
+
+    a_valid, b_valid : Signal, in
+        Input 'X_valid' signals are used to check the availability of data in the input ports.
+
+    a_ready, b_ready : Signal, out
+        Output 'X_ready' signals are indicate whether the module is listening to the input port.
+
+    a_data, b_data : Singal(N), in
+        N-bit input ports. Both summands should be load here.
+
+    r_valid: Signal, out
+        Signal used to inticate whether the result of the sum is ready to be read.
+
+    r_ready: Signal, in
+        Input signal used to check if the result was read.
+
+    r_data: Signal(N+1), out
+        (N+1)-bit output port. The result of the sum will be load here one clock cycle after both summands were read.
+    '''
+    def __init__(self, N):                  # We assume Port B data is not available yet (We need to do this to avoid an exception in the Stream.Driver.recv)
+
+        # Arguments Validation
+        if N < 1:   # If the input argument type is not an integer it should raise a TypeError
+            raise InvalidArgument("The argument 'N' should be a natural value greater than 1.")
+
+        self.N = N
+
+        # Ports Definition
+        self.a = Stream(N, name='a')
+        self.b = Stream(N, name='b')
+        self.r = Stream(N+1, name='r')
+
+        self.r_reg = Signal(N+1)
+
+    def elaborate(self, platform):
+        # Definitions
+        m = Module()
+        sync = m.d.sync
+        comb = m.d.comb
+
+        # Combinational logic
+        # ===================
+        comb += [
+            self.a.ready.eq(self.a.valid & self.b.valid & self.r.ready),  # I Indicate that i'm working with the registers
+            self.b.ready.eq(self.a.valid & self.b.valid & self.r.ready)   # I Indicate that i'm working with the registers
+            ]
+
+
+        # Sequential logic
+        # ===================
+        with m.If(self.a.valid & self.b.valid & self.r.ready):         # Wait until both a_data and b_data are read
+            sync += self.r.valid.eq(1)                                 # I Indicates that the result is available to be read
+
+            comb += self.r_reg.eq(self.a.data.as_signed() + self.b.data.as_signed())
+
+            #sync += self.r.data.eq(self.a.data.as_signed() + self.b.data.as_signed())
+            # nMigen generates a (N+1) signal if we need to add two (N) signals
+            # More info: https://nmigen.info/nmigen/latest/lang.html#arithmetic-operators
+
+        with m.Else():
+            with m.If(self.r.accepted()):               # If r_ready & r_valid
+                sync += self.r.valid.eq(0)              # The output was read and it is not longer available.
+
+        with m.If(self.a.valid & self.b.valid & self.r.ready):
+            sync += self.r.data.eq(self.r_reg)
+
+        return m
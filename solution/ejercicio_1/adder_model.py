@@ -0,0 +1,254 @@
+'''
+Adder reference model
+---------------------
+
+Cycle-accurate model of the Adder of adder.py, without any simulator. In each cycle:
+
+  - a_ready = b_ready = a_valid & b_valid & r_ready, so both summands are read in the same cycle.
+  - If they are read, the next cycle r_valid is high and r_data is their (N+1)-bit signed sum.
+  - Otherwise, if r_valid & r_ready, the result was read and r_valid goes low. r_data is kept.
+
+The model is vectorized with NumPy over many independent streams (one Adder each), so a few thousand steps explore
+hundreds of millions of cycles. The cocotb tests take their expected values from it, and LockstepChecker compares
+it with the simulated Adder cycle by cycle.
+'''
+import argparse
+import sys
+import time
+
+import numpy as np      # Used external module! pip install numpy
+
+from scoreboard import to_signed
+
+
+class AdderModel:
+    '''
+    Class Description
+    ------------------
+    State of 'streams' independent Adders, after reset.
+
+    Parameters
+    ----------
+    N : int
+        Number of bits of a_data/b_data.
+
+    streams : int
+        Number of Adders.
+
+    Attributes
+    ----------
+    r_valid : numpy.ndarray of bool
+        r_valid of each Adder in the current cycle.
+
+    r_data : numpy.ndarray
+        r_data of each Adder in the current cycle, as a signed value (int64, or python ints when N+1 > 63).
+
+    cycle : int
+        Number of cycles since the reset.
+    '''
+    def __init__(self, N, streams=1):
+        self.N = N
+        self.streams = streams
+        self.dtype = np.int64 if N + 1 <= 63 else object
+        self.reset()
+
+    def reset(self):
+        self.r_valid = np.zeros(self.streams, dtype=bool)
+        self.r_data = np.zeros(self.streams, dtype=self.dtype)
+        self.cycle = 0
+
+    def add(self, a, b):
+        '''It returns the (N+1)-bit signed sums of the raw (or signed) N-bit summands 'a' and 'b'.'''
+        dtype = np.int64 if self.N <= 63 else object
+        mask = (1 << self.N) - 1
+        a = to_signed(np.asarray(a, dtype=dtype) & mask, self.N)
+        b = to_signed(np.asarray(b, dtype=dtype) & mask, self.N)
+        return a + b
+
+    def step(self, a_valid, a_data, b_valid, b_data, r_ready):
+        '''
+        Function Description
+        ------------------
+        It simulates one cycle with the given inputs (arrays with a value per Adder, or scalars) and moves to the
+        next one. It returns the outputs during that cycle: (ready, r_valid, r_data, accepted), where 'ready' is
+        a_ready and b_ready, and 'accepted' tells whether the result was read (r_valid & r_ready).
+
+        '''
+        r_valid = self.r_valid
+        r_data = self.r_data
+        ready = np.logical_and(np.logical_and(a_valid, b_valid), r_ready)
+        accepted = r_valid & np.asarray(r_ready, dtype=bool)
+
+        self.r_valid = ready | (r_valid & ~accepted)
+        self.r_data = np.where(ready, self.add(a_data, b_data), r_data)
+        self.cycle += 1
+        return ready, r_valid, r_data, accepted
+
+
+def stream_values(N, seed, port, streams, index):
+    '''
+    Function Description
+    ------------------
+    It returns the raw N-bit value number 'index' (an array, one per stream) sent to the port 'port' of each stream,
+    derived from a hash (SplitMix64) so that nothing has to be stored. N must be at most 62.
+
+    '''
+    x = (np.uint64(seed) * np.uint64(0x9E3779B97F4A7C15) + np.arange(streams, dtype=np.uint64) * np.uint64(2)
+         + np.uint64(port)) ^ (index.astype(np.uint64) * np.uint64(0xBF58476D1CE4E5B9))
+    x ^= x >> np.uint64(30)
+    x *= np.uint64(0xBF58476D1CE4E5B9)
+    x ^= x >> np.uint64(27)
+    x *= np.uint64(0x94D049BB133111EB)
+    x ^= x >> np.uint64(31)
+    return (x & np.uint64((1 << N) - 1)).astype(np.int64)
+
+
+def explore(N, streams, cycles, gap_a=0.0, gap_b=0.0, ready=1.0, seed=0):
+    '''
+    Function Description
+    ------------------
+    It runs 'streams' Adders for 'cycles' cycles with random backpressure: the inputs are driven like
+    stimulus.produce() (before each beat 'valid' stays low with probability 'gap_a'/'gap_b' in each cycle, and once
+    it is high it is held until the beat is read) and r_ready is high with probability 'ready' in each cycle.
+
+    Every result read is checked against the sum of the summands with the same index, so a lost, duplicated or
+    reordered beat is detected. Returns a dict with the statistics of the run.
+
+    Parameters
+    ----------
+    N : int
+        Number of bits of the summands, at most 62.
+
+    streams : int
+        Number of Adders simulated at once.
+
+    cycles : int
+        Number of cycles.
+
+    gap_a, gap_b : float
+        Probability of leaving the input 'valid' low in each cycle before a beat.
+
+    ready : float
+        Probability of r_ready being high in each cycle.
+
+    seed : int
+        Seed of the summands and of the backpressure.
+
+    '''
+    if N > 62:
+        raise ValueError("The exploration supports up to 62 bits.")
+
+    rng = np.random.default_rng(seed)
+    model = AdderModel(N, streams)
+    sent = np.zeros(streams, dtype=np.int64)        # Index of the current summand of each stream
+    recved = np.zeros(streams, dtype=np.int64)      # Index of the next result
+    a_valid = np.zeros(streams, dtype=bool)
+    b_valid = np.zeros(streams, dtype=bool)
+    stalls = np.zeros(3, dtype=np.int64)            # Cycles with valid & ~ready of a, b and r
+    errors = 0
+
+    start = time.perf_counter()
+    for _ in range(cycles):
+        draw = rng.random((3, streams))
+        a_valid |= draw[0] >= gap_a                 # 'valid' is held until the beat is read
+        b_valid |= draw[1] >= gap_b
+        r_ready = draw[2] < ready
+
+        a_data = stream_values(N, seed, 0, streams, sent)
+        b_data = stream_values(N, seed, 1, streams, sent)
+        fire, r_valid, r_data, accepted = model.step(a_valid, a_data, b_valid, b_data, r_ready)
+
+        if accepted.any():
+            expected = model.add(stream_values(N, seed, 0, streams, recved), stream_values(N, seed, 1, streams, recved))
+            errors += int(np.count_nonzero(accepted & (r_data != expected)))
+        stalls += [np.count_nonzero(a_valid & ~fire), np.count_nonzero(b_valid & ~fire),
+                   np.count_nonzero(r_valid & ~r_ready)]
+        recved += accepted
+        sent += fire
+        a_valid &= ~fire
+        b_valid &= ~fire
+    elapsed = time.perf_counter() - start
+
+    # A beat can not be lost: the ones sent and not read yet are in the output register
+    errors += int(np.count_nonzero(sent - recved != model.r_valid))
+
+    return {
+        'streams': streams,
+        'cycles': cycles,
+        'transactions': int(recved.sum()),
+        'tx_per_cycle': float(recved.sum()) / (streams * cycles),
+        'stall_cycles': dict(zip('abr', stalls.tolist())),
+        'errors': errors,
+        'cycles_per_second': streams * cycles / elapsed,
+    }
+
+
+class LockstepChecker:
+    '''
+    Class Description
+    ------------------
+    Coroutine that steps an AdderModel with the inputs of the simulated Adder on every rising edge, and compares its
+    outputs (a_ready, b_ready, r_valid and, while r_valid is high, r_data). It must be started right after reset.
+
+    Attributes
+    ----------
+    cycles : int
+        Number of cycles checked.
+
+    errors : list of str
+        Description of the first mismatches.
+    '''
+    MAX_ERRORS = 10
+
+    def __init__(self, dut):
+        from backend import RisingEdge
+        from drivers import signal_reader
+
+        self.N = len(dut.a__data)
+        self.model = AdderModel(self.N)
+        self.cycles = 0
+        self.errors = []
+        self._edge = RisingEdge(dut.clk)
+        self._read = {                                          # Handshakes read as 0 until they are driven
+            prefix + field: signal_reader(getattr(dut, prefix + field), prefix + field,
+                                          unresolved=None if field == 'data' else 0)
+            for prefix in ('a__', 'b__', 'r__') for field in ('valid', 'ready', 'data')
+        }
+
+    async def run(self):
+        read = self._read
+        mask = (1 << (self.N + 1)) - 1
+        while True:
+            await self._edge
+            # 'data' is only read while it is valid, before the first beat it may not be driven (X)
+            a_valid, b_valid = read['a__valid'](), read['b__valid']()
+            ready, r_valid, r_data, _ = self.model.step(a_valid, read['a__data']() if a_valid else 0, b_valid,
+                                                        read['b__data']() if b_valid else 0, read['r__ready']())
+            got = (read['a__ready'](), read['b__ready'](), read['r__valid']())
+            expected = (int(ready), int(ready), int(r_valid[0]))
+            got_data = read['r__data']() if got[2] else 0
+            if got != expected or (r_valid[0] and got_data != int(r_data[0]) & mask):
+                if len(self.errors) < self.MAX_ERRORS:
+                    self.errors.append("cycle {:d}: a_ready, b_ready, r_valid, r_data = {}, {:#x} (expected {}, {:#x})"
+                                       .format(self.cycles, got, got_data, expected, int(r_data[0]) & mask))
+            self.cycles += 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Explores backpressure patterns with the Adder model.")
+    parser.add_argument('-N', '--width', type=int, default=32, help="bits of the summands (default: %(default)s)")
+    parser.add_argument('-s', '--streams', type=int, default=100000,
+                        help="Adders simulated at once (default: %(default)s)")
+    parser.add_argument('-c', '--cycles', type=int, default=1000, help="cycles of each Adder (default: %(default)s)")
+    parser.add_argument('--gap-a', type=float, default=0.2)
+    parser.add_argument('--gap-b', type=float, default=0.2)
+    parser.add_argument('--ready', type=float, default=0.7, help="probability of r_ready (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    stats = explore(args.width, args.streams, args.cycles, args.gap_a, args.gap_b, args.ready, args.seed)
+    print("{:d} Adders x {:d} cycles: {:d} transactions, {:.3f} per cycle, {:d} errors".format(
+        stats['streams'], stats['cycles'], stats['transactions'], stats['tx_per_cycle'], stats['errors']))
+    print("Stall cycles: " + ", ".join("{:s} {:d}".format(port, n) for port, n in stats['stall_cycles'].items()))
+    print("{:.3g} cycles/s".format(stats['cycles_per_second']))
+    sys.exit(1 if stats['errors'] else 0)
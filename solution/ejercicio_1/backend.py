@@ -0,0 +1,345 @@
+'''
+Simulation backends
+-------------------
+
+The Stream tests are written as cocotb coroutines. They can run on two backends:
+
+  - cocotb: the design is converted to Verilog and simulated with iverilog through nmigen_cocotb.run().
+  - pysim: the design is simulated in-process with nMigen's Python simulator, so there is no Verilog generation
+    nor compile step.
+
+To be backend independent the tests (and the Stream drivers) have to use the triggers and helpers of this module
+(RisingEdge, FallingEdge, fork, start_clock, init_test) instead of the cocotb ones. With the cocotb backend they are
+the cocotb ones. nMigen is only imported by the pysim backend.
+'''
+import logging
+import os
+import random
+import time
+
+import cocotb
+from cocotb import triggers
+from cocotb.clock import Clock
+from cocotb.decorators import test as CocotbTest
+
+BACKENDS = ('cocotb', 'pysim')
+
+
+def RisingEdge(signal):
+    if isinstance(signal, PysimSignal):
+        return signal.simulation.rising_edge
+    return triggers.RisingEdge(signal)
+
+
+def FallingEdge(signal):
+    if isinstance(signal, PysimSignal):
+        return signal.simulation.falling_edge
+    return triggers.FallingEdge(signal)
+
+
+def fork(coro):
+    simulation = PysimSimulation.current
+    if simulation is not None:
+        return simulation.fork(coro)
+    return cocotb.fork(coro)
+
+
+def start_clock(clk, period_ns=10):
+    # The pysim clock is added by the simulation itself
+    if not isinstance(clk, PysimSignal):
+        cocotb.fork(Clock(clk, period_ns, 'ns').start())
+
+
+async def init_test(dut):
+    '''It starts the clock and keeps the reset asserted for two cycles.'''
+    start_clock(dut.clk)
+    dut.rst <= 1
+    await RisingEdge(dut.clk)
+    await RisingEdge(dut.clk)
+    dut.rst <= 0
+
+
+class _Trigger:
+    def __init__(self, kind):
+        self.kind = kind
+
+    def __await__(self):
+        yield self
+
+
+class _Value(int):
+    # cocotb handles return a BinaryValue, the tests use its 'integer' attribute
+    @property
+    def integer(self):
+        return int(self)
+
+
+class PysimSignal:
+    '''
+    Class Description
+    ------------------
+    Stands for a cocotb signal handle ('dut.a__data') in the pysim backend. Values are read from the last sampling
+    point and writes are applied after every coroutine has reached its next trigger, like cocotb's '<='.
+    '''
+    def __init__(self, simulation, name, signal):
+        self.simulation = simulation
+        self.name = name
+        self.signal = signal
+
+    def __len__(self):
+        return len(self.signal)
+
+    @property
+    def value(self):
+        return _Value(self.simulation.values[self.name])
+
+    @value.setter
+    def value(self, value):
+        self.simulation.writes[self.name] = value
+
+    def __le__(self, value):
+        self.value = value
+
+    def read(self):
+        return self.simulation.values[self.name]
+
+
+class PysimDut:
+    '''Gives access to the ports of the design as 'dut.<name>', like the cocotb 'dut' object.'''
+    def __init__(self, simulation, signals):
+        self._log = logging.getLogger('pysim.dut')
+        for name, signal in signals.items():
+            setattr(self, name, PysimSignal(simulation, name, signal))
+
+
+class PysimSimulation:
+    '''
+    Class Description
+    ------------------
+    Runs one cocotb-style test on nMigen's Python simulator.
+
+    A single simulator process works as the scheduler of the test coroutines. On every cycle it samples all the
+    ports just before the rising edge, resumes the coroutines waiting on RisingEdge, applies their writes, settles
+    the design and does the same with the coroutines waiting on FallingEdge.
+
+    Parameters
+    ----------
+    design : Elaboratable
+        Design under test. It is clocked by the 'sync' domain.
+
+    ports : list of Signal
+        Ports accessible from the test, by name.
+
+    period_ns : int
+        Clock period.
+
+    max_cycles : int
+        The test fails if it is still running after this number of cycles.
+    '''
+    current = None
+
+    def __init__(self, design, ports, period_ns=10, max_cycles=100000):
+        # nMigen is only imported by the pysim backend, the cocotb test modules do not need it
+        from nmigen import ClockDomain, Module
+        from nmigen.sim import Simulator
+
+        m = Module()
+        m.domains.sync = cd = ClockDomain('sync')
+        m.submodules.dut = design
+
+        signals = {'clk': cd.clk, 'rst': cd.rst}
+        signals.update((port.name, port) for port in ports)
+
+        self.period_ns = period_ns
+        self.max_cycles = max_cycles
+        self.cycles = 0
+        self.values = {name: 0 for name in signals}
+        self.writes = {}
+        self.rising_edge = _Trigger('rising')
+        self.falling_edge = _Trigger('falling')
+        self.dut = PysimDut(self, signals)
+
+        self._signals = signals
+        self._sim = Simulator(m)
+        self._sim.add_clock(period_ns * 1e-9)
+        self._runnable = []
+        self._waiting = {'rising': [], 'falling': []}
+
+    @property
+    def sim_time_ns(self):
+        return self.cycles * self.period_ns
+
+    def fork(self, coro):
+        self._runnable.append(coro)
+        return coro
+
+    def _resume(self):
+        # Runs every runnable coroutine until it awaits a trigger (forked coroutines start in the same pass)
+        while self._runnable:
+            coro = self._runnable.pop(0)
+            try:
+                trigger = coro.send(None)
+            except StopIteration:
+                continue
+            if not isinstance(trigger, _Trigger):
+                raise TypeError("Only RisingEdge and FallingEdge from 'backend' can be awaited in the pysim backend.")
+            self._waiting[trigger.kind].append(coro)
+
+    def _sample(self):
+        for name, signal in self._signals.items():
+            self.values[name] = yield signal
+
+    def _flush(self):
+        writes, self.writes = self.writes, {}
+        for name, value in writes.items():
+            yield self._signals[name].eq(value)
+
+    def _wake(self, kind):
+        self._runnable.extend(self._waiting[kind])
+        self._waiting[kind] = []
+
+    def _process(self, main):
+        from nmigen.sim import Settle, Tick
+
+        yield from self._sample()
+        self._runnable.append(main)
+        while True:
+            self._resume()
+            yield from self._flush()
+            if main.cr_frame is None:                   # The test coroutine has finished
+                return
+
+            if self._waiting['falling']:
+                yield Settle()
+                yield from self._sample()
+                self._wake('falling')
+                self._resume()
+                yield from self._flush()
+                if main.cr_frame is None:
+                    return
+
+            if self.cycles == self.max_cycles:
+                raise TimeoutError("The test did not finish after {:d} cycles.".format(self.max_cycles))
+            yield Tick()
+            self.cycles += 1
+            yield from self._sample()
+            self._wake('rising')
+
+    def run(self, test):
+        '''
+        It runs the test coroutine function 'test(dut)' until it returns. Any exception raised by the test (or by a
+        coroutine forked from it) is propagated.
+        '''
+        main = test(self.dut)
+
+        def process():
+            yield from self._process(main)
+
+        PysimSimulation.current = self
+        try:
+            self._sim.add_process(process)
+            self._sim.run()
+        finally:
+            PysimSimulation.current = None
+
+
+def collect_tests(module):
+    '''It returns the cocotb tests declared in the given module, in declaration order.'''
+    return [obj for obj in vars(module).values() if isinstance(obj, CocotbTest)]
+
+
+def run_pysim(design, module, ports, period_ns=10, tests=None):
+    '''
+    Function Description
+    ------------------
+    Runs every cocotb test of 'module' on the pysim backend, each one on a fresh simulation. It returns one dict per
+    test with the same keys as sweep.parse_results().
+
+    Parameters
+    ----------
+    design : Elaboratable
+        Design under test.
+
+    module : module
+        Module where the tests are declared.
+
+    ports : list of Signal
+        Ports accessible from the tests.
+
+    tests : list of str
+        Names of the tests to be run, like cocotb's TESTCASE. By default, all of them.
+
+    '''
+    seed = os.environ.get('RANDOM_SEED')                # cocotb seeds the random module the same way
+    if seed is not None:
+        random.seed(int(seed))
+
+    results = []
+    for test in collect_tests(module):
+        if tests is not None and test._func.__name__ not in tests:
+            continue
+        simulation = PysimSimulation(design, ports, period_ns)
+        error = None
+        start = time.perf_counter()
+        try:
+            simulation.run(test._func)
+        except Exception as e:
+            error = "{:s}: {:s}".format(type(e).__name__, str(e))
+        wall_time = time.perf_counter() - start
+
+        results.append({
+            'name': test._func.__name__,
+            'passed': error is None,
+            'wall_time': wall_time,
+            'sim_time_ns': float(simulation.sim_time_ns),
+            'error': error,
+        })
+    return results
+
+
+def run_tests(design, module, ports, backend):
+    '''
+    Function Description
+    ------------------
+    Runs every cocotb test of 'module' on 'design' with one of BACKENDS, and returns whether all of them passed.
+    With the cocotb backend the tests are loaded by the simulator from the file of 'module'.
+
+    '''
+    if backend == 'pysim':
+        return all(t['passed'] for t in run_pysim(design, module, ports))
+
+    from nmigen_cocotb import run
+    try:
+        run(design, os.path.splitext(os.path.basename(module.__file__))[0], ports=ports)
+    except (Exception, SystemExit):                                     # cocotb-test exits when a test fails
+        return False
+    return True
+
+
+def run_table(runs, module, backend, header, row):
+    '''
+    Function Description
+    ------------------
+    Runs the tests of 'module' for several designs with run_tests(), printing a PASS/FAIL table. It returns the exit
+    status: 1 if a run failed, otherwise 0.
+
+    Parameters
+    ----------
+    runs : iterable of (design, ports, values)
+        Designs to be tested. It can be a generator, each run starts after the previous one is printed.
+
+    header : list of str
+        Lines printed before the table.
+
+    row : str
+        Format of each line, the 'values' of the run followed by the result.
+
+    '''
+    failed = False
+    for line in header:
+        print(line)
+    for design, ports, values in runs:
+        passed = run_tests(design, module, ports, backend)
+        failed |= not passed
+        print(row.format(*values, 'PASS' if passed else 'FAIL'))
+    return 1 if failed else 0
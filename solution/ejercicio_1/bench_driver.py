@@ -0,0 +1,76 @@
+import os
+import time
+from random import getrandbits
+
+import cocotb
+
+from adder import Adder
+from backend import RisingEdge, fork, init_test
+from stream import Stream
+
+BEATS = int(os.environ.get('BENCH_BEATS', 10000))
+
+
+async def measure(dut, driver):
+    '''
+    Function Description
+    ------------------
+    Sends BEATS random pairs through the Adder with the given driver class and returns the beats per second.
+
+    '''
+    stream_input_a = driver(dut.clk, dut, 'a__')
+    stream_input_b = driver(dut.clk, dut, 'b__')
+    stream_output = driver(dut.clk, dut, 'r__')
+
+    width = len(dut.a__data)
+    data_a = [getrandbits(width) for _ in range(BEATS)]
+    data_b = [getrandbits(width) for _ in range(BEATS)]
+    count = 0
+
+    def sink(value):
+        nonlocal count
+        count += 1
+
+    start = time.perf_counter()
+    fork(stream_input_a.send(data_a))
+    fork(stream_input_b.send(data_b))
+    await stream_output.recv(BEATS, sink=sink)
+    elapsed = time.perf_counter() - start
+
+    assert count == BEATS
+    return BEATS / elapsed
+
+
+@cocotb.test()
+async def driver_benchmark(dut):
+    '''
+    Test Description
+    ------------------
+    Reports the beats per second reached by Stream.Driver and Stream.FastDriver.
+    '''
+    await init_test(dut)
+
+    rates = {}
+    for driver in (Stream.Driver, Stream.FastDriver):
+        rates[driver.__name__] = await measure(dut, driver)
+        await RisingEdge(dut.clk)
+
+    for name, rate in rates.items():
+        dut._log.info("{:>10s}: {:10.0f} beats/s".format(name, rate))
+    dut._log.info("Speedup: {:.2f}x".format(rates['FastDriver'] / rates['Driver']))
+
+
+if __name__ == '__main__':
+    from nmigen_cocotb import run
+
+    width = int(os.environ.get('BENCH_WIDTH', 16))
+    myAdder = Adder(width)
+    run(
+        myAdder, 'bench_driver',
+        ports=
+        [
+            *list(myAdder.a.fields.values()),
+            *list(myAdder.b.fields.values()),
+            *list(myAdder.r.fields.values())
+        ]
+    )
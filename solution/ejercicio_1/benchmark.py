@@ -0,0 +1,296 @@
+'''
+Stream cores benchmark
+----------------------
+
+Runs the Adder and the Incrementador for several widths and producer/consumer patterns, and records for each run:
+
+  - tx_per_cycle: results per cycle, once the first result is out (steady state throughput).
+  - latency: cycles between the first input handshake and the first result.
+  - stall_cycles: cycles in which an input was valid but it was not accepted.
+  - cycles_per_second: simulated cycles per wall-clock second.
+  - peak_rss_kb: peak resident memory of the simulation process.
+
+The results are written to a JSON file. If a baseline (a previous results file) is given, every metric is compared
+against it and the run fails if one of them is worse by more than the threshold.
+'''
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+from multiprocessing import Pool
+from random import getrandbits, random
+
+import cocotb
+
+from backend import BACKENDS, RisingEdge, fork, init_test
+from scoreboard import Scoreboard, to_signed
+from stimulus import produce
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CORES = ('adder', 'incrementador')
+PATTERNS = ('always_valid', 'valid_gaps', 'backpressure', 'delayed_b')
+DEFAULT_WIDTHS = [8, 32]
+
+GAP_PROBABILITY = 0.3           # Probability of an idle cycle before each beat, in 'valid_gaps'
+READY_PROBABILITY = 0.5         # Probability of 'r_ready' being high on each cycle, in 'backpressure'
+B_DELAY = 10                    # Cycles that port B is delayed, in 'delayed_b' (like input_delay_test)
+
+# Metrics compared against the baseline, and whether a higher value is better
+METRICS = {
+    'tx_per_cycle': True,
+    'latency': False,
+    'stall_cycles': False,
+    'cycles_per_second': True,
+    'peak_rss_kb': False,
+}
+WALL_METRICS = ('cycles_per_second', 'peak_rss_kb')     # They depend on the machine, so they have their own threshold
+
+
+@cocotb.test()
+async def stream_benchmark(dut):
+    '''
+    Test Description
+    ------------------
+    Sends BENCH_TRANSACTIONS transactions through the core with the BENCH_PATTERN pattern, checks the results and
+    writes the metrics to BENCH_RESULTS.
+    '''
+    # Definitions
+    core = os.environ.get('BENCH_CORE', 'adder')
+    pattern = os.environ.get('BENCH_PATTERN', 'always_valid')
+    M = int(os.environ.get('BENCH_TRANSACTIONS', 1000))
+    width = len(dut.a__data)
+    inputs = ['a__', 'b__'] if core == 'adder' else ['a__']
+
+    # Test Data
+    data = {prefix: [getrandbits(width) for _ in range(M)] for prefix in inputs}
+    if core == 'adder':
+        expected = (x + y for x, y in zip(to_signed(data['a__'], width), to_signed(data['b__'], width)))
+        scoreboard = Scoreboard(width + 1, expected)
+    else:
+        scoreboard = Scoreboard(width, to_signed([(d + 1) & ((1 << width) - 1) for d in data['a__']], width))
+
+    # Test Execution
+    await init_test(dut)
+    for prefix in inputs:
+        getattr(dut, prefix + 'valid') <= 0
+    for prefix in inputs:
+        gap = GAP_PROBABILITY if pattern == 'valid_gaps' else 0.0
+        delay = B_DELAY if pattern == 'delayed_b' and prefix == 'b__' else 0
+        fork(produce(dut, prefix, data[prefix], gap, delay))
+
+    valids = [getattr(dut, prefix + 'valid') for prefix in inputs]
+    readies = [getattr(dut, prefix + 'ready') for prefix in inputs]
+    cycle = 0
+    stalls = 0
+    first_input = None
+    output_cycles = []
+    start = time.perf_counter()
+    while len(output_cycles) < M:
+        dut.r__ready <= (int(random() < READY_PROBABILITY) if pattern == 'backpressure' else 1)
+        await RisingEdge(dut.clk)
+        cycle += 1
+        accepted = [v.value == 1 and r.value == 1 for v, r in zip(valids, readies)]
+        if any(v.value == 1 and r.value == 0 for v, r in zip(valids, readies)):
+            stalls += 1
+        if first_input is None and any(accepted):
+            first_input = cycle
+        if dut.r__valid.value == 1 and dut.r__ready.value == 1:
+            output_cycles.append(cycle)
+            scoreboard.push(dut.r__data.value.integer)
+    elapsed = time.perf_counter() - start
+    dut.r__ready <= 0
+    scoreboard.flush()
+
+    metrics = {
+        'tx_per_cycle': (M - 1) / (output_cycles[-1] - output_cycles[0]) if M > 1 else 0.0,
+        'latency': output_cycles[0] - first_input,
+        'stall_cycles': stalls,
+        'cycles': cycle,
+        'cycles_per_second': cycle / elapsed,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+    dut._log.info(", ".join("{:s}: {}".format(key, value) for key, value in metrics.items()))
+
+    results_file = os.environ.get('BENCH_RESULTS')
+    if results_file:
+        with open(results_file, 'w') as f:
+            json.dump(metrics, f)
+
+
+def build_core(core, width):
+    '''It returns the design and its ports.'''
+    if core == 'adder':
+        from adder import Adder
+        design = Adder(width)
+        streams = [design.a, design.b, design.r]
+    else:
+        from incrementador import Incrementador
+        design = Incrementador(width)
+        streams = [design.a, design.r]
+    return design, [port for stream in streams for port in stream.fields.values()]
+
+
+def run_config(config):
+    '''
+    Function Description
+    ------------------
+    Runs one benchmark, in its own process so that 'peak_rss_kb' only measures this run. It returns the config with
+    the metrics, or with the error if the run failed.
+
+    Parameters
+    ----------
+    config : dict
+        'core', 'width', 'pattern', 'backend', 'transactions', 'seed' and 'build_dir'.
+
+    '''
+    build_dir = os.path.join(config['build_dir'], '{core}-{width}bit-{pattern}'.format(**config))
+    os.makedirs(build_dir, exist_ok=True)
+    results_file = os.path.join(build_dir, 'bench.json')
+    if os.path.exists(results_file):
+        os.remove(results_file)
+
+    os.environ.update({
+        'BENCH_CORE': config['core'],
+        'BENCH_PATTERN': config['pattern'],
+        'BENCH_TRANSACTIONS': str(config['transactions']),
+        'BENCH_RESULTS': results_file,
+        'RANDOM_SEED': str(config['seed']),
+        'PYTHONPATH': os.pathsep.join(filter(None, [HERE, os.environ.get('PYTHONPATH')])),
+    })
+    os.chdir(build_dir)
+
+    design, ports = build_core(config['core'], config['width'])
+    result = dict(config)
+    del result['build_dir']
+    error = None
+    try:
+        if config['backend'] == 'pysim':
+            from backend import run_pysim
+            tests = run_pysim(design, sys.modules[__name__], ports)
+            error = tests[0]['error']
+        else:
+            from nmigen_cocotb import run
+            run(design, 'benchmark', ports=ports)
+    except (Exception, SystemExit) as e:                                       # cocotb-test exits when a test fails
+        error = str(e) or type(e).__name__
+
+    if error is None and os.path.isfile(results_file):
+        with open(results_file) as f:
+            result.update(json.load(f))
+    else:
+        result['error'] = error or "No results were written."
+    return result
+
+
+def compare(results, baseline, threshold, wall_threshold):
+    '''
+    Function Description
+    ------------------
+    It returns a list with a message for every metric that is worse than in the baseline by more than the
+    threshold (relative). The configs that are not in the baseline are not compared.
+
+    Parameters
+    ----------
+    results, baseline : list of dict
+        Results of run_config().
+
+    threshold : float
+        Allowed relative degradation of the cycle metrics.
+
+    wall_threshold : float
+        Allowed relative degradation of the metrics that depend on the machine (WALL_METRICS).
+
+    '''
+    def key(r):
+        return r['core'], r['width'], r['pattern']
+
+    reference = {key(r): r for r in baseline if 'error' not in r}
+    regressions = []
+    for r in results:
+        base = reference.get(key(r))
+        if base is None or 'error' in r:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            limit = wall_threshold if metric in WALL_METRICS else threshold
+            old, new = base[metric], r[metric]
+            change = (old - new if higher_is_better else new - old) / old if old else float(new != old)
+            if change > limit:
+                regressions.append("{:s} {:d} bits {:s}: {:s} {:.4g} -> {:.4g} ({:+.1%})".format(
+                    r['core'], r['width'], r['pattern'], metric, old, new, -change if higher_is_better else change))
+    return regressions
+
+
+def print_summary(results):
+    print("")
+    print("{:>13s}  {:>5s}  {:>12s}  {:>8s}  {:>7s}  {:>6s}  {:>10s}  {:>9s}".format(
+        "Core", "Width", "Pattern", "Tx/cycle", "Latency", "Stalls", "Cycles/s", "RSS [MB]"))
+    for r in results:
+        if 'error' in r:
+            print("{:>13s}  {:>5d}  {:>12s}  error: {:s}".format(r['core'], r['width'], r['pattern'], r['error']))
+            continue
+        print("{:>13s}  {:>5d}  {:>12s}  {:>8.3f}  {:>7d}  {:>6d}  {:>10.0f}  {:>9.1f}".format(
+            r['core'], r['width'], r['pattern'], r['tx_per_cycle'], r['latency'], r['stall_cycles'],
+            r['cycles_per_second'], r['peak_rss_kb'] / 1024))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Throughput and latency benchmark of the stream cores.")
+    parser.add_argument('--cores', nargs='+', choices=CORES, default=list(CORES))
+    parser.add_argument('-w', '--widths', type=int, nargs='+', default=DEFAULT_WIDTHS,
+                        help="widths of the cores (default: %(default)s)")
+    parser.add_argument('-p', '--patterns', nargs='+', choices=PATTERNS, default=list(PATTERNS),
+                        help="producer/consumer patterns ('delayed_b' only applies to the Adder)")
+    parser.add_argument('-n', '--transactions', type=int, default=1000,
+                        help="transactions of each run (default: %(default)s)")
+    parser.add_argument('-b', '--backend', choices=BACKENDS, default='cocotb')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="number of worker processes (default: one per core)")
+    parser.add_argument('--seed', type=int, default=1,
+                        help="seed of the random patterns, the same for every run so they can be compared "
+                             "(default: %(default)s)")
+    parser.add_argument('--build-dir', default='bench_build',
+                        help="directory for the builds of each run (default: %(default)s)")
+    parser.add_argument('-o', '--output', default='bench_results.json',
+                        help="JSON file where the results are written (default: %(default)s)")
+    parser.add_argument('--baseline', default=None,
+                        help="results of a previous run, the run fails if a metric is worse than in it")
+    parser.add_argument('--threshold', type=float, default=0.05,
+                        help="allowed relative degradation of the cycle metrics (default: %(default)s)")
+    parser.add_argument('--wall-threshold', type=float, default=0.3,
+                        help="allowed relative degradation of cycles/s and peak RSS (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    configs = [
+        {'core': core, 'width': width, 'pattern': pattern, 'backend': args.backend,
+         'transactions': args.transactions, 'seed': args.seed, 'build_dir': os.path.abspath(args.build_dir)}
+        for core in args.cores for width in args.widths for pattern in args.patterns
+        if core == 'adder' or pattern != 'delayed_b'
+    ]
+
+    with Pool(args.jobs, maxtasksperchild=1) as pool:      # A new process per run, so each peak RSS is its own
+        results = pool.map(run_config, configs)
+    print_summary(results)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print("")
+    print("Results written to " + args.output)
+
+    failed = [r for r in results if 'error' in r]
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold, args.wall_threshold)
+        print("")
+        print("{:d} regressions against {:s}".format(len(regressions), args.baseline))
+        for regression in regressions:
+            print("    " + regression)
+        failed += regressions
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
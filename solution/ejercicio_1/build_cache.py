@@ -0,0 +1,235 @@
+'''
+Build cache
+-----------
+
+nmigen_cocotb.run() generates the Verilog and compiles it with iverilog on every call. BuildCache keeps the
+generated Verilog and the compiled simulation image (the '.vvp' file) of each design in a directory named after a
+hash of:
+
+  - the elaborated design (its RTLIL, without the source location attributes),
+  - the port list,
+  - the waveform file (it is part of the compiled image),
+  - the toolchain versions (nMigen, cocotb and iverilog).
+
+Since the sources of a cached entry are never rewritten, cocotb-test finds the image up to date and skips the
+compile step. The least recently used entries are removed when the cache grows over its maximum size, except the
+ones being simulated: every run holds a shared lock on its entry until the simulation ends.
+
+On a miss, the RTLIL of the key is converted to Verilog, so the design is elaborated only once. The function of
+nMigen's Verilog backend that does it is not public, so with other versions than SUPPORTED_BACKENDS the design is
+converted again with verilog.convert().
+'''
+import fcntl
+import hashlib
+import importlib.metadata
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import cocotb
+import nmigen
+from nmigen.back import rtlil, verilog
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# nMigen versions whose Verilog backend is known to convert RTLIL text, see rtlil_converter()
+SUPPORTED_BACKENDS = {'nmigen': '0.3', 'amaranth': '0.3'}
+
+TIMESCALE = '`timescale 1ns/1ps\n'
+
+WAVES_MODULE = '''
+module cocotb_waves();
+initial begin
+    $dumpfile("{:s}");
+    $dumpvars(0, {:s});
+end
+endmodule
+'''
+
+
+def toolchain_version():
+    '''It returns a string with the versions of the tools involved in the build.'''
+    try:
+        iverilog = subprocess.run(['iverilog', '-V'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                  universal_newlines=True).stdout.splitlines()[0]
+    except (OSError, IndexError):
+        iverilog = 'iverilog not found'
+    return "nmigen {:s}; cocotb {:s}; {:s}".format(getattr(nmigen, '__version__', 'unknown'), cocotb.__version__, iverilog)
+
+
+def rtlil_converter():
+    '''
+    It returns the function of nMigen's Verilog backend that converts RTLIL text to Verilog, or None if the installed
+    version is not one of SUPPORTED_BACKENDS (the function is not part of the public API).
+    '''
+    module = sys.modules[verilog.convert.__module__]
+    package = module.__name__.split('.')[0]
+    try:
+        version = importlib.metadata.version(package)
+    except importlib.metadata.PackageNotFoundError:
+        return None
+    supported = SUPPORTED_BACKENDS.get(package)
+    if supported is None or not (version == supported or version.startswith(supported + '.')):
+        return None
+    return getattr(module, '_convert_rtlil_text', None)
+
+
+class BuildCache:
+    '''
+    Class Description
+    ------------------
+    Content-addressed cache of generated Verilog and compiled simulation images.
+
+    Parameters
+    ----------
+    root : str
+        Cache directory.
+
+    max_size : int
+        Maximum size of the cache, in bytes.
+
+    Attributes
+    ----------
+    hits, misses, evictions : int
+        Counters of this instance.
+    '''
+    def __init__(self, root, max_size=512 * 2**20):
+        self.root = os.path.abspath(root)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.last_build = None
+        self._toolchain = None
+        os.makedirs(self.root, exist_ok=True)
+
+    def key(self, design, ports, name='top', vcd_file=None, rtlil_text=None):
+        '''
+        It returns the hash that identifies the build of 'design'. 'rtlil_text' is its RTLIL without the source
+        location attributes, if it was already converted.
+        '''
+        if self._toolchain is None:
+            self._toolchain = toolchain_version()
+        if rtlil_text is None:
+            rtlil_text = rtlil.convert(design, name=name, ports=ports, emit_src=False)
+
+        h = hashlib.sha256()
+        for item in (rtlil_text, ','.join(port.name for port in ports), name, str(vcd_file), self._toolchain):
+            h.update(item.encode())
+            h.update(b'\0')
+        return h.hexdigest()
+
+    def run(self, design, module, ports, name='top', vcd_file=None, work_dir=None, extra_env=None):
+        '''
+        Function Description
+        ------------------
+        Same as nmigen_cocotb.run(), but reusing the cached build when it exists. Before simulating it stores in
+        'last_build' a dict with the key of the entry, whether it was a hit and the time spent building (the
+        simulation raises SystemExit if a test fails).
+
+        Parameters
+        ----------
+        design : Elaboratable
+            Design under test.
+
+        module : str
+            Name of the cocotb test module.
+
+        ports : list of Signal
+            Ports of the top level module.
+
+        vcd_file : str
+            If it is given, every signal is dumped to this file.
+
+        work_dir : str
+            Directory where the simulator is executed. By default, the cache entry.
+
+        '''
+        from cocotb_test.simulator import run
+
+        start = time.perf_counter()
+        rtlil_text = rtlil.convert(design, name=name, ports=ports, emit_src=False)
+        key = self.key(design, ports, name, vcd_file, rtlil_text)
+        entry = os.path.join(self.root, key[:16])
+        done_file = os.path.join(entry, 'done')
+        verilog_file = os.path.join(entry, 'design.v')
+        compile_args = ['-s', 'cocotb_waves'] if vcd_file else []
+
+        with open(entry + '.lock', 'w') as lock:
+            hit = True
+            fcntl.flock(lock, fcntl.LOCK_SH)                                    # Held until the simulation ends
+            while not os.path.isfile(done_file):
+                fcntl.flock(lock, fcntl.LOCK_EX)                                # Other workers may be building it
+                if not os.path.isfile(done_file):
+                    hit = False
+                    shutil.rmtree(entry, ignore_errors=True)
+                    os.makedirs(entry)
+                    convert = rtlil_converter()
+                    with open(verilog_file, 'w') as f:
+                        f.write(TIMESCALE)
+                        if convert is not None:
+                            f.write(convert(rtlil_text))
+                        else:
+                            f.write(verilog.convert(design, name=name, ports=ports))
+                        if vcd_file:
+                            f.write(WAVES_MODULE.format(os.path.abspath(vcd_file), name))
+                    run(toplevel=name, module=module, verilog_sources=[verilog_file], compile_args=compile_args,
+                        sim_build=entry, python_search=[HERE], compile_only=True)
+                    open(done_file, 'w').close()
+                fcntl.flock(lock, fcntl.LOCK_SH)        # Not atomic, evict() may remove the entry in between
+            os.utime(entry)                                                     # Used for the LRU eviction
+            build_time = time.perf_counter() - start
+
+            evictions = self.evictions
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+                self.evict()
+            self.last_build = {'key': key[:16], 'hit': hit, 'build_time': build_time,
+                               'evictions': self.evictions - evictions}
+
+            run(toplevel=name, module=module, verilog_sources=[verilog_file], compile_args=compile_args,
+                sim_build=entry, work_dir=work_dir, python_search=[HERE], extra_env=extra_env)
+        return self.last_build
+
+    def _entries(self):
+        # Other workers may be removing entries (see evict()), the ones that vanish are skipped
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                if not os.path.isdir(path):
+                    continue
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            size = 0
+            for directory, _, files in os.walk(path):
+                for filename in files:
+                    try:
+                        size += os.path.getsize(os.path.join(directory, filename))
+                    except OSError:
+                        pass
+            yield mtime, size, path
+
+    def evict(self):
+        '''
+        It removes the least recently used entries until the cache fits in 'max_size'. The entries in use (locked by
+        run()) are skipped.
+        '''
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            with open(path + '.lock', 'w') as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue                                                    # Being built or simulated
+                shutil.rmtree(path, ignore_errors=True)
+                fcntl.flock(lock, fcntl.LOCK_UN)
+            total -= size
+            self.evictions += 1
@@ -0,0 +1,137 @@
+'''
+Stream drivers
+--------------
+
+Coroutines that send and receive the beats of a Stream port of the design under test ('<prefix>data', '<prefix>valid'
+and '<prefix>ready'). They do not depend on nMigen, so the cocotb test modules can use them without importing it.
+Stream.Driver and Stream.FastDriver are the same classes.
+
+signal_reader() is the way the drivers and the monitors (functional_coverage.py, adder_model.py, transactions.py)
+read a signal as an int, once per cycle.
+'''
+from backend import PysimSignal, RisingEdge
+
+# Functions called with (driver, name) by every new driver, e.g. while a test is profiled (see profiling.py) or
+# recorded (see transactions.py). The drivers do not import those modules.
+DRIVER_HOOKS = []
+
+
+class UnresolvedValue(ValueError):
+    '''Raised when a signal that is read as an int has X or Z bits.'''
+
+
+def signal_reader(handle, name=None, unresolved=None):
+    '''
+    Function Description
+    ------------------
+    It returns a function that reads the current value of a signal as an int. With the cocotb backend the value is
+    read with the public 'handle.value', and UnresolvedValue is raised if it has X or Z bits (e.g. a register right
+    after power-up on iverilog, or an input that was never driven).
+
+    Parameters
+    ----------
+    handle :
+        cocotb handle (or PysimSignal) of the signal.
+
+    name : str
+        Name of the signal in the error messages.
+
+    unresolved : int
+        If it is given, it is returned instead of raising UnresolvedValue. The monitors read the 'valid' and
+        'ready' inputs with 0, since a test may not drive them until its stream starts.
+
+    '''
+    if isinstance(handle, PysimSignal):
+        return handle.read                              # The pysim values are always resolved
+
+    def read():
+        value = handle.value
+        if not value.is_resolvable:
+            if unresolved is not None:
+                return unresolved
+            raise UnresolvedValue("{:s} has X or Z bits: {:s}".format(name or 'signal', value.binstr))
+        return value.integer
+    return read
+
+
+class Driver:
+    def __init__(self, clk, dut, prefix):
+        self.clk = clk
+        self.data = getattr(dut, prefix + 'data')
+        self.valid = getattr(dut, prefix + 'valid')
+        self.ready = getattr(dut, prefix + 'ready')
+        for hook in DRIVER_HOOKS:
+            hook(self, prefix.rstrip('_'))
+
+    async def send(self, data):
+        self.valid <= 1
+        for d in data:
+            self.data <= d
+            await RisingEdge(self.clk)
+            while self.ready.value == 0:
+                await RisingEdge(self.clk)
+        self.valid <= 0
+
+    async def recv(self, count, sink=None):
+        # If a sink is given (e.g. Scoreboard.push), each value is handed to it instead of being stored
+        self.ready <= 1
+        data = []
+        for _ in range(count):
+            await RisingEdge(self.clk)
+            while self.valid.value == 0:
+                await RisingEdge(self.clk)
+            if sink is None:
+                data.append(self.data.value.integer)
+            else:
+                sink(self.data.value.integer)
+        self.ready <= 0
+        return data
+
+class FastDriver(Driver):
+    '''
+    Class Description
+    ------------------
+    Same interface and timing as Driver, but with less work per beat:
+
+      - The RisingEdge trigger is created once.
+      - The signals are read with signal_reader(), 'data' is only read when a beat is taken and an X or Z value is
+        reported with the name of the signal.
+      - recv() samples 'valid' and 'data' once per cycle, at the same edge.
+      - send() only writes 'data' when it changes.
+    '''
+    def __init__(self, clk, dut, prefix):
+        super().__init__(clk, dut, prefix)
+        self._edge = RisingEdge(clk)
+        self._read_data = signal_reader(self.data, prefix + 'data')
+        self._read_valid = signal_reader(self.valid, prefix + 'valid')
+        self._read_ready = signal_reader(self.ready, prefix + 'ready')
+
+    async def send(self, data):
+        edge = self._edge
+        ready = self._read_ready
+        last = None
+        self.valid <= 1
+        for d in data:
+            if d != last:
+                self.data <= d
+                last = d
+            await edge
+            while not ready():
+                await edge
+        self.valid <= 0
+
+    async def recv(self, count, sink=None):
+        edge = self._edge
+        valid = self._read_valid
+        read = self._read_data
+        self.ready <= 1
+        data = []
+        if sink is None:
+            sink = data.append
+        for _ in range(count):
+            await edge
+            while not valid():
+                await edge
+            sink(read())
+        self.ready <= 0
+        return data
@@ -0,0 +1,231 @@
+'''
+Formal verification
+-------------------
+
+Bounded model checking (BMC) and k-induction of the Stream handshakes of the Adder and the Incrementador, with
+SymbiYosys (sby), yosys-smtbmc and an SMT solver (yices by default). The properties are:
+
+  - Handshake rules of every Stream (see Stream.properties()): once 'valid' is high, it and 'data' are kept until
+    the beat is read. They are assumed for the inputs and asserted for the outputs.
+  - No lost or duplicated beats: the results pending to be read are the same as 'r_valid' (the core holds one).
+  - Correct result: while 'r_valid' is high, 'r_data' is the result of the last input beats read (the signed sum
+    for the Adder, the input plus one for the Incrementador). Both Adder inputs are read in the same cycle.
+
+The 'bmc' mode looks for a counterexample of up to 'depth' cycles from reset, and the 'prove' mode also runs
+k-induction, so the properties hold for any number of cycles. On a failure, the counterexample trace is written as
+a VCD file inside the build directory ('engine_0/trace.vcd').
+'''
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from nmigen import *
+from nmigen.asserts import Assert, Assume, Initial
+from nmigen.back import rtlil
+
+from adder import Adder
+from incrementador import Incrementador
+
+MODES = ('bmc', 'prove')
+
+SBY_TEMPLATE = """[options]
+mode {mode}
+depth {depth}
+
+[engines]
+smtbmc {solver}
+
+[script]
+read_ilang {name}.il
+prep -top top
+
+[files]
+{name}.il
+"""
+
+
+def check_results(m, fire, output, value):
+    '''
+    Function Description
+    ------------------
+    It adds to the module 'm' a reference of the results of a core with one output register: 'value' is the result
+    of the input beats read when 'fire' is high, and every one of them must be given once by the 'output' Stream.
+
+    '''
+    pending = Signal(2)                                     # Results computed and not read yet
+    expected = Signal.like(output.data)
+    m.d.sync += pending.eq(pending + fire - output.accepted())
+    with m.If(fire):
+        m.d.sync += expected.eq(value)
+
+    with m.If(~Initial()):
+        m.d.comb += Assert(pending == output.valid)
+        with m.If(output.valid):
+            m.d.comb += Assert(output.data == expected)
+
+
+class AdderSpec(Elaboratable):
+    '''
+    Module Description
+    ------------------
+    Formal harness of an N-bit Adder. Its inputs are free (the solver chooses them in every cycle) except for the
+    handshake rules of the a and b Streams, and the reset is only asserted in the first cycle.
+    '''
+    def __init__(self, N):
+        self.dut = Adder(N)
+
+    def ports(self):
+        dut = self.dut
+        return [dut.a.data, dut.a.valid, dut.b.data, dut.b.valid, dut.r.ready]
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.dut = dut = self.dut
+        comb = m.d.comb
+
+        comb += Assume(ResetSignal() == Initial())
+        dut.a.properties(m, assume=True)
+        dut.b.properties(m, assume=True)
+        dut.r.properties(m)
+
+        comb += Assert(dut.a.ready == dut.b.ready)              # Both summands are read together
+        check_results(m, dut.a.accepted() & dut.b.accepted(), dut.r, dut.a.data.as_signed() + dut.b.data.as_signed())
+        return m
+
+
+class IncrementadorSpec(Elaboratable):
+    '''
+    Module Description
+    ------------------
+    Formal harness of the Incrementador, like AdderSpec.
+    '''
+    def __init__(self, width):
+        self.dut = Incrementador(width)
+
+    def ports(self):
+        return [self.dut.a.data, self.dut.a.valid, self.dut.r.ready]
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.dut = dut = self.dut
+
+        m.d.comb += Assume(ResetSignal() == Initial())
+        dut.a.properties(m, assume=True)
+        dut.r.properties(m)
+
+        check_results(m, dut.a.accepted(), dut.r, dut.a.data + 1)
+        return m
+
+
+SPECS = {
+    'adder': AdderSpec,
+    'incrementador': IncrementadorSpec,
+}
+
+
+def run_formal(design, N, mode, depth, build_root, solver='yices'):
+    '''
+    Function Description
+    ------------------
+    Writes the RTLIL of the harness and the '.sby' file of a design, and runs SymbiYosys on them in
+    '<build_root>/<design>-<N>bit/<design>-<mode>'. It returns a dict with the result, the time and the
+    counterexample trace (if there is one).
+
+    Parameters
+    ----------
+    design : str
+        Key of SPECS.
+
+    N : int
+        Number of bits of the design.
+
+    mode : str
+        'bmc' or 'prove'.
+
+    depth : int
+        Number of cycles of the BMC (and of the induction, in 'prove' mode).
+
+    build_root : str
+        Directory where the build directories are created.
+
+    solver : str
+        SMT solver used by yosys-smtbmc ('yices', 'boolector', 'z3'...).
+
+    '''
+    build_dir = os.path.abspath(os.path.join(build_root, '{:s}-{:d}bit'.format(design, N)))
+    os.makedirs(build_dir, exist_ok=True)
+    name = '{:s}-{:s}'.format(design, mode)
+
+    spec = SPECS[design](N)
+    with open(os.path.join(build_dir, name + '.il'), 'w') as f:
+        f.write(rtlil.convert(spec, ports=spec.ports()))
+    with open(os.path.join(build_dir, name + '.sby'), 'w') as f:
+        f.write(SBY_TEMPLATE.format(mode=mode, depth=depth, solver=solver, name=name))
+
+    start = time.perf_counter()
+    # sby writes its work directory next to the '.sby' file, with the name of the file ('-f' replaces an old one)
+    process = subprocess.run(['sby', '-f', name + '.sby'], cwd=build_dir, stdout=subprocess.PIPE,
+                             stderr=subprocess.STDOUT, universal_newlines=True)
+    elapsed = time.perf_counter() - start
+
+    work_dir = os.path.join(build_dir, name)
+    trace = None
+    for trace_name in ('trace.vcd', 'trace_induct.vcd'):
+        path = os.path.join(work_dir, 'engine_0', trace_name)
+        if process.returncode != 0 and os.path.isfile(path):
+            trace = path
+            break
+
+    return {
+        'design': design,
+        'width': N,
+        'mode': mode,
+        'passed': process.returncode == 0,
+        'time': elapsed,
+        'trace': trace,
+        'work_dir': work_dir,
+        'log': process.stdout,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Proves the Stream handshakes of the cores with SymbiYosys.")
+    parser.add_argument('-d', '--designs', nargs='+', choices=SPECS, default=list(SPECS))
+    parser.add_argument('-w', '--widths', type=int, nargs='+', default=[4, 8, 16, 32],
+                        help="widths of the designs (default: %(default)s)")
+    parser.add_argument('-m', '--mode', choices=MODES, default='prove',
+                        help="bounded model checking only, or also k-induction (default: %(default)s)")
+    parser.add_argument('--depth', type=int, default=10, help="cycles of the BMC and induction (default: %(default)s)")
+    parser.add_argument('--solver', default='yices', help="SMT solver of yosys-smtbmc (default: %(default)s)")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help="number of parallel checks (default: %(default)s)")
+    parser.add_argument('--build-dir', default='formal_build', help="directory for the checks (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    if shutil.which('sby') is None:
+        print("SymbiYosys (sby) was not found, see https://symbiyosys.readthedocs.io/ to install it.")
+        return 2
+
+    results = []
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [pool.submit(run_formal, design, N, args.mode, args.depth, args.build_dir, args.solver)
+                   for design in args.designs for N in args.widths]
+        for future in as_completed(futures):
+            results.append(future.result())
+
+    print("{:<14s}  {:>5s}  {:<5s}  {:>6s}  {:>8s}".format("Design", "N", "Mode", "Result", "Time [s]"))
+    for r in sorted(results, key=lambda r: (r['design'], r['width'])):
+        print("{:<14s}  {:>5d}  {:<5s}  {:>6s}  {:>8.2f}".format(
+            r['design'], r['width'], r['mode'], 'PASS' if r['passed'] else 'FAIL', r['time']))
+        if not r['passed']:
+            print("    counterexample: " + (r['trace'] or "none, see the log in " + r['work_dir']))
+
+    return 0 if all(r['passed'] for r in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,247 @@
+'''
+Functional coverage
+-------------------
+
+Coverage of the Adder, collected by a monitor of its three Stream ports. The bins are:
+
+  - sign: sign quadrant of each pair of summands (++, +-, -+, --).
+  - overflow: whether the result needed bit N (it does not fit in N bits).
+  - boundary_a, boundary_b: summands equal to the minimum, -1, 0, 1 and the maximum N-bit values.
+  - stall_a, stall_b, stall_r: number of cycles that a beat waited with 'valid' high and 'ready' low.
+  - back_to_back: beats accepted in consecutive cycles on each port.
+
+The bins do not depend on N, so the coverage of several widths (and runs) can be merged. The counters are kept
+in a single preallocated array, and the monitor only reads the Stream signals once per cycle.
+'''
+import argparse
+import functools
+import json
+import os
+import sys
+from collections import deque
+
+import numpy as np      # Used external module! pip install numpy
+
+from backend import RisingEdge, fork
+from drivers import signal_reader
+
+STALL_BINS = ('0', '1', '2', '3-4', '5-8', '9+')
+STALL_LIMITS = (0, 1, 2, 4, 8)                          # Upper limit of every bin but the last one
+BOUNDARY_BINS = ('min', '-1', '0', '1', 'max')
+
+GROUPS = (
+    ('sign', ('++', '+-', '-+', '--')),
+    ('overflow', ('no', 'yes')),
+    ('boundary_a', BOUNDARY_BINS),
+    ('boundary_b', BOUNDARY_BINS),
+    ('stall_a', STALL_BINS),
+    ('stall_b', STALL_BINS),
+    ('stall_r', STALL_BINS),
+    ('back_to_back', ('a', 'b', 'r')),
+)
+
+
+def stall_bin(cycles):
+    '''It returns the index of the STALL_BINS bin of a stall of the given number of cycles.'''
+    for i, limit in enumerate(STALL_LIMITS):
+        if cycles <= limit:
+            return i
+    return len(STALL_LIMITS)
+
+
+class Coverage:
+    '''
+    Class Description
+    ------------------
+    Hit counters of every bin of GROUPS.
+
+    Attributes
+    ----------
+    counts : numpy.ndarray of int64
+        Counter of every bin, the bins of each group are at offset[group].
+
+    offset : dict
+        Index of the first bin of each group.
+    '''
+    def __init__(self):
+        self.offset = {}
+        size = 0
+        for group, bins in GROUPS:
+            self.offset[group] = size
+            size += len(bins)
+        self.counts = np.zeros(size, dtype=np.int64)
+
+    def __iadd__(self, other):
+        self.counts += other.counts
+        return self
+
+    def bins(self):
+        '''It yields (group, bin, count) for every bin.'''
+        for group, bins in GROUPS:
+            for i, name in enumerate(bins):
+                yield group, name, int(self.counts[self.offset[group] + i])
+
+    def missing(self, goal=1):
+        '''It returns the 'group:bin' names of the bins hit less than 'goal' times.'''
+        return ['{:s}:{:s}'.format(group, name) for group, name, count in self.bins() if count < goal]
+
+    def closed(self, goal=1):
+        return bool(np.all(self.counts >= goal))
+
+    def ratio(self, goal=1):
+        '''It returns the fraction of bins that were hit at least 'goal' times.'''
+        return float(np.count_nonzero(self.counts >= goal)) / self.counts.size
+
+    def report(self, goal=1):
+        lines = ["Functional coverage: {:.1%} of {:d} bins".format(self.ratio(goal), self.counts.size)]
+        for group, bins in GROUPS:
+            counts = self.counts[self.offset[group]:self.offset[group] + len(bins)]
+            lines.append("    {:<13s}".format(group) + "  ".join(
+                "{:s}={:d}{:s}".format(name, int(count), '' if count >= goal else '!') for name, count in zip(bins, counts)))
+        return '\n'.join(lines)
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({group: {name: count for g, name, count in self.bins() if g == group} for group, _ in GROUPS},
+                      f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        coverage = cls()
+        with open(path) as f:
+            data = json.load(f)
+        for group, bins in GROUPS:
+            for i, name in enumerate(bins):
+                coverage.counts[coverage.offset[group] + i] = data.get(group, {}).get(name, 0)
+        return coverage
+
+    @classmethod
+    def merge(cls, paths):
+        '''It returns the sum of the coverage files that exist.'''
+        total = cls()
+        for path in paths:
+            if os.path.isfile(path):
+                total += cls.load(path)
+        return total
+
+    @classmethod
+    def from_env(cls):
+        '''It returns the coverage stored in COVERAGE_FILE (if it exists), so a new run adds to it.'''
+        path = os.environ.get('COVERAGE_FILE')
+        if path and os.path.isfile(path):
+            return cls.load(path)
+        return cls()
+
+    def save_env(self):
+        path = os.environ.get('COVERAGE_FILE')
+        if path:
+            self.save(path)
+
+
+class CoverageMonitor:
+    '''
+    Class Description
+    ------------------
+    Coroutine that samples the a, b and r Streams of the Adder on every rising edge and counts the bins hit.
+
+    Parameters
+    ----------
+    dut :
+        Adder under test.
+
+    coverage : Coverage
+        Counters to be incremented. By default, new ones.
+    '''
+    def __init__(self, dut, coverage=None):
+        self.coverage = coverage if coverage is not None else Coverage()
+        self.width = len(dut.a__data)
+        self._edge = RisingEdge(dut.clk)
+        self._ports = [                                         # Handshakes read as 0 until they are driven
+            (signal_reader(getattr(dut, prefix + 'valid'), prefix + 'valid', unresolved=0),
+             signal_reader(getattr(dut, prefix + 'ready'), prefix + 'ready', unresolved=0),
+             signal_reader(getattr(dut, prefix + 'data'), prefix + 'data'))
+            for prefix in ('a__', 'b__', 'r__')
+        ]
+
+        N = self.width
+        self._boundary = {}                                     # Raw value -> bins (they overlap for small N)
+        for i, value in enumerate((-(1 << (N - 1)), -1, 0, 1, (1 << (N - 1)) - 1)):
+            self._boundary.setdefault(value & ((1 << N) - 1), []).append(i)
+
+    async def run(self):
+        counts = self.coverage.counts
+        offset = self.coverage.offset
+        N = self.width
+        sign = 1 << (N - 1)
+        r_min, r_max = -(1 << (N - 1)), (1 << (N - 1)) - 1
+        stall_offsets = [offset['stall_a'], offset['stall_b'], offset['stall_r']]
+        back_to_back = offset['back_to_back']
+        summands = (deque(), deque())                           # Summands accepted on a and b, not yet paired
+        stalls = [0, 0, 0]
+        accepted = [False, False, False]
+
+        while True:
+            await self._edge
+            for port, (valid, ready, data) in enumerate(self._ports):
+                if not valid():
+                    accepted[port] = False
+                    continue
+                if not ready():
+                    stalls[port] += 1
+                    accepted[port] = False
+                    continue
+
+                # Handshake
+                counts[stall_offsets[port] + stall_bin(stalls[port])] += 1
+                stalls[port] = 0
+                if accepted[port]:
+                    counts[back_to_back + port] += 1
+                accepted[port] = True
+
+                value = data()
+                if port < 2:
+                    for i in self._boundary.get(value, ()):
+                        counts[offset['boundary_a' if port == 0 else 'boundary_b'] + i] += 1
+                    summands[port].append(value & sign)
+                    if summands[0] and summands[1]:
+                        counts[offset['sign'] + 2 * bool(summands[0].popleft()) + bool(summands[1].popleft())] += 1
+                else:
+                    result = (value ^ (1 << N)) - (1 << N)      # N+1 bits signed
+                    counts[offset['overflow'] + int(not r_min <= result <= r_max)] += 1
+
+
+def covered(func):
+    '''
+    Function Description
+    ------------------
+    Decorator for the cocotb tests. If COVERAGE_FILE is set the coverage of the test is added to that file,
+    otherwise it does nothing (the test runs without any extra coroutine).
+
+    '''
+    @functools.wraps(func)
+    async def wrapper(dut):
+        if not os.environ.get('COVERAGE_FILE'):
+            return await func(dut)
+
+        monitor = CoverageMonitor(dut, Coverage.from_env())
+        fork(monitor.run())
+        try:
+            return await func(dut)
+        finally:
+            monitor.coverage.save_env()
+
+    return wrapper
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Merges coverage files of several runs and prints the result.")
+    parser.add_argument('files', nargs='+', help="coverage files (e.g. sweep_build/*/coverage.json)")
+    parser.add_argument('-o', '--output', default=None, help="file where the merged coverage is written")
+    parser.add_argument('--goal', type=int, default=1, help="hits needed by each bin (default: %(default)s)")
+    args = parser.parse_args()
+
+    coverage = Coverage.merge(args.files)
+    if args.output:
+        coverage.save(args.output)
+    print(coverage.report(args.goal))
+    sys.exit(0 if coverage.closed(args.goal) else 1)
@@ -0,0 +1,86 @@
+import os
+
+import cocotb
+from nmigen import *
+
+from backend import fork, init_test
+from scoreboard import Scoreboard, to_signed
+from stimulus import random_chunks, random_values, test_seed, values
+from stream import Stream
+
+
+class Incrementador(Elaboratable):
+    '''
+    Module Description
+    ------------------
+    Example core of the exercise, on the Stream of this solution so it can be simulated with the same drivers and
+    backends as the Adder. Its output is the input plus one. ej1/example.py runs it, with the burst test below.
+
+    Parameters
+    ----------
+    width : int
+        Number of bits of a_data/r_data.
+
+    Attributes
+    ----------
+    a : Stream(width), in
+        Input value.
+
+    r : Stream(width), out
+        Input value plus one (modulo 2**width).
+    '''
+    def __init__(self, width):
+        self.a = Stream(width, name='a')
+        self.r = Stream(width, name='r')
+
+    def elaborate(self, platform):
+        m = Module()
+        sync = m.d.sync
+        comb = m.d.comb
+
+        with m.If(self.r.accepted()):
+            sync += self.r.valid.eq(0)
+
+        with m.If(self.a.accepted()):
+            sync += [
+                self.r.valid.eq(1),
+                self.r.data.eq(self.a.data + 1)
+            ]
+        comb += self.a.ready.eq((~self.r.valid) | (self.r.accepted()))
+        return m
+
+
+@cocotb.test()
+async def burst(dut):
+    await init_test(dut)
+
+    stream_input = Stream.Driver(dut.clk, dut, 'a__')
+    stream_output = Stream.Driver(dut.clk, dut, 'r__')
+
+    N = int(os.environ.get('BURST_TRANSACTIONS', 100))
+    width = len(dut.a__data)
+    mask = int('1' * width, 2)
+    seed = test_seed()
+    dut._log.info("Burst of {:d} transactions, seed {:d} (set RANDOM_SEED to replay it)".format(N, seed))
+
+    data = random_values(width, N, seed)
+    expected = values(to_signed((d + 1) & mask, width) for d in random_chunks(width, N, seed))
+    scoreboard = Scoreboard(width, expected)
+    fork(stream_input.send(data))
+    await stream_output.recv(N, sink=scoreboard.push)
+    scoreboard.flush()
+    assert scoreboard.count == N
+
+
+if __name__ == '__main__':
+    from nmigen_cocotb import run
+
+    core = Incrementador(5)
+    run(
+        core, 'incrementador',
+        ports=
+        [
+            *list(core.a.fields.values()),
+            *list(core.r.fields.values())
+        ]
+    )
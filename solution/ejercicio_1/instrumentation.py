@@ -0,0 +1,53 @@
+'''
+Test instrumentation
+--------------------
+
+@instrumented adds to a cocotb test the instrumentation enabled by the environment:
+
+  - TRACE_DIR: waveform of the Streams (waveform.traced).
+  - COVERAGE_FILE: functional coverage (functional_coverage.covered).
+  - STREAM_PROFILE: profile of the drivers (profiling.profiled).
+  - TRANSACTION_LOG: log of the accepted beats (transactions.recorded).
+
+Each module is imported when a test starts and only if its variable is set, so the test modules do not pay for
+NumPy, pyvcd and the rest when they run without instrumentation (see startup.py).
+'''
+import functools
+import importlib
+import os
+
+# (variable, module, decorator), from the outermost decorator to the innermost one
+INSTRUMENTS = (
+    ('TRACE_DIR', 'waveform', 'traced'),
+    ('COVERAGE_FILE', 'functional_coverage', 'covered'),
+    ('STREAM_PROFILE', 'profiling', 'profiled'),
+    ('TRANSACTION_LOG', 'transactions', 'recorded'),
+)
+
+
+def instrumented(func=None, skip=()):
+    '''
+    Function Description
+    ------------------
+    Decorator for the cocotb tests. When the test starts, it is wrapped with the decorator of every instrument of
+    INSTRUMENTS whose variable is set, otherwise it runs as it is.
+
+    Parameters
+    ----------
+    skip : tuple of str
+        Variables of the instruments that are not applied to this test, e.g. 'COVERAGE_FILE' for a test that
+        collects the coverage itself.
+
+    '''
+    if func is None:
+        return functools.partial(instrumented, skip=skip)
+
+    @functools.wraps(func)
+    async def wrapper(dut):
+        test = func
+        for variable, module, decorator in reversed(INSTRUMENTS):
+            if variable not in skip and os.environ.get(variable):
+                test = getattr(importlib.import_module(module), decorator)(test)
+        return await test(dut)
+
+    return wrapper
@@ -0,0 +1,291 @@
+import argparse
+import os
+import sys
+from random import getrandbits, random
+
+import cocotb
+from nmigen import *
+
+from adder import InvalidArgument
+from backend import RisingEdge, fork, init_test
+from scoreboard import Scoreboard, to_signed
+from stream import SkidBuffer, Stream
+
+
+class PipelinedAdder(Elaboratable):
+    '''
+    Module Description
+    ------------------
+    Full throughput variant of the Adder. It has the same ports, but it accepts a new pair of summands every clock
+    cycle, even when 'r_ready' drops: the ready signals are registered by skid buffers and the sum can be split into
+    several pipeline stages (split-carry adder) for wide operands.
+
+                       |---------|   |-------------------------|   |---------|
+                a  --> |  skid   |-->|                         |   |         |
+                       |---------|   |  stage 0 -> ... -> S-1  |-->|  skid   |--> r
+                b  --> |  skid   |-->|   (W bits + carry each) |   |         |
+                       |---------|   |-------------------------|   |---------|
+
+    Each stage adds W = ceil((N+1)/S) bits of the sign-extended summands plus the carry of the previous stage.
+
+    Parameters
+    ----------
+    N : int
+        Number of bits of a_data/b_data.
+
+    stages : int
+        Number of pipeline stages of the adder.
+
+    skid_inputs : bool
+        Adds a skid buffer to each input port.
+
+    skid_output : bool
+        Adds a skid buffer to the output port.
+
+    Attributes
+    ----------
+    a, b : Stream(N), in
+        Summands.
+
+    r : Stream(N+1), out
+        Result of the sum.
+
+    latency : int
+        Cycles between the handshake of the summands and the result being available.
+    '''
+    def __init__(self, N, stages=1, skid_inputs=True, skid_output=True):
+
+        # Arguments Validation
+        if N < 1:
+            raise InvalidArgument("The argument 'N' should be a natural value greater than 1.")
+        if stages < 1 or stages > N + 1:
+            raise InvalidArgument("The argument 'stages' should be between 1 and N+1.")
+
+        self.N = N
+        self.stages = stages
+        self.skid_inputs = skid_inputs
+        self.skid_output = skid_output
+
+        # Ports Definition
+        self.a = Stream(N, name='a')
+        self.b = Stream(N, name='b')
+        self.r = Stream(N+1, name='r')
+
+    @property
+    def latency(self):
+        return self.stages + int(self.skid_inputs) + int(self.skid_output)
+
+    def elaborate(self, platform):
+        # Definitions
+        m = Module()
+        sync = m.d.sync
+        comb = m.d.comb
+        N = self.N
+        S = self.stages
+
+        # Input skid buffers
+        # ===================
+        if self.skid_inputs:
+            m.submodules.skid_a = skid_a = SkidBuffer(N, name='skid_a')
+            m.submodules.skid_b = skid_b = SkidBuffer(N, name='skid_b')
+            comb += [
+                skid_a.i.data.eq(self.a.data), skid_a.i.valid.eq(self.a.valid), self.a.ready.eq(skid_a.i.ready),
+                skid_b.i.data.eq(self.b.data), skid_b.i.valid.eq(self.b.valid), self.b.ready.eq(skid_b.i.ready),
+            ]
+            a, b = skid_a.o, skid_b.o
+        else:
+            a, b = self.a, self.b
+
+        # Output skid buffer
+        # ===================
+        if self.skid_output:
+            m.submodules.skid_r = skid_r = SkidBuffer(N+1, name='skid_r')
+            comb += [
+                self.r.data.eq(skid_r.o.data), self.r.valid.eq(skid_r.o.valid), skid_r.o.ready.eq(self.r.ready),
+            ]
+            out = skid_r.i
+        else:
+            out = self.r
+
+        # Pipeline
+        # ===================
+        # A stage is loaded when it is empty or when the next one is loaded in the same cycle
+        valid = [Signal(name='stage{:d}_valid'.format(k)) for k in range(S)]
+        enable = [Signal(name='stage{:d}_en'.format(k)) for k in range(S)]
+        for k in range(S - 1):
+            comb += enable[k].eq(~valid[k] | enable[k + 1])
+        comb += enable[S - 1].eq(~valid[S - 1] | out.ready)
+
+        # Both summands are consumed at the same time
+        fire = a.valid & b.valid & enable[0]
+        comb += [
+            a.ready.eq(b.valid & enable[0]),
+            b.ready.eq(a.valid & enable[0])
+        ]
+
+        a_ext = Signal(N+1)
+        b_ext = Signal(N+1)
+        comb += [
+            a_ext.eq(a.data.as_signed()),                           # Sign extension to N+1 bits
+            b_ext.eq(b.data.as_signed())
+        ]
+
+        W = -(-(N + 1) // S)
+        prev_valid, prev_a, prev_b, prev_sum, prev_carry = fire, a_ext, b_ext, Const(0, N+1), Const(0, 1)
+        for k in range(S):
+            lo, hi = min(k * W, N + 1), min((k + 1) * W, N + 1)
+            a_reg = Signal(N+1, name='stage{:d}_a'.format(k))
+            b_reg = Signal(N+1, name='stage{:d}_b'.format(k))
+            sum_reg = Signal(N+1, name='stage{:d}_sum'.format(k))
+            carry = Signal(name='stage{:d}_carry'.format(k))
+
+            with m.If(enable[k]):
+                sync += [
+                    valid[k].eq(prev_valid),
+                    a_reg.eq(prev_a),
+                    b_reg.eq(prev_b),
+                    sum_reg.eq(prev_sum),
+                ]
+                if hi > lo:
+                    partial = prev_a[lo:hi] + prev_b[lo:hi] + prev_carry
+                    sync += [
+                        sum_reg[lo:hi].eq(partial[:hi - lo]),
+                        carry.eq(partial[hi - lo])
+                    ]
+
+            prev_valid, prev_a, prev_b, prev_sum, prev_carry = valid[k], a_reg, b_reg, sum_reg, carry
+
+        comb += [
+            out.data.eq(prev_sum),
+            out.valid.eq(prev_valid)
+        ]
+
+        return m
+
+
+def expected_latency():
+    # Set by the __main__ block, the tests can also be run on their own
+    latency = os.environ.get('ADDER_LATENCY')
+    return int(latency) if latency else None
+
+
+@cocotb.test()
+async def throughput_test(dut):
+    '''
+    Test Description
+    ------------------
+    With both inputs always valid and 'r_ready' always high, the adder must give one result per cycle.
+    It also checks the latency between the first handshake on port A and the first result.
+    '''
+    # Definitions
+    stream_input_a = Stream.Driver(dut.clk, dut, 'a__')
+    stream_input_b = Stream.Driver(dut.clk, dut, 'b__')
+
+    M = 100
+    width = len(dut.a__data)
+
+    # Test Data
+    data_a = [getrandbits(width) for _ in range(M)]
+    data_b = [getrandbits(width) for _ in range(M)]
+    scoreboard = Scoreboard(width + 1, (x + y for x, y in zip(to_signed(data_a, width), to_signed(data_b, width))))
+
+    # Test Execution
+    await init_test(dut)
+    dut.r__ready <= 1
+    fork(stream_input_a.send(data_a))
+    fork(stream_input_b.send(data_b))
+
+    cycle = 0
+    first_input = None
+    output_cycles = []
+    while len(output_cycles) < M:
+        await RisingEdge(dut.clk)
+        cycle += 1
+        if first_input is None and dut.a__valid.value == 1 and dut.a__ready.value == 1:
+            first_input = cycle
+        if dut.r__valid.value == 1 and dut.r__ready.value == 1:
+            output_cycles.append(cycle)
+            scoreboard.push(dut.r__data.value.integer)
+    scoreboard.flush()
+
+    latency = output_cycles[0] - first_input
+    throughput = (M - 1) / (output_cycles[-1] - output_cycles[0])
+    dut._log.info("Latency: {:d} cycles, throughput: {:.3f} transactions/cycle".format(latency, throughput))
+
+    assert throughput == 1.0
+    if expected_latency() is not None:
+        assert latency == expected_latency()
+
+
+@cocotb.test()
+async def random_backpressure_test(dut):
+    '''
+    Test Description
+    ------------------
+    Random 'r_ready'. Every cycle in which the output is ready must carry a result, once the pipeline is full.
+    '''
+    # Definitions
+    stream_input_a = Stream.Driver(dut.clk, dut, 'a__')
+    stream_input_b = Stream.Driver(dut.clk, dut, 'b__')
+
+    M = 200
+    width = len(dut.a__data)
+
+    # Test Data
+    data_a = [getrandbits(width) for _ in range(M)]
+    data_b = [getrandbits(width) for _ in range(M)]
+    scoreboard = Scoreboard(width + 1, (x + y for x, y in zip(to_signed(data_a, width), to_signed(data_b, width))))
+
+    # Test Execution
+    await init_test(dut)
+    fork(stream_input_a.send(data_a))
+    fork(stream_input_b.send(data_b))
+
+    recved = 0
+    bubbles = 0
+    while recved < M:
+        dut.r__ready <= int(random() < 0.5)
+        await RisingEdge(dut.clk)
+        if dut.r__valid.value == 1 and dut.r__ready.value == 1:
+            scoreboard.push(dut.r__data.value.integer)
+            recved += 1
+        elif recved > 0 and dut.r__ready.value == 1:
+            bubbles += 1                                    # The consumer was ready but there was no result
+    dut.r__ready <= 0
+    scoreboard.flush()
+
+    assert bubbles == 0
+
+
+CONFIGS = [
+    # (N, stages, skid_inputs, skid_output)
+    (8, 1, False, False),
+    (8, 1, True, True),
+    (64, 2, True, True),
+    (128, 4, True, True),
+    (256, 4, True, True),
+]
+
+
+def pipelined_runs():
+    # Runs of the __main__ block, the expected latency of each configuration is given to the tests before it starts
+    for N, stages, skid_inputs, skid_output in CONFIGS:
+        core = PipelinedAdder(N, stages, skid_inputs, skid_output)
+        os.environ['ADDER_LATENCY'] = str(core.latency)
+        yield (core, [*core.a.fields.values(), *core.b.fields.values(), *core.r.fields.values()],
+               (N, stages, 'yes' if skid_inputs else 'no', 'yes' if skid_output else 'no', core.latency))
+
+
+if __name__ == '__main__':
+    from backend import BACKENDS, run_table
+
+    parser = argparse.ArgumentParser(description="Runs the PipelinedAdder tests for several configurations.")
+    parser.add_argument('-b', '--backend', choices=BACKENDS, default='cocotb')
+    args = parser.parse_args()
+
+    header = [
+        "{:>5s}  {:>6s}  {:>4s}  {:>4s}  {:>7s}  {:>6s}".format("N", "Stages", "Skid", "Skid", "Latency", "Result"),
+        "{:>5s}  {:>6s}  {:>4s}  {:>4s}  {:>7s}  {:>6s}".format("", "", "in", "out", "", ""),
+    ]
+    sys.exit(run_table(pipelined_runs(), sys.modules[__name__], args.backend, header,
+                       "{:>5d}  {:>6d}  {:>4s}  {:>4s}  {:>7d}  {:>6s}"))
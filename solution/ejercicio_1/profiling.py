@@ -0,0 +1,177 @@
+'''
+Stream.Driver profiling
+-----------------------
+
+Instrumentation of the send() and recv() coroutines of Stream.Driver (and of its subclasses). For every driver it
+counts:
+
+  - the beats sent and received,
+  - the cycles waiting on 'ready' (send) or on 'valid' (recv),
+  - the trigger awaits,
+  - the wall time running Python inside the coroutine, and the time it spent suspended (simulator and other
+    coroutines).
+
+It is enabled by the 'profiled' decorator when STREAM_PROFILE is set to a directory. A driver only checks it when
+it is created: when profiling is disabled its methods are not wrapped, so it costs nothing. At the end of each test
+'<test>.profile.txt' (report) and '<test>.folded' (folded stacks, for flamegraph.pl or speedscope) are written.
+'''
+import functools
+import os
+import time
+
+STATS = ('beats', 'wait_cycles', 'awaits', 'python_time', 'suspended_time', 'calls')
+
+
+class _Forward:
+    # It yields the trigger of the wrapped coroutine to the scheduler, and returns what the scheduler sends back
+    def __init__(self, trigger):
+        self.trigger = trigger
+
+    def __await__(self):
+        return (yield self.trigger)
+
+
+class Profile:
+    '''
+    Class Description
+    ------------------
+    Counters of the drivers created during a test, by (driver, method).
+
+    Parameters
+    ----------
+    name : str
+        Name of the test.
+
+    Attributes
+    ----------
+    current : Profile
+        Profile of the running test, None if profiling is disabled.
+    '''
+    current = None
+
+    def __init__(self, name):
+        self.name = name
+        self.stats = {}
+        self.start = time.perf_counter()
+        self.wall_time = None
+
+    def counters(self, driver, method):
+        key = (driver, method)
+        if key not in self.stats:
+            self.stats[key] = dict.fromkeys(STATS, 0)
+        return self.stats[key]
+
+    async def run(self, counters, coro):
+        '''It runs 'coro', measuring the time between its awaits and counting them.'''
+        counters['calls'] += 1
+        clock = time.perf_counter
+        value = None
+        error = None
+        while True:
+            start = clock()
+            try:
+                trigger = coro.throw(error) if error is not None else coro.send(value)
+            except StopIteration as e:
+                counters['python_time'] += clock() - start
+                return e.value
+            resumed = clock()
+            counters['python_time'] += resumed - start
+            counters['awaits'] += 1
+
+            value, error = None, None
+            try:
+                value = await _Forward(trigger)
+            except BaseException as e:              # e.g. the test was killed, it is thrown into the coroutine
+                error = e
+            counters['suspended_time'] += clock() - resumed
+
+    def instrument(self, driver, name):
+        '''It replaces the send() and recv() methods of 'driver' by instrumented ones.'''
+        send, recv = driver.send, driver.recv
+        sent = self.counters(name, 'send')
+        recved = self.counters(name, 'recv')
+
+        def counted(data):
+            for d in data:
+                sent['beats'] += 1
+                yield d
+
+        async def profiled_send(data, *args, **kwargs):
+            awaits = sent['awaits']
+            beats = sent['beats']
+            result = await self.run(sent, send(counted(data), *args, **kwargs))
+            sent['wait_cycles'] += (sent['awaits'] - awaits) - (sent['beats'] - beats)  # One await per beat
+            return result
+
+        async def profiled_recv(count, *args, **kwargs):
+            awaits = recved['awaits']
+            result = await self.run(recved, recv(count, *args, **kwargs))
+            recved['beats'] += count
+            recved['wait_cycles'] += (recved['awaits'] - awaits) - count
+            return result
+
+        driver.send = profiled_send
+        driver.recv = profiled_recv
+
+    def report(self):
+        lines = ["Stream.Driver profile of {:s}: {:.3f} s".format(self.name, self.wall_time)]
+        lines.append("    {:<12s} {:<5s} {:>8s} {:>11s} {:>8s} {:>10s} {:>13s}".format(
+            "Driver", "", "Beats", "Wait cycles", "Awaits", "Python [s]", "Suspended [s]"))
+        for (driver, method), c in sorted(self.stats.items()):
+            if c['calls']:
+                lines.append("    {:<12s} {:<5s} {:>8d} {:>11d} {:>8d} {:>10.4f} {:>13.4f}".format(
+                    driver, method, c['beats'], c['wait_cycles'], c['awaits'], c['python_time'], c['suspended_time']))
+        python = sum(c['python_time'] for c in self.stats.values())
+        lines.append("    Python inside the drivers: {:.4f} s ({:.1%} of the test)".format(
+            python, python / self.wall_time if self.wall_time else 0.0))
+        return '\n'.join(lines)
+
+    def folded(self):
+        '''It returns the profile as folded stacks ('frame;frame;frame microseconds' per line).'''
+        lines = []
+        python = 0.0
+        for (driver, method), c in sorted(self.stats.items()):
+            if c['calls']:
+                python += c['python_time']
+                lines.append("{:s};{:s}.{:s};python {:d}".format(
+                    self.name, driver, method, int(c['python_time'] * 1e6)))
+        # The rest of the test is the simulator and the test coroutine itself
+        lines.append("{:s};simulator+test {:d}".format(self.name, int(max(self.wall_time - python, 0.0) * 1e6)))
+        return '\n'.join(lines) + '\n'
+
+    def close(self, directory):
+        self.wall_time = time.perf_counter() - self.start
+        with open(os.path.join(directory, self.name + '.profile.txt'), 'w') as f:
+            f.write(self.report() + '\n')
+        with open(os.path.join(directory, self.name + '.folded'), 'w') as f:
+            f.write(self.folded())
+
+
+def profiled(func):
+    '''
+    Function Description
+    ------------------
+    Decorator for the cocotb tests. If STREAM_PROFILE is set, the drivers created by the test are instrumented and
+    their profile is written to that directory. Otherwise it does nothing.
+
+    '''
+    @functools.wraps(func)
+    async def wrapper(dut):
+        directory = os.environ.get('STREAM_PROFILE')
+        if not directory:
+            return await func(dut)
+
+        from drivers import DRIVER_HOOKS
+
+        os.makedirs(directory, exist_ok=True)
+        Profile.current = profile = Profile(func.__name__)
+        DRIVER_HOOKS.append(profile.instrument)
+        try:
+            return await func(dut)
+        finally:
+            DRIVER_HOOKS.remove(profile.instrument)
+            Profile.current = None
+            profile.close(directory)
+            dut._log.info(profile.report())
+
+    return wrapper
@@ -0,0 +1,180 @@
+from itertools import islice
+
+import numpy as np      # Used external module! pip install numpy
+
+
+def to_signed(values, width):
+    '''
+    Function Description
+    ------------------
+    Vectorized version of toCA2(). It takes an array of width-bit uints and outputs the width-bit signed ints.
+
+    Parameters
+    ----------
+    values : array_like of int
+        Target numbers.
+
+    width : int
+        Number of bits of each number.
+
+    '''
+    sign = 1 << (width - 1)
+    if width <= 63:
+        values = np.asarray(values, dtype=np.int64)
+    else:
+        values = np.asarray(values, dtype=object)  # int64 is not enough, we fall back to python ints
+    return (values ^ sign) - sign
+
+
+def pack_lanes(values, width):
+    '''
+    Function Description
+    ------------------
+    It packs rows of lanes into words, lane i at bits [i*width, (i+1)*width). Negative values are written in two's
+    complement. It returns an int64 array if the words fit in 63 bits, otherwise an array of python ints.
+
+    Parameters
+    ----------
+    values : array_like of int, shape (M, lanes)
+        Values of every lane of each word.
+
+    width : int
+        Number of bits of each lane.
+
+    '''
+    values = np.asarray(values)
+    lanes = values.shape[1]
+    dtype = np.int64 if lanes * width <= 63 else object
+    shifts = np.arange(lanes, dtype=dtype) * width
+    return ((values.astype(dtype) & ((1 << width) - 1)) << shifts).sum(axis=1, dtype=dtype)
+
+
+def unpack_lanes(words, lanes, width):
+    '''
+    Function Description
+    ------------------
+    Inverse of pack_lanes(). It returns the (unsigned) lanes of each word, as an array of shape (M, lanes).
+
+    Parameters
+    ----------
+    words : array_like of int
+        Packed words.
+
+    lanes : int
+        Number of lanes of each word.
+
+    width : int
+        Number of bits of each lane.
+
+    '''
+    dtype = np.int64 if lanes * width <= 63 else object
+    words = np.asarray(words, dtype=dtype)
+    shifts = np.arange(lanes, dtype=dtype) * width
+    return (words[:, None] >> shifts) & ((1 << width) - 1)
+
+
+class Scoreboard:
+    '''
+    Class Description
+    ------------------
+    Checks the raw values read from a Stream against the values yielded by an expected-value iterable.
+
+    Every beat is checked as soon as it arrives, so the test fails at the first bad beat. The expected values are
+    taken from the iterable and encoded as raw values (two's complement, packed lanes) 'batch' at a time with NumPy,
+    so the memory used does not depend on the number of transactions and each beat is a single comparison.
+
+    If 'lanes' is given each beat is a packed word (see pack_lanes()) and each expected value is a row with the value
+    of every lane, also with a single lane.
+
+    Parameters
+    ----------
+    width : int
+        Number of bits of the received data (of each lane).
+
+    expected : iterable of int
+        Expected signed values, in order. It can be a generator.
+
+    batch : int
+        Number of expected values encoded at once.
+
+    lanes : int
+        Number of lanes of each beat. None (default) for beats of a single value that are not packed.
+
+    signed : bool
+        If it is False the received values are compared as unsigned values.
+
+    Attributes
+    ----------
+    count : int
+        Number of beats already checked.
+    '''
+    def __init__(self, width, expected, batch=64, lanes=None, signed=True):
+        if batch < 1:
+            raise ValueError("The argument 'batch' should be greater than 0.")
+
+        self.width = width
+        self.batch = batch
+        self.lanes = lanes
+        self.packed = lanes is not None
+        self.signed = signed
+        self.count = 0
+
+        self._expected = iter(expected)
+        self._values = []                   # Expected values of the current batch, and their raw encoding
+        self._raw = []
+        self._next = 0
+
+    def _refill(self):
+        values = list(islice(self._expected, self.batch))
+        if self.packed:
+            expected = np.array(values, dtype=object).reshape(-1, self.lanes)
+            raw = pack_lanes(expected, self.width)
+            decoded = unpack_lanes(raw, self.lanes, self.width)
+        else:
+            expected = np.array(values, dtype=np.int64 if self.width <= 63 else object)
+            raw = decoded = expected & ((1 << self.width) - 1)
+        if self.signed:
+            decoded = to_signed(decoded, self.width)
+        wrong = decoded != expected                 # Values that do not fit in 'width' bits never match
+        if self.packed:
+            wrong = wrong.any(axis=1)
+        self._values = values
+        self._raw = np.where(wrong, -1, raw).tolist()
+        self._next = 0
+
+    def push(self, raw):
+        '''
+        It checks a raw (unsigned) value read from the Stream. It can be used as the 'sink' of Stream.Driver.recv().
+        '''
+        if self._next == len(self._raw):
+            self._refill()
+            if not self._raw:
+                raise AssertionError("Received {:d} values but only {:d} were expected.".format(
+                    self.count + 1, self.count))
+
+        i = self._next
+        if raw != self._raw[i]:
+            self.mismatch(raw, self._values[i])
+        self._next = i + 1
+        self.count += 1
+
+    def mismatch(self, raw, expected):
+        '''It raises the AssertionError of a beat that does not match its 'expected' value.'''
+        if self.packed:
+            recved = unpack_lanes([raw], self.lanes, self.width)[0]
+            if self.signed:
+                recved = to_signed(recved, self.width)
+            for lane, (got, value) in enumerate(zip(recved, expected)):
+                if int(got) != int(value):
+                    raise AssertionError("Mismatch at beat {:d}, lane {:d}: received {:d}, expected {:d}.".format(
+                        self.count, lane, int(got), int(value)))
+            raise AssertionError("Mismatch at beat {:d}.".format(self.count))
+        recved = int(to_signed(raw, self.width)) if self.signed else raw
+        raise AssertionError("Mismatch at beat {:d}: received {:d}, expected {:d}.".format(
+            self.count, recved, int(expected)))
+
+    def flush(self):
+        '''
+        Every beat is checked by push(), so there is nothing left to check. It is kept for the callers that close the
+        check at the end of a test.
+        '''
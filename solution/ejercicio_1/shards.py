@@ -0,0 +1,211 @@
+'''
+Sharded test runner
+-------------------
+
+sweep.py runs the whole suite of an Adder width in one simulator process, so the slowest test holds up the rest.
+This runner splits the work into shards of a single test (and a single seed, for the randomized tests), each one
+with its own simulator process and directory (sweep_build/adder-<N>bit/<test>[-seed<S>]).
+
+The shards are scheduled longest first, using the durations measured in earlier runs (durations.json), so the
+total time gets close to the one of the longest shard. The results of every shard are gathered into one JUnit
+file and one JSON file.
+'''
+import argparse
+import json
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from backend import BACKENDS
+from sweep import DEFAULT_WIDTHS, run_width
+
+# Tests whose stimulus depends on the seed, they get one shard per seed
+SEEDED_TESTS = ('burst_test', 'model_lockstep_test', 'coverage_closure_test')
+
+
+def test_names():
+    '''It returns the names of the cocotb tests of adder_tests.py, in declaration order.'''
+    import adder_tests
+    from backend import collect_tests
+    return [test._func.__name__ for test in collect_tests(adder_tests)]
+
+
+def make_shards(widths, tests, seeds):
+    '''
+    Function Description
+    ------------------
+    It returns one shard (width, test, seed) per test and width, and per seed for the SEEDED_TESTS.
+
+    Parameters
+    ----------
+    widths : list of int
+        Widths of the Adder.
+
+    tests : list of str
+        Names of the tests.
+
+    seeds : list of int
+        Seeds of the randomized tests. An empty list runs them with the seed of the environment.
+
+    '''
+    shards = []
+    for N in widths:
+        for test in tests:
+            for seed in (seeds if seeds and test in SEEDED_TESTS else [None]):
+                shards.append((N, test, seed))
+    return shards
+
+
+def shard_key(N, test):
+    # The duration of a shard does not depend much on its seed
+    return '{:d}:{:s}'.format(N, test)
+
+
+def schedule(shards, durations):
+    '''
+    It sorts the shards longest first (LPT), by their duration in 'durations'. The shards without a measure go
+    first, since they may be the longest ones.
+    '''
+    unknown = max(durations.values(), default=0.0)
+    return sorted(shards, key=lambda shard: durations.get(shard_key(shard[0], shard[1]), unknown + 1), reverse=True)
+
+
+def write_junit(results, path):
+    '''It writes the results of every shard as a JUnit file, with a testsuite per width.'''
+    suites = ET.Element('testsuites')
+    for N in sorted({r['width'] for r in results}):
+        shards = [r for r in results if r['width'] == N]
+        suite = ET.SubElement(suites, 'testsuite', name='adder-{:d}bit'.format(N), tests=str(len(shards)),
+                              failures=str(sum(not r['passed'] for r in shards)))
+        for r in shards:
+            name = r['testcase'] if r['seed'] is None else '{:s}[seed={:d}]'.format(r['testcase'], r['seed'])
+            tests = r['tests']
+            case = ET.SubElement(suite, 'testcase', classname='adder_tests', name=name, time='{:.3f}'.format(r['wall_time']),
+                                 sim_time_ns='{:.0f}'.format(sum(t['sim_time_ns'] for t in tests)))
+            if not r['passed']:
+                errors = [t.get('error') for t in tests if not t['passed'] and t.get('error')]
+                message = r['error'] or (errors[0] if errors else 'failed')
+                ET.SubElement(case, 'failure', message=message)
+    ET.ElementTree(suites).write(path, encoding='utf-8', xml_declaration=True)
+
+
+def run_shards(shards, jobs, build_root, backend='cocotb', cache=None, durations=None):
+    '''
+    Function Description
+    ------------------
+    Runs the shards in a process pool, longest first, and returns their results (see sweep.run_width()).
+
+    Parameters
+    ----------
+    shards : list of tuple
+        (width, test, seed) of every shard, see make_shards().
+
+    jobs : int
+        Number of worker processes.
+
+    build_root : str
+        Directory where the build directories are created.
+
+    backend : str
+        Simulation backend, see sweep.run_width().
+
+    cache : dict
+        Build cache configuration, see sweep.run_width(). The shards of a width share the compiled image.
+
+    durations : dict
+        Durations of earlier runs, by shard_key().
+
+    '''
+    results = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [
+            pool.submit(run_width, N, os.path.abspath(build_root), backend, None, cache, False, test, seed)
+            for N, test, seed in schedule(shards, durations or {})
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            print("Finished {:s} with {:d} bits{:s}: {:s}".format(
+                result['testcase'], result['width'], '' if result['seed'] is None else ', seed {:d}'.format(result['seed']),
+                'PASS' if result['passed'] else 'FAIL'))
+            results.append(result)
+
+    return sorted(results, key=lambda r: (r['width'], r['testcase'], r['seed'] or 0))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs the Adder tests sharded per test (and seed) in parallel.")
+    parser.add_argument('-w', '--widths', type=int, nargs='+', default=DEFAULT_WIDTHS,
+                        help="widths of the Adder to be tested (default: %(default)s)")
+    parser.add_argument('-t', '--tests', nargs='+', default=None,
+                        help="tests to be run (default: all the tests of adder_tests.py)")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help="number of worker processes (default: %(default)s)")
+    parser.add_argument('-s', '--seeds', type=int, nargs='+', default=[],
+                        help="seeds of the randomized tests ({:s}), one shard each".format(', '.join(SEEDED_TESTS)))
+    parser.add_argument('--build-dir', default='sweep_build',
+                        help="directory for the builds of each shard and the reports (default: %(default)s)")
+    parser.add_argument('-b', '--backend', choices=BACKENDS, default='cocotb')
+    parser.add_argument('--durations', default=None,
+                        help="durations of earlier runs used to balance the shards (default: <build-dir>/durations.json)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="always build with nmigen_cocotb.run()")
+    parser.add_argument('--cache-dir', default=None,
+                        help="build cache directory (default: <build-dir>/cache)")
+    parser.add_argument('--cache-size', type=int, default=512, metavar='MB',
+                        help="maximum size of the build cache (default: %(default)s MB)")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.build_dir, exist_ok=True)
+    durations_file = args.durations or os.path.join(args.build_dir, 'durations.json')
+    durations = {}
+    if os.path.isfile(durations_file):
+        with open(durations_file) as f:
+            durations = json.load(f)
+
+    cache = None
+    if not args.no_cache:
+        cache = {
+            'root': os.path.abspath(args.cache_dir or os.path.join(args.build_dir, 'cache')),
+            'max_size': args.cache_size * 2**20,
+        }
+
+    shards = make_shards(args.widths, args.tests or test_names(), args.seeds)
+    print("Running {:d} shards with {:d} workers.".format(len(shards), args.jobs))
+    start = time.perf_counter()
+    results = run_shards(shards, args.jobs, args.build_dir, args.backend, cache, durations)
+    wall_time = time.perf_counter() - start
+
+    # The durations of this run are used to balance the next one
+    measured = {}
+    for r in results:
+        key = shard_key(r['width'], r['testcase'])
+        measured[key] = max(r['wall_time'], measured.get(key, 0.0))
+    durations.update(measured)
+    with open(durations_file, 'w') as f:
+        json.dump(durations, f, indent=2, sort_keys=True)
+
+    junit_file = os.path.join(args.build_dir, 'results.xml')
+    json_file = os.path.join(args.build_dir, 'results.json')
+    write_junit(results, junit_file)
+    with open(json_file, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    failed = [r for r in results if not r['passed']]
+    longest = max(results, key=lambda r: r['wall_time'])
+    print("")
+    print("{:d} shards, {:d} failed".format(len(results), len(failed)))
+    for r in failed:
+        print("    failed: {:s} with {:d} bits{:s}{:s}".format(
+            r['testcase'], r['width'], '' if r['seed'] is None else ', seed {:d}'.format(r['seed']),
+            ': ' + r['error'] if r['error'] else ''))
+    print("Wall time: {:.2f} s, longest shard: {:.2f} s ({:s} with {:d} bits), sum of the shards: {:.2f} s".format(
+        wall_time, longest['wall_time'], longest['testcase'], longest['width'], sum(r['wall_time'] for r in results)))
+    print("Reports: {:s}, {:s}".format(junit_file, json_file))
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,288 @@
+import argparse
+import os
+import sys
+from random import random
+
+import cocotb
+import numpy as np      # Used external module! pip install numpy
+from nmigen import *
+
+from adder import InvalidArgument
+from backend import RisingEdge, fork, init_test
+from scoreboard import Scoreboard, pack_lanes
+from stimulus import random_chunks, test_seed
+from stream import Stream
+
+
+class LaneStream(Record):
+    '''
+    Stream of 'lanes' packed values of 'width' bits, with a 'mask' bit per lane that tells which lanes carry a value.
+    '''
+    def __init__(self, lanes, width, **kwargs):
+        Record.__init__(self, [('data', lanes * width), ('mask', lanes), ('valid', 1), ('ready', 1)], **kwargs)
+
+    def accepted(self):
+        return self.valid & self.ready
+
+    class Driver(Stream.Driver):
+        '''
+        Class Description
+        ------------------
+        Stream.Driver that also drives the lane mask. The lanes are packed with NumPy, a chunk of beats at a time
+        (see scoreboard.pack_lanes()).
+        '''
+        def __init__(self, clk, dut, prefix, lanes):
+            super().__init__(clk, dut, prefix)
+            self.mask = getattr(dut, prefix + 'mask')
+            self.lanes = lanes
+            self.width = len(self.data) // lanes
+
+        async def send(self, chunks):
+            '''
+            It sends the beats of 'chunks', an iterable of (values, masks) pairs of arrays of shape (M, lanes).
+            The values of the masked lanes are sent as they are.
+            '''
+            self.valid <= 1
+            for values, masks in chunks:
+                for d, m in zip(pack_lanes(values, self.width).tolist(), pack_lanes(masks, 1).tolist()):
+                    self.data <= d
+                    self.mask <= m
+                    await RisingEdge(self.clk)
+                    while self.ready.value == 0:
+                        await RisingEdge(self.clk)
+            self.valid <= 0
+
+
+class SimdAdder(Elaboratable):
+    '''
+    Module Description
+    ------------------
+    Multi-lane variant of the Adder: each beat carries 'lanes' packed N-bit summands and the result carries
+    'lanes' sign-extended (N+1)-bit sums, lane i at bits [i*(N+1), (i+1)*(N+1)). The handshake is the same as the
+    Adder's one.
+
+    A lane is only added if its mask bit is set on both inputs, the rest of the lanes of the result are 0 and their
+    mask bit is cleared.
+
+    Parameters
+    ----------
+    N : int
+        Number of bits of each lane of a_data/b_data.
+
+    lanes : int
+        Number of lanes.
+
+    Attributes
+    ----------
+    a, b : LaneStream(lanes, N), in
+        Summands.
+
+    r : LaneStream(lanes, N+1), out
+        Result of the sums.
+    '''
+    def __init__(self, N, lanes):
+
+        # Arguments Validation
+        if N < 1:
+            raise InvalidArgument("The argument 'N' should be a natural value greater than 1.")
+        if lanes < 1:
+            raise InvalidArgument("The argument 'lanes' should be a natural value greater than 1.")
+
+        self.N = N
+        self.lanes = lanes
+
+        # Ports Definition
+        self.a = LaneStream(lanes, N, name='a')
+        self.b = LaneStream(lanes, N, name='b')
+        self.r = LaneStream(lanes, N+1, name='r')
+
+    def elaborate(self, platform):
+        # Definitions
+        m = Module()
+        sync = m.d.sync
+        comb = m.d.comb
+        N = self.N
+
+        # Combinational logic
+        # ===================
+        comb += [
+            self.a.ready.eq(self.a.valid & self.b.valid & self.r.ready),
+            self.b.ready.eq(self.a.valid & self.b.valid & self.r.ready)
+        ]
+
+        # Sequential logic
+        # ===================
+        with m.If(self.a.valid & self.b.valid & self.r.ready):     # Both summands are read
+            sync += [
+                self.r.valid.eq(1),
+                self.r.mask.eq(self.a.mask & self.b.mask)
+            ]
+            for i in range(self.lanes):
+                a = self.a.data[i*N:(i+1)*N].as_signed()
+                b = self.b.data[i*N:(i+1)*N].as_signed()
+                lane = self.r.data[i*(N+1):(i+1)*(N+1)]
+                sync += lane.eq(Mux(self.a.mask[i] & self.b.mask[i], a + b, 0))
+
+        with m.Elif(self.r.accepted()):
+            sync += self.r.valid.eq(0)                  # The output was read and it is not longer available.
+
+        return m
+
+
+def lane_chunks(width, lanes, count, seed, stream, mask_probability=1.0, chunk=1024):
+    '''
+    Function Description
+    ------------------
+    Generator of (values, masks) arrays of shape (M, lanes) with random signed values, 'count' rows in total. Each
+    lane is enabled with probability 'mask_probability'. See stimulus.random_chunks().
+
+    '''
+    rng = np.random.default_rng([seed, stream, lanes])                  # Masks
+    for values in random_chunks(width, count * lanes, seed, stream, signed=True, chunk=chunk * lanes):
+        values = values.reshape(-1, lanes)
+        yield values, (rng.random(size=values.shape) < mask_probability).astype(np.int64)
+
+
+def expected_chunks(width, lanes, count, seed, mask_probability=1.0):
+    '''It yields the rows of the expected sums and masks, generated from the same seed as the summands.'''
+    chunks_a = lane_chunks(width, lanes, count, seed, 0, mask_probability)
+    chunks_b = lane_chunks(width, lanes, count, seed, 1, mask_probability)
+    for (values_a, masks_a), (values_b, masks_b) in zip(chunks_a, chunks_b):
+        masks = masks_a & masks_b
+        yield from zip((values_a + values_b) * masks, masks)
+
+
+@cocotb.test()
+async def lanes_burst_test(dut):
+    '''
+    Test Description
+    ------------------
+    Random summands and masks on every lane, with random 'r_ready' and port B delayed, like input_delay_test.
+    '''
+    # Definitions
+    lanes = len(dut.a__mask)
+    width = len(dut.a__data) // lanes
+    stream_input_a = LaneStream.Driver(dut.clk, dut, 'a__', lanes)
+    stream_input_b = LaneStream.Driver(dut.clk, dut, 'b__', lanes)
+
+    M = int(os.environ.get('BURST_TRANSACTIONS', 100))
+    seed = test_seed()
+    dut._log.info("Burst of {:d} transactions of {:d} lanes, seed {:d}".format(M, lanes, seed))
+
+    # Test Data
+    expected_sums = (sums for sums, _ in expected_chunks(width, lanes, M, seed, mask_probability=0.7))
+    expected_masks = (masks for _, masks in expected_chunks(width, lanes, M, seed, mask_probability=0.7))
+    scoreboard = Scoreboard(width + 1, expected_sums, lanes=lanes)
+    mask_scoreboard = Scoreboard(1, expected_masks, lanes=lanes, signed=False)
+
+    # Test Execution
+    await init_test(dut)
+    dut.b__valid <= 0
+    fork(stream_input_a.send(lane_chunks(width, lanes, M, seed, 0, mask_probability=0.7)))
+    for _ in range(10):                                     # We delay the port B input
+        await RisingEdge(dut.clk)
+    fork(stream_input_b.send(lane_chunks(width, lanes, M, seed, 1, mask_probability=0.7)))
+
+    recved = 0
+    while recved < M:
+        dut.r__ready <= int(random() < 0.5)
+        await RisingEdge(dut.clk)
+        if dut.r__valid.value == 1 and dut.r__ready.value == 1:
+            scoreboard.push(dut.r__data.value.integer)
+            mask_scoreboard.push(dut.r__mask.value.integer)
+            recved += 1
+    dut.r__ready <= 0
+    scoreboard.flush()
+    mask_scoreboard.flush()
+
+    assert scoreboard.count == M and mask_scoreboard.count == M
+
+
+@cocotb.test()
+async def lanes_throughput_test(dut):
+    '''
+    Test Description
+    ------------------
+    With every lane enabled, both inputs always valid and 'r_ready' always high, the adder must give one beat per
+    cycle, like the single-lane Adder, so the additions per cycle are equal to the number of lanes.
+    '''
+    # Definitions
+    lanes = len(dut.a__mask)
+    width = len(dut.a__data) // lanes
+    stream_input_a = LaneStream.Driver(dut.clk, dut, 'a__', lanes)
+    stream_input_b = LaneStream.Driver(dut.clk, dut, 'b__', lanes)
+
+    M = 100
+    seed = test_seed()
+
+    # Test Execution
+    await init_test(dut)
+    dut.r__ready <= 1
+    fork(stream_input_a.send(lane_chunks(width, lanes, M, seed, 0)))
+    fork(stream_input_b.send(lane_chunks(width, lanes, M, seed, 1)))
+
+    cycle = 0
+    additions = 0
+    output_cycles = []
+    while len(output_cycles) < M:
+        await RisingEdge(dut.clk)
+        cycle += 1
+        if dut.r__valid.value == 1 and dut.r__ready.value == 1:
+            output_cycles.append(cycle)
+            additions += bin(dut.r__mask.value.integer).count('1')
+
+    additions_per_cycle = (additions - lanes) / (output_cycles[-1] - output_cycles[0])
+    dut._log.info("{:d} lanes: {:.3f} additions/cycle".format(lanes, additions_per_cycle))
+
+    assert additions_per_cycle == lanes
+
+
+@cocotb.test()
+async def lanes_scoreboard_test(dut):
+    '''
+    Test Description
+    ------------------
+    The lane scoreboard of lanes_burst_test must accept the packed beats of its expected rows, also with a single
+    lane, and fail at the first beat with a wrong lane.
+    '''
+    # Definitions
+    lanes = len(dut.a__mask)
+    width = len(dut.a__data) // lanes
+    rows = [[-1] * lanes, [(-1) ** i * i for i in range(lanes)], [(1 << (width - 1)) - 1] * lanes]
+    beats = pack_lanes(rows, width + 1).tolist()
+
+    # Test Execution
+    await init_test(dut)
+    scoreboard = Scoreboard(width + 1, rows, lanes=lanes)
+    for beat in beats:
+        scoreboard.push(beat)
+    scoreboard.flush()
+    assert scoreboard.count == len(rows)
+
+    scoreboard = Scoreboard(width + 1, rows, lanes=lanes)
+    scoreboard.push(beats[0])
+    try:
+        scoreboard.push(beats[1] ^ (1 << ((lanes - 1) * (width + 1))))
+    except AssertionError as e:
+        assert "beat 1, lane {:d}".format(lanes - 1) in str(e), str(e)
+    else:
+        raise AssertionError("The wrong beat was accepted.")
+
+
+LANES = [1, 2, 4, 8]
+
+
+if __name__ == '__main__':
+    from backend import BACKENDS, run_table
+
+    parser = argparse.ArgumentParser(description="Runs the SimdAdder tests for several numbers of lanes.")
+    parser.add_argument('-b', '--backend', choices=BACKENDS, default='cocotb')
+    parser.add_argument('-N', '--width', type=int, default=8, help="bits of each lane (default: %(default)s)")
+    parser.add_argument('-l', '--lanes', type=int, nargs='+', default=LANES)
+    args = parser.parse_args()
+
+    cores = (SimdAdder(args.width, lanes) for lanes in args.lanes)
+    runs = ((core, [*core.a.fields.values(), *core.b.fields.values(), *core.r.fields.values()],
+             (core.lanes, args.width)) for core in cores)
+    header = ["{:>5s}  {:>5s}  {:>6s}".format("Lanes", "N", "Result")]
+    sys.exit(run_table(runs, sys.modules[__name__], args.backend, header, "{:>5d}  {:>5d}  {:>6s}"))
@@ -0,0 +1,240 @@
+'''
+Startup time
+------------
+
+Time from launching a simulation of the Adder to its first clock cycle. It is measured in fresh processes, since it
+is paid once per process (by every width of sweep.py and every shard of shards.py):
+
+  - import: import time of the test module (adder_tests.py) in a fresh interpreter, the median of several runs,
+    and the modules that take most of it (from 'python -X importtime').
+  - first cycle: a process is launched to run first_cycle_test on an N-bit Adder. It records the time until the
+    simulator imports the test module (interpreter start, elaboration and, with the cocotb backend, the Verilog
+    conversion and the iverilog compile), the import of the test module in the simulator and the time from there to
+    the first rising edge of the clock.
+
+The results are written to a JSON file. If a baseline (a previous results file) is given, every time is compared
+against it and the run fails if one of them is worse by more than the threshold.
+'''
+import time
+
+IMPORT_START = time.time()
+import adder_tests              # The module under measurement, before anything else of this module
+IMPORT_END = time.time()
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import cocotb
+
+from backend import BACKENDS, RisingEdge, start_clock
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Times compared against the baseline
+METRICS = ('import', 'startup', 'test_import', 'to_first_cycle', 'total')
+
+
+@cocotb.test()
+async def first_cycle_test(dut):
+    '''
+    Test Description
+    ------------------
+    It starts the clock and writes the times of the import of this module and of the first rising edge to
+    STARTUP_RESULTS.
+
+    '''
+    start_clock(dut.clk)
+    await RisingEdge(dut.clk)
+    first_cycle = time.time()
+
+    with open(os.environ['STARTUP_RESULTS'], 'w') as f:
+        json.dump({'import_start': IMPORT_START, 'import_end': IMPORT_END, 'first_cycle': first_cycle}, f)
+
+
+def import_time(module='adder_tests', repeat=5, top=8):
+    '''
+    Function Description
+    ------------------
+    It imports 'module' in 'repeat' fresh interpreters with '-X importtime'. It returns the median import time [s]
+    and the direct imports of the module that take most of it, as (name, time [s]) pairs of the median run.
+
+    '''
+    runs = []
+    for _ in range(repeat):
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module], cwd=HERE,
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True,
+                                 check=True)
+        entries = []                                            # (depth, name, cumulative [us]), children first
+        for line in process.stderr.splitlines():
+            fields = line.split('|')
+            if len(fields) != 3 or not fields[1].strip().isdigit():
+                continue
+            name = fields[2][1:]
+            entries.append(((len(name) - len(name.lstrip())) // 2, name.strip(), int(fields[1])))
+
+        index = max(i for i, (depth, name, _) in enumerate(entries) if depth == 0 and name == module)
+        children = []
+        for depth, name, cumulative in reversed(entries[:index]):
+            if depth == 0:
+                break
+            if depth == 1:
+                children.append((name, cumulative * 1e-6))
+        runs.append((entries[index][2] * 1e-6, sorted(children, key=lambda child: -child[1])[:top]))
+
+    runs.sort(key=lambda run: run[0])
+    total, children = runs[len(runs) // 2]
+    return total, children
+
+
+def first_cycle(N, backend, build_root):
+    '''
+    Function Description
+    ------------------
+    It launches a process that runs first_cycle_test on an N-bit Adder and returns its times [s]: 'startup' (until
+    the test module is imported), 'test_import', 'to_first_cycle' (from the import to the first rising edge) and
+    'total'.
+
+    '''
+    build_dir = os.path.abspath(os.path.join(build_root, 'adder-{:d}bit-{:s}'.format(N, backend)))
+    os.makedirs(build_dir, exist_ok=True)
+    results_file = os.path.join(build_dir, 'startup.json')
+    if os.path.exists(results_file):
+        os.remove(results_file)
+
+    env = dict(os.environ, STARTUP_RESULTS=results_file)
+    env.pop('TESTCASE', None)
+    start = time.time()
+    process = subprocess.run([sys.executable, os.path.join(HERE, 'startup.py'), '--run', str(N), '-b', backend],
+                             cwd=build_dir, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                             universal_newlines=True)
+
+    result = {'width': N, 'backend': backend}
+    if process.returncode != 0 or not os.path.isfile(results_file):
+        result['error'] = process.stdout.strip().splitlines()[-1] if process.stdout.strip() else "No results."
+        return result
+
+    with open(results_file) as f:
+        times = json.load(f)
+    result.update({
+        'startup': times['import_start'] - start,
+        'test_import': times['import_end'] - times['import_start'],
+        'to_first_cycle': times['first_cycle'] - times['import_end'],
+        'total': times['first_cycle'] - start,
+    })
+    return result
+
+
+def run_first_cycle(N, backend):
+    # Body of the process launched by first_cycle(), in its build directory
+    from adder import Adder
+
+    design = Adder(N)
+    ports = [port for stream in (design.a, design.b, design.r) for port in stream.fields.values()]
+    if backend == 'pysim':
+        from backend import run_pysim
+        tests = run_pysim(design, sys.modules[__name__], ports)
+        if not tests[0]['passed']:
+            raise RuntimeError(tests[0]['error'])
+    else:
+        from nmigen_cocotb import run
+        os.environ['PYTHONPATH'] = os.pathsep.join(filter(None, [HERE, os.environ.get('PYTHONPATH')]))
+        run(design, 'startup', ports=ports)
+
+
+def compare(results, baseline, threshold):
+    '''
+    Function Description
+    ------------------
+    It returns a list with a message for every time that is longer than in the baseline by more than the threshold
+    (relative). The runs that are not in the baseline are not compared.
+
+    '''
+    def runs(results):
+        yield ('import',), results['import']
+        for r in results['runs']:
+            if 'error' not in r:
+                yield (r['backend'], r['width']), r
+
+    reference = dict(runs(baseline))
+    regressions = []
+    for key, r in runs(results):
+        base = reference.get(key)
+        if base is None:
+            continue
+        for metric in METRICS:
+            if metric not in r or metric not in base:
+                continue
+            old, new = base[metric], r[metric]
+            change = (new - old) / old if old else float(new != old)
+            if change > threshold:
+                regressions.append("{:s}: {:s} {:.3f} s -> {:.3f} s ({:+.1%})".format(
+                    " ".join(str(k) for k in key), metric, old, new, change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import time and time to the first cycle of the Adder tests.")
+    parser.add_argument('-w', '--widths', type=int, nargs='+', default=[8, 64],
+                        help="widths of the Adder (default: %(default)s)")
+    parser.add_argument('-b', '--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help="imports measured, the median is taken (default: %(default)s)")
+    parser.add_argument('--build-dir', default='startup_build',
+                        help="directory for the builds of each run (default: %(default)s)")
+    parser.add_argument('-o', '--output', default='startup_results.json',
+                        help="JSON file where the results are written (default: %(default)s)")
+    parser.add_argument('--baseline', default=None,
+                        help="results of a previous run, the run fails if a time is longer than in it")
+    parser.add_argument('--threshold', type=float, default=0.3,
+                        help="allowed relative increase of the times (default: %(default)s)")
+    parser.add_argument('--run', type=int, default=None, help=argparse.SUPPRESS)     # Used by first_cycle()
+    args = parser.parse_args(argv)
+
+    if args.run is not None:
+        try:
+            run_first_cycle(args.run, args.backends[0])
+        except (Exception, SystemExit) as e:                                   # cocotb-test exits when a test fails
+            print(str(e) or type(e).__name__)                                  # The last line is the error
+            return 1
+        return 0
+
+    total, children = import_time(repeat=args.repeat)
+    print("Import of adder_tests: {:.1f} ms".format(total * 1e3))
+    for name, seconds in children:
+        print("    {:<24s} {:7.1f} ms".format(name, seconds * 1e3))
+
+    runs = [first_cycle(N, backend, args.build_dir) for backend in args.backends for N in args.widths]
+    print("")
+    print("{:>7s}  {:>5s}  {:>11s}  {:>11s}  {:>14s}  {:>9s}".format(
+        "Backend", "Width", "Startup [s]", "Import [ms]", "1st cycle [s]", "Total [s]"))
+    for r in runs:
+        if 'error' in r:
+            print("{:>7s}  {:>5d}  error: {:s}".format(r['backend'], r['width'], r['error']))
+            continue
+        print("{:>7s}  {:>5d}  {:>11.3f}  {:>11.1f}  {:>14.3f}  {:>9.3f}".format(
+            r['backend'], r['width'], r['startup'], r['test_import'] * 1e3, r['to_first_cycle'], r['total']))
+
+    results = {'import': {'import': total, 'modules': dict(children)}, 'runs': runs}
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print("")
+    print("Results written to " + args.output)
+
+    failed = [r for r in runs if 'error' in r]
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        print("")
+        print("{:d} regressions against {:s}".format(len(regressions), args.baseline))
+        for regression in regressions:
+            print("    " + regression)
+        failed += regressions
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+'''
+Lazy stimulus
+-------------
+
+Random test data produced in NumPy chunks, so a burst of any length uses the same memory. Stream.Driver.send()
+takes any iterable, so these generators can be given to it directly, and the expected values are generated in
+lockstep from the same seed (instead of storing the inputs).
+
+Every stream of a test is derived from the test seed and its own index, so the whole burst can be reproduced from
+the seed written in the log.
+'''
+import os
+import random
+
+import cocotb
+import numpy as np      # Used external module! pip install numpy
+
+from backend import RisingEdge
+from scoreboard import to_signed
+
+CHUNK = 1 << 16
+
+
+def test_seed():
+    '''It returns the seed of the stimulus: RANDOM_SEED if it is set, otherwise the cocotb one (or a new seed).'''
+    seed = os.environ.get('RANDOM_SEED')
+    if seed is not None:
+        return int(seed)
+    seed = getattr(cocotb, 'RANDOM_SEED', None)
+    return seed if seed is not None else random.getrandbits(32)
+
+
+def random_chunks(width, count, seed, stream=0, signed=False, chunk=CHUNK):
+    '''
+    Function Description
+    ------------------
+    Generator of arrays of random width-bit values, 'count' values in total. The arrays are int64 when width <= 63
+    and python ints (object) otherwise, like to_signed().
+
+    Parameters
+    ----------
+    width : int
+        Number of bits of each value.
+
+    count : int
+        Number of values.
+
+    seed : int
+        Seed of the test.
+
+    stream : int
+        Index of the stream, each index gives a different sequence for the same seed.
+
+    signed : bool
+        If it is True the values are between -2**(width-1) and 2**(width-1)-1, otherwise between 0 and 2**width-1.
+
+    chunk : int
+        Number of values generated at once.
+
+    '''
+    rng = np.random.default_rng([seed, stream])
+    remaining = count
+    while remaining > 0:
+        n = min(chunk, remaining)
+        remaining -= n
+        if width <= 63:
+            low = -(1 << (width - 1)) if signed else 0
+            yield rng.integers(low, low + (1 << width), size=n, dtype=np.int64)
+        else:
+            words = rng.integers(0, 1 << 32, size=(n, -(-width // 32)), dtype=np.uint64).astype(object)
+            values = sum(words[:, i] << (32 * i) for i in range(words.shape[1])) & ((1 << width) - 1)
+            yield to_signed(values, width) if signed else values
+
+
+def values(chunks):
+    '''It turns a generator of arrays into a generator of python ints.'''
+    for chunk in chunks:
+        yield from chunk.tolist()
+
+
+def random_values(width, count, seed, stream=0, signed=False, chunk=CHUNK):
+    '''Same as random_chunks(), but it yields python ints (e.g. for Stream.Driver.send()).'''
+    return values(random_chunks(width, count, seed, stream, signed, chunk))
+
+
+async def produce(dut, prefix, data, gap=0.0, delay=0):
+    '''
+    Function Description
+    ------------------
+    Sends 'data' through the input stream 'prefix', like Stream.Driver.send(), but it waits 'delay' cycles before
+    the first beat and it leaves 'valid' low for a random number of cycles before each beat.
+
+    '''
+    valid = getattr(dut, prefix + 'valid')
+    ready = getattr(dut, prefix + 'ready')
+    data_port = getattr(dut, prefix + 'data')
+
+    for _ in range(delay):
+        await RisingEdge(dut.clk)
+    for d in data:
+        while random.random() < gap:
+            valid <= 0
+            await RisingEdge(dut.clk)
+        valid <= 1
+        data_port <= d
+        await RisingEdge(dut.clk)
+        while ready.value == 0:
+            await RisingEdge(dut.clk)
+    valid <= 0
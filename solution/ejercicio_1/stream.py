@@ -0,0 +1,390 @@
+import argparse
+import os
+import sys
+from random import getrandbits, random
+
+import cocotb
+from nmigen import *
+from nmigen.asserts import Assert, Assume, Initial, Past, Stable
+from nmigen.lib.fifo import SyncFIFOBuffered
+
+from backend import RisingEdge, fork, init_test
+from drivers import Driver, FastDriver
+
+
+class Stream(Record):
+    def __init__(self, width, **kwargs):
+        Record.__init__(self, [('data', width), ('valid', 1), ('ready', 1)], **kwargs)
+
+    def accepted(self):
+        return self.valid & self.ready
+
+    def properties(self, m, assume=False):
+        '''
+        It adds the handshake rules of the stream to the module 'm', for formal verification (see formal.py): once
+        'valid' is high, it and 'data' must be kept until the beat is read. They are assumed if the stream is driven
+        by the environment (assume=True), and asserted if it is driven by the design.
+        '''
+        check = Assume if assume else Assert
+        with m.If(~Initial() & Past(self.valid) & ~Past(self.ready) & ~Past(ResetSignal())):
+            m.d.comb += [check(self.valid), check(Stable(self.data))]
+
+    Driver = Driver
+    FastDriver = FastDriver
+
+
+class SkidBuffer(Elaboratable):
+    '''
+    Module Description
+    ------------------
+    Register slice with a skid register. 'i_ready' only depends on a register, so the ready path from 'o' to 'i'
+    is not combinational, and it still sustains one beat per cycle. It adds one cycle of latency.
+
+    Parameters
+    ----------
+    width : int
+        Number of bits of the data.
+
+    Attributes
+    ----------
+    i : Stream(width), in
+        Input stream.
+
+    o : Stream(width), out
+        Output stream.
+    '''
+    def __init__(self, width, name='skid'):
+        self.i = Stream(width, name=name + '_i')
+        self.o = Stream(width, name=name + '_o')
+
+        self.skid_data = Signal(width)
+        self.skid_valid = Signal()
+
+    def elaborate(self, platform):
+        m = Module()
+        sync = m.d.sync
+        comb = m.d.comb
+
+        comb += self.i.ready.eq(~self.skid_valid)                  # Only listening while the skid register is empty
+
+        with m.If(self.o.ready | ~self.o.valid):                    # The output register can be loaded
+            with m.If(self.skid_valid):
+                sync += [
+                    self.o.data.eq(self.skid_data),
+                    self.o.valid.eq(1),
+                    self.skid_valid.eq(0)
+                ]
+            with m.Else():
+                sync += [
+                    self.o.data.eq(self.i.data),
+                    self.o.valid.eq(self.i.valid)
+                ]
+        with m.Elif(self.i.accepted()):                             # The output is stalled, we keep the beat aside
+            sync += [
+                self.skid_data.eq(self.i.data),
+                self.skid_valid.eq(1)
+            ]
+
+        return m
+
+
+def connect(source, sink):
+    '''It returns the statements that connect the Stream 'source' to the Stream 'sink'.'''
+    return [
+        sink.data.eq(source.data),
+        sink.valid.eq(source.valid),
+        source.ready.eq(sink.ready)
+    ]
+
+
+class StreamFifo(Elaboratable):
+    '''
+    Module Description
+    ------------------
+    Synchronous FIFO between two Streams. The output is registered (nMigen's SyncFIFOBuffered), so neither 'ready'
+    nor 'valid' go through it combinationally. With 'depth >= 3' it sustains one beat per cycle: the output
+    register takes one of the beats, and the inner FIFO does not accept a write when it is full, even if it is
+    read in the same cycle (so with 'depth == 2' it gives one beat every two cycles).
+
+    Parameters
+    ----------
+    width : int
+        Number of bits of the data.
+
+    depth : int
+        Number of beats it can store.
+
+    Attributes
+    ----------
+    i : Stream(width), in
+        Input stream.
+
+    o : Stream(width), out
+        Output stream.
+
+    level : Signal, out
+        Number of beats stored.
+    '''
+    def __init__(self, width, depth, name='fifo'):
+        if depth < 1:
+            raise ValueError("The argument 'depth' should be greater than 0.")
+
+        self.depth = depth
+        self.i = Stream(width, name=name + '_i')
+        self.o = Stream(width, name=name + '_o')
+        self.fifo = SyncFIFOBuffered(width=width, depth=depth)
+        self.level = self.fifo.level
+
+    def elaborate(self, platform):
+        m = Module()
+        comb = m.d.comb
+
+        m.submodules.fifo = fifo = self.fifo
+        comb += [
+            fifo.w_data.eq(self.i.data),
+            fifo.w_en.eq(self.i.valid),
+            self.i.ready.eq(fifo.w_rdy),
+
+            self.o.data.eq(fifo.r_data),
+            self.o.valid.eq(fifo.r_rdy),
+            fifo.r_en.eq(self.o.ready)
+        ]
+
+        return m
+
+
+class Join(Elaboratable):
+    '''
+    Module Description
+    ------------------
+    It joins several Streams into one: a beat is produced when every input is valid, and then all the inputs are
+    consumed at the same time (like the two summands of the Adder). The data of input k is placed after the data
+    of the inputs before it, as Cat() does. It is combinational; a SkidBuffer can be added at its output.
+
+    Parameters
+    ----------
+    widths : int
+        Number of bits of each input.
+
+    Attributes
+    ----------
+    i : list of Stream, in
+        Input streams, named '<name>_i0', '<name>_i1', ...
+
+    o : Stream(sum(widths)), out
+        Output stream.
+    '''
+    def __init__(self, *widths, name='join'):
+        if len(widths) < 1:
+            raise ValueError("At least one input is needed.")
+
+        self.i = [Stream(width, name='{:s}_i{:d}'.format(name, k)) for k, width in enumerate(widths)]
+        self.o = Stream(sum(widths), name=name + '_o')
+
+    def elaborate(self, platform):
+        m = Module()
+        comb = m.d.comb
+
+        all_valid = Cat(*(stream.valid for stream in self.i)).all()
+        comb += [
+            self.o.data.eq(Cat(*(stream.data for stream in self.i))),
+            self.o.valid.eq(all_valid)
+        ]
+        comb += [stream.ready.eq(all_valid & self.o.ready) for stream in self.i]
+
+        return m
+
+
+class Fork(Elaboratable):
+    '''
+    Module Description
+    ------------------
+    It copies a Stream to several outputs. Each output takes the beat as soon as it is ready (it does not wait
+    for the others), and the input beat is consumed once every output has taken it. With every output ready it
+    sustains one beat per cycle.
+
+    Parameters
+    ----------
+    width : int
+        Number of bits of the data.
+
+    n : int
+        Number of outputs.
+
+    Attributes
+    ----------
+    i : Stream(width), in
+        Input stream.
+
+    o : list of Stream(width), out
+        Output streams, named '<name>_o0', '<name>_o1', ...
+    '''
+    def __init__(self, width, n, name='fork'):
+        if n < 1:
+            raise ValueError("The argument 'n' should be greater than 0.")
+
+        self.i = Stream(width, name=name + '_i')
+        self.o = [Stream(width, name='{:s}_o{:d}'.format(name, k)) for k in range(n)]
+        self.done = Signal(n)                                       # Outputs that already took the current beat
+
+    def elaborate(self, platform):
+        m = Module()
+        sync = m.d.sync
+        comb = m.d.comb
+
+        taken = Cat(*(self.done[k] | stream.ready for k, stream in enumerate(self.o)))
+        comb += self.i.ready.eq(taken.all())
+        for k, stream in enumerate(self.o):
+            comb += [
+                stream.data.eq(self.i.data),
+                stream.valid.eq(self.i.valid & ~self.done[k])
+            ]
+
+        with m.If(self.i.accepted()):
+            sync += self.done.eq(0)
+        with m.Elif(self.i.valid):
+            sync += self.done.eq(taken)
+
+        return m
+
+
+class Pipeline(Elaboratable):
+    '''
+    Module Description
+    ------------------
+    It chains stages with a Stream input 'i' and a Stream output 'o' (SkidBuffer, StreamFifo, Pipeline...): the
+    output of each stage is connected to the input of the next one.
+
+    Parameters
+    ----------
+    stages : Elaboratable
+        Stages, from the input to the output.
+
+    Attributes
+    ----------
+    i : Stream, in
+        Input of the first stage.
+
+    o : Stream, out
+        Output of the last stage.
+    '''
+    def __init__(self, *stages, name='pipeline'):
+        if len(stages) < 1:
+            raise ValueError("At least one stage is needed.")
+
+        self.stages = stages
+        self.i = Stream(len(stages[0].i.data), name=name + '_i')
+        self.o = Stream(len(stages[-1].o.data), name=name + '_o')
+
+    def elaborate(self, platform):
+        m = Module()
+        comb = m.d.comb
+
+        for k, stage in enumerate(self.stages):
+            m.submodules['stage{:d}'.format(k)] = stage
+        comb += connect(self.i, self.stages[0].i)
+        for source, sink in zip(self.stages, self.stages[1:]):
+            comb += connect(source.o, sink.i)
+        comb += connect(self.stages[-1].o, self.o)
+
+        return m
+
+
+def stream_ports(dut):
+    '''It returns the ports of a stream component: the fields of its 'i' and 'o' Streams (or lists of them).'''
+    ports = []
+    for streams in (dut.i, dut.o):
+        for stream in (streams if isinstance(streams, list) else [streams]):
+            ports.extend(stream.fields.values())
+    return ports
+
+
+async def _stream_test(dut, input_gap, output_ready):
+    # The component is named 'dut', it has one or several inputs (dut_i, dut_i0, ...) and outputs (dut_o, dut_o0, ...)
+    from stimulus import produce
+
+    inputs = [p for p in ('dut_i__', 'dut_i0__', 'dut_i1__', 'dut_i2__') if hasattr(dut, p + 'data')]
+    outputs = [p for p in ('dut_o__', 'dut_o0__', 'dut_o1__', 'dut_o2__') if hasattr(dut, p + 'data')]
+    widths = [len(getattr(dut, p + 'data')) for p in inputs]
+
+    M = 200
+    data = [[getrandbits(width) for _ in range(M)] for width in widths]
+    expected = []                                                   # The inputs are joined, as Join does
+    for beat in zip(*data):
+        word, shift = 0, 0
+        for value, width in zip(beat, widths):
+            word |= value << shift
+            shift += width
+        expected.append(word)
+
+    await init_test(dut)
+    for p in outputs:
+        getattr(dut, p + 'ready') <= 0
+    for p, values in zip(inputs, data):
+        fork(produce(dut, p, values, gap=input_gap))
+
+    recved = {p: [] for p in outputs}
+    cycles = {p: [] for p in outputs}
+    cycle = 0
+    while any(len(values) < M for values in recved.values()):
+        for p in outputs:
+            getattr(dut, p + 'ready') <= int(random() < output_ready)
+        await RisingEdge(dut.clk)
+        cycle += 1
+        for p in outputs:
+            if getattr(dut, p + 'valid').value == 1 and getattr(dut, p + 'ready').value == 1:
+                recved[p].append(getattr(dut, p + 'data').value.integer)
+                cycles[p].append(cycle)
+        assert cycle < 20 * M, "The outputs stopped after {:d} cycles.".format(cycle)
+
+    for p in outputs:
+        assert recved[p] == expected, "Wrong data on " + p.rstrip('_')
+    return {p: (M - 1) / (cycles[p][-1] - cycles[p][0]) for p in outputs}
+
+
+@cocotb.test()
+async def stream_throughput_test(dut):
+    '''
+    Test Description
+    ------------------
+    With the inputs always valid and the outputs always ready, every output must give one beat per cycle.
+    '''
+    throughput = await _stream_test(dut, input_gap=0.0, output_ready=1.0)
+    dut._log.info("Throughput: " + ", ".join("{:s} {:.3f}".format(p.rstrip('_'), t) for p, t in throughput.items()))
+    assert all(t == 1.0 for t in throughput.values())
+
+
+@cocotb.test()
+async def stream_backpressure_test(dut):
+    '''
+    Test Description
+    ------------------
+    Random gaps on the inputs and random 'ready' on the outputs: no beat can be lost, duplicated or reordered.
+    '''
+    await _stream_test(dut, input_gap=0.3, output_ready=0.5)
+
+
+def components(width):
+    '''It returns the components tested by the __main__ block, with their names.'''
+    return [
+        ("SkidBuffer", SkidBuffer(width, name='dut')),
+        ("StreamFifo(3)", StreamFifo(width, 3, name='dut')),
+        ("StreamFifo(16)", StreamFifo(width, 16, name='dut')),
+        ("Join(2)", Join(width, width, name='dut')),
+        ("Fork(2)", Fork(width, 2, name='dut')),
+        ("Pipeline", Pipeline(SkidBuffer(width, name='s0'), StreamFifo(width, 4, name='s1'),
+                              SkidBuffer(width, name='s2'), name='dut')),
+    ]
+
+
+if __name__ == '__main__':
+    from backend import BACKENDS, run_table
+
+    parser = argparse.ArgumentParser(description="Runs the throughput tests of the stream components.")
+    parser.add_argument('-b', '--backend', choices=BACKENDS, default='cocotb')
+    parser.add_argument('-N', '--width', type=int, default=8, help="bits of the data (default: %(default)s)")
+    args = parser.parse_args()
+
+    runs = ((core, stream_ports(core), (name,)) for name, core in components(args.width))
+    sys.exit(run_table(runs, sys.modules[__name__], args.backend, ["{:<15s}  {:>6s}".format("Component", "Result")],
+                       "{:<15s}  {:>6s}"))
@@ -0,0 +1,324 @@
+import argparse
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from backend import BACKENDS
+from waveform import FORMATS
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_WIDTHS = [4, 8, 16, 32]
+
+
+def parse_results(results_file):
+    '''
+    Function Description
+    ------------------
+    It reads the JUnit file written by cocotb and returns one dict per test with its name, result and times.
+
+    Parameters
+    ----------
+    results_file : str
+        Path to the 'results.xml' file.
+
+    '''
+    tests = []
+    if not os.path.isfile(results_file):
+        return tests
+
+    for testcase in ET.parse(results_file).iter('testcase'):
+        failed = testcase.find('failure') is not None or testcase.find('error') is not None
+        tests.append({
+            'name': testcase.get('name'),
+            'passed': not failed,
+            'wall_time': float(testcase.get('time', 0)),
+            'sim_time_ns': float(testcase.get('sim_time_ns', 0)),
+        })
+    return tests
+
+
+def run_width(N, build_root, backend='cocotb', trace=None, cache=None, coverage=False, testcase=None, seed=None):
+    '''
+    Function Description
+    ------------------
+    Runs the whole cocotb suite of 'adder_tests' for an N-bit Adder. It is meant to be executed inside a worker process,
+    so every width gets its own working directory, results file and VCD file.
+
+    Parameters
+    ----------
+    N : int
+        Number of bits of the Adder.
+
+    build_root : str
+        Directory where the 'adder-<N>bit' build directories are created.
+
+    backend : str
+        'cocotb' (iverilog) or 'pysim' (nMigen's Python simulator, in-process).
+
+    trace : dict
+        TRACE_* variables for waveform.traced (see waveform.py), plus 'full' to dump every signal from the
+        simulator (cocotb backend only). None disables the waveforms.
+
+    cache : dict
+        Arguments of build_cache.BuildCache (cocotb backend only). None builds the design with nmigen_cocotb.run().
+
+    coverage : bool
+        Collects the functional coverage of every test into 'coverage.json' (see functional_coverage.py).
+
+    testcase : str
+        Only runs this test (cocotb's TESTCASE), in the 'adder-<N>bit/<testcase>' directory.
+
+    seed : int
+        Seed of the random tests (RANDOM_SEED). By default, the one of the environment.
+
+    The pool workers are reused, so the environment, working directory and sys.path of the worker are restored
+    when it returns.
+
+    '''
+    environ, cwd, path = dict(os.environ), os.getcwd(), list(sys.path)
+    try:
+        return _run_width(N, build_root, backend, trace, cache, coverage, testcase, seed)
+    finally:
+        os.environ.clear()
+        os.environ.update(environ)
+        os.chdir(cwd)
+        sys.path[:] = path
+
+
+def _run_width(N, build_root, backend, trace, cache, coverage, testcase, seed):
+    # Body of run_width(), it changes the environment and working directory of the process
+    build_dir = os.path.abspath(os.path.join(build_root, 'adder-{:d}bit'.format(N)))
+    if testcase is not None:
+        build_dir = os.path.join(build_dir, testcase if seed is None else '{:s}-seed{:d}'.format(testcase, seed))
+    os.makedirs(build_dir, exist_ok=True)
+
+    results_file = os.path.join(build_dir, 'results.xml')
+    if os.path.exists(results_file):
+        os.remove(results_file)                                                 # We don't want to report a previous run
+
+    # The simulator is launched from the build directory, so it has to find the test module through PYTHONPATH
+    os.environ['COCOTB_RESULTS_FILE'] = results_file
+    os.environ['PYTHONPATH'] = os.pathsep.join(filter(None, [HERE, os.environ.get('PYTHONPATH')]))
+    if HERE not in sys.path:
+        sys.path.insert(0, HERE)
+    os.chdir(build_dir)
+
+    trace = dict(trace or {})
+    vcd_file = os.path.join(build_dir, 'adder-{:d}bit.vcd') if trace.pop('full', False) else None
+    for key in ('TRACE_DIR', 'TRACE_SIGNALS', 'TRACE_WINDOW', 'TRACE_LAST', 'TRACE_FORMAT'):
+        os.environ.pop(key, None)
+    if trace:
+        os.environ['TRACE_DIR'] = build_dir
+        os.environ.update((key, str(value)) for key, value in trace.items() if value is not None)
+
+    os.environ.pop('TESTCASE', None)
+    if testcase is not None:
+        os.environ['TESTCASE'] = testcase
+    if seed is not None:
+        os.environ['RANDOM_SEED'] = str(seed)
+
+    coverage_file = os.path.join(build_dir, 'coverage.json')
+    if os.path.exists(coverage_file):
+        os.remove(coverage_file)
+    os.environ.pop('COVERAGE_FILE', None)
+    if coverage:
+        os.environ['COVERAGE_FILE'] = coverage_file
+
+    import adder_tests
+    from adder import Adder
+
+    myAdder = Adder(N)
+    ports = [
+        *list(myAdder.a.fields.values()),
+        *list(myAdder.b.fields.values()),
+        *list(myAdder.r.fields.values())
+    ]
+    error = None
+    build = None
+    start = time.perf_counter()
+    if backend == 'pysim':
+        from backend import run_pysim
+        tests = run_pysim(myAdder, adder_tests, ports, tests=None if testcase is None else [testcase])
+    else:
+        if cache is not None:
+            from build_cache import BuildCache
+            build_cache = BuildCache(**cache)
+        try:
+            if cache is not None:
+                build_cache.run(myAdder, 'adder_tests', ports, vcd_file=vcd_file, work_dir=build_dir)
+            else:
+                from nmigen_cocotb import run
+                run(myAdder, 'adder_tests', ports=ports, vcd_file=vcd_file)
+        except (Exception, SystemExit) as e:                                   # cocotb-test exits when a test fails
+            error = str(e) or type(e).__name__
+        if cache is not None:
+            build = build_cache.last_build
+        tests = parse_results(results_file)
+    wall_time = time.perf_counter() - start
+
+    return {
+        'width': N,
+        'testcase': testcase,
+        'seed': seed,
+        'backend': backend,
+        'build': build,
+        'passed': error is None and len(tests) > 0 and all(t['passed'] for t in tests),
+        'wall_time': wall_time,
+        'tests': tests,
+        'error': error,
+        'coverage': coverage_file if coverage else None,
+    }
+
+
+def sweep(widths, jobs=None, build_root='sweep_build', backend='cocotb', trace=None, cache=None, coverage=False):
+    '''
+    Function Description
+    ------------------
+    Runs one simulation per width in a process pool and returns the per-width results sorted by width.
+
+    Parameters
+    ----------
+    widths : list of int
+        Widths of the Adder to be tested.
+
+    jobs : int
+        Number of worker processes. By default it uses one per width (limited by the number of cores).
+
+    build_root : str
+        Directory where the build directories are created.
+
+    backend : str
+        Simulation backend, see run_width().
+
+    trace : dict
+        Waveform configuration, see run_width().
+
+    cache : dict
+        Build cache configuration, see run_width().
+
+    coverage : bool
+        Functional coverage collection, see run_width().
+
+    '''
+    if jobs is None:
+        jobs = min(len(widths), os.cpu_count() or 1)
+
+    results = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(run_width, N, os.path.abspath(build_root), backend, trace, cache, coverage): N
+                   for N in widths}
+        for future in as_completed(futures):
+            result = future.result()
+            print("Finished tests with {:d} bits: {:s}".format(result['width'], 'PASS' if result['passed'] else 'FAIL'))
+            results.append(result)
+
+    return sorted(results, key=lambda r: r['width'])
+
+
+def print_summary(results, wall_time):
+    print("")
+    print("{:>6s}  {:>7s}  {:>6s}  {:>7s}  {:>12s}  {:>10s}".format(
+        "Width", "Backend", "Result", "Tests", "Sim [ns]", "Wall [s]"))
+    for r in results:
+        passed = sum(t['passed'] for t in r['tests'])
+        print("{:>6d}  {:>7s}  {:>6s}  {:>7s}  {:>12.0f}  {:>10.2f}".format(
+            r['width'], r['backend'], 'PASS' if r['passed'] else 'FAIL', "{:d}/{:d}".format(passed, len(r['tests'])),
+            sum(t['sim_time_ns'] for t in r['tests']), r['wall_time']))
+        for t in r['tests']:
+            if not t['passed']:
+                print("        failed: " + t['name'] + (": " + t['error'] if t.get('error') else ""))
+        if r['error'] is not None:
+            print("        error: " + r['error'])
+
+    builds = [r['build'] for r in results if r['build'] is not None]
+    if builds:
+        hits = sum(b['hit'] for b in builds)
+        print("")
+        print("Build cache: {:d} hits, {:d} misses, {:d} evictions, {:.2f} s building".format(
+            hits, len(builds) - hits, sum(b['evictions'] for b in builds), sum(b['build_time'] for b in builds)))
+
+    print("")
+    print("Sweep wall time: {:.2f} s (sum of the runs: {:.2f} s)".format(wall_time, sum(r['wall_time'] for r in results)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs the Adder test suite for several widths in parallel.")
+    parser.add_argument('-w', '--widths', type=int, nargs='+', default=DEFAULT_WIDTHS,
+                        help="widths of the Adder to be tested (default: %(default)s)")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="number of worker processes (default: one per width)")
+    parser.add_argument('--build-dir', default='sweep_build',
+                        help="directory for the per-width builds and VCD files (default: %(default)s)")
+    parser.add_argument('-b', '--backend', choices=BACKENDS, default='cocotb',
+                        help="'cocotb' simulates the Verilog with iverilog, 'pysim' uses nMigen's simulator in-process "
+                             "(default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="seed of the random tests, to replay a failing run")
+    parser.add_argument('--coverage', action='store_true',
+                        help="collect the functional coverage of every test, merged into <build-dir>/coverage.json")
+
+    builds = parser.add_argument_group("build cache", "Generated Verilog and compiled images are reused while the "
+                                                       "design, its ports and the toolchain do not change.")
+    builds.add_argument('--no-cache', action='store_true',
+                        help="always build with nmigen_cocotb.run()")
+    builds.add_argument('--cache-dir', default=None,
+                        help="cache directory (default: <build-dir>/cache)")
+    builds.add_argument('--cache-size', type=int, default=512, metavar='MB',
+                        help="maximum size of the cache (default: %(default)s MB)")
+
+    waves = parser.add_argument_group("waveforms", "By default no waveform is written.")
+    waves.add_argument('--trace', action='store_true',
+                       help="record the Stream ports of every test into the build directory")
+    waves.add_argument('--trace-signals', nargs='+', metavar='SIGNAL',
+                       help="Stream prefixes (a b r) or port names (r__data) to be recorded (default: all the streams)")
+    waves.add_argument('--trace-window', metavar='START:END',
+                       help="only record the cycles between START and END")
+    waves.add_argument('--trace-last', type=int, metavar='K',
+                       help="keep the last K cycles and write them only if the test fails")
+    waves.add_argument('--trace-format', choices=FORMATS, default='vcd',
+                       help="waveform format (default: %(default)s)")
+    waves.add_argument('--trace-full', action='store_true',
+                       help="dump every signal of the design from the simulator, as adder-<N>bit.vcd (cocotb backend)")
+    args = parser.parse_args(argv)
+
+    if args.seed is not None:
+        os.environ['RANDOM_SEED'] = str(args.seed)
+
+    trace = {}
+    if args.trace or args.trace_signals or args.trace_window or args.trace_last:
+        trace = {
+            'TRACE_SIGNALS': ','.join(args.trace_signals) if args.trace_signals else None,
+            'TRACE_WINDOW': args.trace_window,
+            'TRACE_LAST': args.trace_last,
+            'TRACE_FORMAT': args.trace_format,
+        }
+    if args.trace_full:
+        trace['full'] = True
+
+    cache = None
+    if not args.no_cache:
+        cache = {
+            'root': os.path.abspath(args.cache_dir or os.path.join(args.build_dir, 'cache')),
+            'max_size': args.cache_size * 2**20,
+        }
+
+    print("Running tests with " + ", ".join(str(N) for N in args.widths) + " bits.")
+    start = time.perf_counter()
+    results = sweep(args.widths, args.jobs, args.build_dir, args.backend, trace, cache, args.coverage)
+    print_summary(results, time.perf_counter() - start)
+
+    if args.coverage:
+        from functional_coverage import Coverage
+        coverage = Coverage.merge(r['coverage'] for r in results)
+        coverage.save(os.path.join(args.build_dir, 'coverage.json'))
+        print("")
+        print(coverage.report())
+
+    return 0 if all(r['passed'] for r in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
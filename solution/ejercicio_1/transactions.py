@@ -0,0 +1,347 @@
+'''
+Transaction log
+---------------
+
+Compact record of a test: only the accepted beats (valid & ready) of the ports that have a Stream.Driver, as
+(cycle, port, data) rows. It is enabled by the 'recorded' decorator when TRANSACTION_LOG is set to a directory,
+and each test writes '<TRANSACTION_LOG>/<test>/':
+
+  - cycle.npy (int64), port.npy (uint8) and data.npy (uint64, one column per 64 bits of the widest port): the
+    columns, written in chunks from preallocated buffers. They can be opened with numpy.load(mmap_mode='r').
+  - ports.json: name and width of each port index.
+
+The query tool works on the memory-mapped columns a chunk at a time, so it can be used with logs of several GB:
+
+    python3 transactions.py log/burst_test summary
+    python3 transactions.py log/burst_test latency --inputs a b --output r
+    python3 transactions.py log/burst_test stalls
+    python3 transactions.py log/burst_test mismatches
+'''
+import argparse
+import functools
+import json
+import os
+import struct
+import sys
+
+import numpy as np      # Used external module! pip install numpy
+
+CHUNK = 1 << 16
+HEADER_SIZE = 128           # Size of the .npy headers, they are written again with the final shape when closing
+COLUMNS = ('cycle', 'port', 'data')
+
+
+def npy_header(dtype, shape):
+    '''It returns a .npy (version 1.0) header of HEADER_SIZE bytes.'''
+    header = "{{'descr': {!r}, 'fortran_order': False, 'shape': {!r}, }}".format(
+        np.lib.format.dtype_to_descr(np.dtype(dtype)), tuple(shape))
+    header = header.ljust(HEADER_SIZE - 10 - 1) + '\n'
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1')
+
+
+class TransactionLog:
+    '''
+    Class Description
+    ------------------
+    Recorder of the accepted beats of the ports attached to it. A single coroutine samples every port on each
+    rising edge of the clock.
+
+    Parameters
+    ----------
+    directory : str
+        Directory of the columns, it is created if needed.
+
+    chunk : int
+        Rows of the buffers, they are written to the files when they are full.
+
+    Attributes
+    ----------
+    current : TransactionLog
+        Log of the running test, None if recording is disabled.
+    '''
+    current = None
+
+    def __init__(self, directory, chunk=CHUNK):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.words = None                                       # 64-bit words of the data column
+        self.rows = 0
+        self.ports = []                                         # (name, width)
+        self.cycle = 0
+
+        self._cycle = np.empty(chunk, dtype=np.int64)
+        self._port = np.empty(chunk, dtype=np.uint8)
+        self._data = None
+        self._count = 0
+        self._edge = None
+        self._files = {name: open(os.path.join(directory, name + '.npy'), 'wb') for name in COLUMNS}
+        for f in self._files.values():
+            f.write(b'\0' * HEADER_SIZE)
+        self._readers = []
+
+    def attach(self, driver, name):
+        '''It records the accepted beats of the port of 'driver'. The sampling starts with the first port.'''
+        from backend import RisingEdge, fork
+        from drivers import signal_reader
+
+        if any(port == name for port, _ in self.ports):
+            return
+        width = len(driver.data)
+        if self.words is not None and width > 64 * self.words:
+            raise ValueError("The port {:s} has {:d} bits, the log only stores {:d}.".format(
+                name, width, 64 * self.words))
+
+        index = len(self.ports)
+        self.ports.append((name, width))
+        self._readers.append((index, *(signal_reader(getattr(driver, field), '{:s}.{:s}'.format(name, field),
+                                                     unresolved=None if field == 'data' else 0)
+                                       for field in ('valid', 'ready', 'data'))))    # Handshakes read as 0 until driven
+        if index == 0:
+            self._edge = RisingEdge(driver.clk)
+            fork(self._sample(self._edge))
+
+    async def _sample(self, edge):
+        await edge
+        # The width of the data column is fixed by the ports attached before the first cycle
+        self.words = words = max(-(-width // 64) for _, width in self.ports)
+        self._data = np.empty((len(self._cycle), words), dtype=np.uint64)
+        readers = self._readers
+        while True:
+            self.cycle += 1
+            for index, valid, ready, data in readers:
+                if valid() and ready():
+                    if self._count == len(self._cycle):
+                        self.flush()
+                    row = self._count
+                    self._cycle[row] = self.cycle
+                    self._port[row] = index
+                    value = data()
+                    for i in range(words):
+                        self._data[row, i] = (value >> (64 * i)) & 0xFFFFFFFFFFFFFFFF
+                    self._count += 1
+            await edge
+
+    async def settle(self):
+        '''It waits for the next edge, so the beats of the edge where the test ended are recorded.'''
+        if self._edge is not None:
+            await self._edge
+
+    def flush(self):
+        n = self._count
+        if n == 0:
+            return
+        self._files['cycle'].write(self._cycle[:n].tobytes())
+        self._files['port'].write(self._port[:n].tobytes())
+        self._files['data'].write(self._data[:n].tobytes())
+        self.rows += n
+        self._count = 0
+
+    def close(self):
+        self.flush()
+        self.words = self.words or 1
+        shapes = {'cycle': (self.rows,), 'port': (self.rows,), 'data': (self.rows, self.words)}
+        dtypes = {'cycle': np.int64, 'port': np.uint8, 'data': np.uint64}
+        for name, f in self._files.items():
+            f.seek(0)
+            f.write(npy_header(dtypes[name], shapes[name]))
+            f.close()
+        with open(os.path.join(self.directory, 'ports.json'), 'w') as f:
+            json.dump({'ports': [{'name': name, 'width': width} for name, width in self.ports],
+                       'words': self.words, 'cycles': self.cycle}, f, indent=2)
+
+
+def recorded(func):
+    '''
+    Function Description
+    ------------------
+    Decorator for the cocotb tests. If TRANSACTION_LOG is set, the accepted beats of the ports driven by a
+    Stream.Driver are written to '<TRANSACTION_LOG>/<test>/'. Otherwise it does nothing.
+
+    '''
+    @functools.wraps(func)
+    async def wrapper(dut):
+        directory = os.environ.get('TRANSACTION_LOG')
+        if not directory:
+            return await func(dut)
+
+        from drivers import DRIVER_HOOKS
+
+        TransactionLog.current = log = TransactionLog(os.path.join(directory, func.__name__))
+        DRIVER_HOOKS.append(log.attach)
+        try:
+            return await func(dut)
+        finally:
+            DRIVER_HOOKS.remove(log.attach)
+            TransactionLog.current = None
+            await log.settle()
+            log.close()
+            dut._log.info("{:d} transactions written to {:s}".format(log.rows, log.directory))
+
+    return wrapper
+
+
+class LogReader:
+    '''
+    Class Description
+    ------------------
+    Memory-mapped columns of a transaction log, read a chunk of rows at a time.
+
+    Parameters
+    ----------
+    directory : str
+        Directory of the log.
+    '''
+    def __init__(self, directory, chunk=1 << 20):
+        with open(os.path.join(directory, 'ports.json')) as f:
+            info = json.load(f)
+        self.names = [port['name'] for port in info['ports']]
+        self.widths = {port['name']: port['width'] for port in info['ports']}
+        self.cycles = info['cycles']
+        self.chunk = chunk
+        self.columns = {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode='r') for name in COLUMNS}
+
+    def __len__(self):
+        return len(self.columns['cycle'])
+
+    def index(self, name):
+        return self.names.index(name)
+
+    def port_chunks(self, names):
+        '''It yields, for each chunk of rows, a dict with the (cycles, data words) of each port of 'names'.'''
+        cycle, port, data = (self.columns[name] for name in COLUMNS)
+        for start in range(0, len(self), self.chunk):
+            rows = slice(start, start + self.chunk)
+            chunk_port = np.asarray(port[rows])
+            chunk = {}
+            for name in names:
+                mask = chunk_port == self.index(name)
+                chunk[name] = (np.asarray(cycle[rows])[mask], np.asarray(data[rows])[mask])
+            yield chunk
+
+    def aligned(self, names):
+        '''
+        It yields the beats of the ports of 'names' in order, aligned by their index (the k-th beat of each port):
+        a dict with the (cycles, data words) of each port, one chunk at a time.
+        '''
+        pending = {name: (np.empty(0, dtype=np.int64), np.empty((0, self.columns['data'].shape[1]), dtype=np.uint64))
+                   for name in names}
+        for chunk in self.port_chunks(names):
+            for name in names:
+                pending[name] = tuple(np.concatenate([old, new]) for old, new in zip(pending[name], chunk[name]))
+            n = min(len(pending[name][0]) for name in names)
+            if n:
+                yield {name: (pending[name][0][:n], pending[name][1][:n]) for name in names}
+                pending = {name: (pending[name][0][n:], pending[name][1][n:]) for name in names}
+
+
+def to_ints(words, width):
+    '''It joins the 64-bit data words of each beat: an int64 array if width <= 63, otherwise python ints.'''
+    if width <= 63:
+        return words[:, 0].astype(np.int64)
+    return sum(words[:, i].astype(object) << (64 * i) for i in range(words.shape[1]))
+
+
+def histogram(values):
+    '''It returns the {value: count} of an array of non-negative ints.'''
+    counts = np.bincount(values) if len(values) else np.zeros(0, dtype=np.int64)
+    return {int(v): int(counts[v]) for v in np.flatnonzero(counts)}
+
+
+def merge_histograms(total, other):
+    for value, count in other.items():
+        total[value] = total.get(value, 0) + count
+    return total
+
+
+def latency(reader, inputs, output):
+    '''Histogram of the cycles between the last input beat of a transaction and its output beat.'''
+    total = {}
+    for beats in reader.aligned([*inputs, output]):
+        start = np.max([beats[name][0] for name in inputs], axis=0)
+        merge_histograms(total, histogram(beats[output][0] - start))
+    return total
+
+
+def stalls(reader, name):
+    '''Histogram of the number of cycles without a beat between two consecutive beats of a port.'''
+    total = {}
+    last = None
+    for chunk in reader.port_chunks([name]):
+        cycles = chunk[name][0]
+        if len(cycles) == 0:
+            continue
+        if last is not None:
+            cycles = np.concatenate([[last], cycles])
+        merge_histograms(total, histogram(np.diff(cycles) - 1))
+        last = cycles[-1]
+    return total
+
+
+def mismatches(reader, limit=10):
+    '''
+    It checks the Adder results: the k-th beat of 'r' must be the signed sum of the k-th beats of 'a' and 'b' (see
+    adder_model.py). Returns the number of results checked and the first 'limit' mismatches.
+    '''
+    from adder_model import AdderModel
+
+    model = AdderModel(reader.widths['a'])
+    mask = (1 << reader.widths['r']) - 1
+    checked = 0
+    found = []
+    for beats in reader.aligned(['a', 'b', 'r']):
+        a, b, r = (to_ints(beats[name][1], reader.widths[name]) for name in ('a', 'b', 'r'))
+        expected = model.add(a, b)
+        expected = (expected.astype(object) if reader.widths['r'] > 63 else expected) & mask
+        for k in np.flatnonzero(r != expected)[:limit - len(found)]:
+            found.append((checked + int(k), int(beats['r'][0][k]), int(r[k]), int(expected[k])))
+        checked += len(r)
+    return checked, found
+
+
+def print_histogram(title, counts):
+    print(title)
+    total = sum(counts.values())
+    for value, count in sorted(counts.items()):
+        print("    {:>8d}  {:>12d}  {:6.2%}".format(value, count, count / total))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Queries a transaction log written by the 'recorded' tests.")
+    parser.add_argument('log', help="directory of the log ('<TRANSACTION_LOG>/<test>')")
+    subparsers = parser.add_subparsers(dest='query', required=True)
+    subparsers.add_parser('summary', help="beats of each port")
+    latency_parser = subparsers.add_parser('latency', help="histogram of the latency of the transactions")
+    latency_parser.add_argument('--inputs', nargs='+', default=['a', 'b'])
+    latency_parser.add_argument('--output', default='r')
+    stalls_parser = subparsers.add_parser('stalls', help="histogram of the cycles between beats of each port")
+    stalls_parser.add_argument('--ports', nargs='+', default=None)
+    mismatches_parser = subparsers.add_parser('mismatches', help="results of the Adder that are not a + b")
+    mismatches_parser.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    reader = LogReader(args.log)
+    if args.query == 'summary':
+        beats = dict.fromkeys(reader.names, 0)
+        for chunk in reader.port_chunks(reader.names):
+            for name in reader.names:
+                beats[name] += len(chunk[name][0])
+        print("{:d} cycles, {:d} beats".format(reader.cycles, len(reader)))
+        for name in reader.names:
+            print("    {:<8s} {:>4d} bits  {:>12d} beats  {:.3f} per cycle".format(
+                name, reader.widths[name], beats[name], beats[name] / max(reader.cycles, 1)))
+    elif args.query == 'latency':
+        print_histogram("Latency [cycles]     Count", latency(reader, args.inputs, args.output))
+    elif args.query == 'stalls':
+        for name in args.ports or reader.names:
+            print_histogram("{:s}: cycles between beats     Count".format(name), stalls(reader, name))
+    elif args.query == 'mismatches':
+        checked, found = mismatches(reader, args.limit)
+        print("{:d} results checked, {:s}".format(checked, "no mismatches" if not found else "mismatches:"))
+        for k, cycle, got, expected in found:
+            print("    result {:d} (cycle {:d}): {:#x}, expected {:#x}".format(k, cycle, got, expected))
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
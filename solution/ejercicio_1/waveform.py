@@ -0,0 +1,191 @@
+'''
+Waveform tracing
+----------------
+
+Tracing is disabled unless the TRACE_DIR environment variable is set. When it is enabled, every test decorated with
+@traced samples the selected Stream fields once per cycle and writes them to '<TRACE_DIR>/<test>.<format>'.
+It is configured with these environment variables (the sweep sets them from its command line):
+
+  - TRACE_DIR: directory of the waveform files.
+  - TRACE_SIGNALS: comma separated Stream prefixes ('a,r') or port names ('r__data'). By default all the streams.
+  - TRACE_WINDOW: 'start:end' cycles to be recorded. By default the whole test.
+  - TRACE_LAST: only the last K cycles are kept, and they are written only if the test fails.
+  - TRACE_FORMAT: 'vcd', 'vcd.gz' or 'fst' (converted with GTKWave's vcd2fst).
+'''
+import functools
+import gzip
+import os
+import shutil
+import subprocess
+from collections import deque
+
+from vcd import VCDWriter  # Installed along with nmigen
+
+from backend import FallingEdge, fork
+
+FORMATS = ('vcd', 'vcd.gz', 'fst')
+
+DEFAULT_STREAMS = ('a', 'b', 'r')
+STREAM_FIELDS = ('data', 'valid', 'ready')
+
+
+class Tracer:
+    '''
+    Class Description
+    ------------------
+    Records the value of some ports of the DUT once per cycle (at the falling edge of the clock).
+
+    Parameters
+    ----------
+    dut : cocotb dut (or backend.PysimDut)
+        Design under test.
+
+    filename : str
+        Output file, without extension.
+
+    names : list of str
+        Names of the ports to be recorded.
+
+    window : (int, int)
+        First and last cycle to be recorded. None records every cycle.
+
+    last : int
+        If it is not None, only the last 'last' cycles are kept in memory and they are written only on failure.
+
+    fmt : str
+        One of FORMATS.
+
+    period_ns : int
+        Clock period, used for the timestamps.
+    '''
+    def __init__(self, dut, filename, names, window=None, last=None, fmt='vcd', period_ns=10):
+        if fmt not in FORMATS:
+            raise ValueError("Unknown trace format '{:s}'.".format(fmt))
+
+        self.clk = dut.clk
+        self.filename = filename
+        self.handles = [(name, getattr(dut, name)) for name in names]
+        self.window = window
+        self.last = last
+        self.fmt = fmt
+        self.period_ns = period_ns
+        self.cycle = 0
+
+        self._samples = deque(maxlen=last) if last is not None else None
+        self._file = None
+        self._writer = None
+        self._vars = None
+
+    @classmethod
+    def from_env(cls, dut, name, streams=DEFAULT_STREAMS):
+        '''It returns the Tracer configured by the TRACE_* environment variables, or None if tracing is disabled.'''
+        directory = os.environ.get('TRACE_DIR')
+        if not directory:
+            return None
+
+        selection = os.environ.get('TRACE_SIGNALS')
+        selection = selection.split(',') if selection else streams
+        names = []
+        for item in selection:
+            item = item.strip()
+            if '__' in item:
+                names.append(item)
+            else:
+                names.extend(item + '__' + field for field in STREAM_FIELDS)
+
+        window = os.environ.get('TRACE_WINDOW')
+        if window:
+            start, end = window.split(':')
+            window = (int(start or 0), int(end) if end else None)
+        last = os.environ.get('TRACE_LAST')
+
+        return cls(dut, os.path.join(directory, name), names,
+                   window=window or None,
+                   last=int(last) if last else None,
+                   fmt=os.environ.get('TRACE_FORMAT', 'vcd'))
+
+    def _in_window(self):
+        if self.window is None:
+            return True
+        start, end = self.window
+        return self.cycle >= start and (end is None or self.cycle <= end)
+
+    @staticmethod
+    def _read(handle):
+        try:
+            return handle.value.integer
+        except ValueError:                              # X or Z values
+            return 'x'
+
+    def _open(self):
+        path = self.filename + '.vcd'
+        self._file = gzip.open(path + '.gz', 'wt') if self.fmt == 'vcd.gz' else open(path, 'w')
+        self._writer = VCDWriter(self._file, timescale='1 ns', check_values=False)
+        self._vars = [self._writer.register_var('top', name, 'wire', size=len(handle)) for name, handle in self.handles]
+
+    def _write(self, cycle, values):
+        if self._writer is None:
+            self._open()
+        timestamp = cycle * self.period_ns
+        for var, value in zip(self._vars, values):
+            self._writer.change(var, timestamp, value)
+
+    async def run(self):
+        edge = FallingEdge(self.clk)
+        while True:
+            await edge
+            self.cycle += 1
+            if self._in_window():
+                values = [self._read(handle) for _, handle in self.handles]
+                if self._samples is not None:
+                    self._samples.append((self.cycle, values))
+                else:
+                    self._write(self.cycle, values)
+
+    def close(self, failed):
+        '''It writes the pending samples (only on failure if 'last' was given) and closes the file.'''
+        if self._samples is not None and failed:
+            for cycle, values in self._samples:
+                self._write(cycle, values)
+        if self._writer is None:
+            return
+
+        self._writer.close()
+        self._file.close()
+        if self.fmt == 'fst':
+            vcd2fst = shutil.which('vcd2fst')
+            if vcd2fst is None:
+                print("vcd2fst not found, the trace was left as " + self.filename + '.vcd')
+                return
+            subprocess.run([vcd2fst, self.filename + '.vcd', self.filename + '.fst'], check=True,
+                           stdout=subprocess.DEVNULL)
+            os.remove(self.filename + '.vcd')
+
+
+def traced(func=None, streams=DEFAULT_STREAMS):
+    '''
+    Function Description
+    ------------------
+    Decorator for the cocotb tests. If tracing is enabled it records the test with a Tracer, otherwise it does
+    nothing (the test runs without any extra coroutine).
+
+    '''
+    if func is None:
+        return functools.partial(traced, streams=streams)
+
+    @functools.wraps(func)
+    async def wrapper(dut):
+        tracer = Tracer.from_env(dut, func.__name__, streams)
+        if tracer is None:
+            return await func(dut)
+
+        fork(tracer.run())
+        try:
+            result = await func(dut)
+        except BaseException:
+            tracer.close(failed=True)
+            raise
+        tracer.close(failed=False)
+        return result
+
+    return wrapper
@@ -0,0 +1,514 @@
+import argparse
+import io
+import mmap
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Name of the memory files. 'stem' is the name of the input file without extension, 'name' the name of the
+# register array and 'index' the order in which the array appears in the file.
+MEM_TEMPLATE = "memdump{index:d}.mem"
+BATCH_MEM_TEMPLATE = "{stem}_{name}.mem"
+
+# Size of the write buffers. The output lines are written as soon as they are processed, so the memory used does
+# not depend on the size of the input file.
+BUFFER_SIZE = 1 << 20
+
+# Format of the memory files: the values in hex ($readmemh) or in binary ($readmemb)
+MEM_FORMATS = {'hex': 'readmemh', 'bin': 'readmemb'}
+
+# Regex definitions
+pattern_name = re.compile(r"\s*reg\s*\[(\d+):(\d+)\]\s*(\S+?)\s*\[(\d+):(\d+)\]\s*;")      # reg [7:0] mem [15:0];
+pattern_begin = re.compile(r"\s*initial begin\s*$")
+pattern_end = re.compile(r"\s*end\s*$")
+pattern_assign = re.compile(r"\s*(\S+?)\s*\[(\d+)\]\s*=\s*(\d*)\'h(\w+)\s*;")    # mem[i] = W'hXX;
+
+HEX_TO_BIN = {c: '{:04b}'.format(int(c, 16)) for c in '0123456789abcdefABCDEF'}
+HEX_TO_BIN.update({c: c.lower() * 4 for c in 'xXzZ'})
+
+
+def mem_filename(template, stem, name, index):
+    # Escaped identifiers may have characters that are not valid in a file name
+    return template.format(stem=stem, name=re.sub(r"[^\w.-]", "_", name), index=index)
+
+
+class RawImage:
+    '''
+    Class Description
+    ------------------
+    Little-endian binary image of a memory, written through a memory-mapped file. Each word takes ceil(width/8)
+    bytes at the offset index*ceil(width/8). The words that are not written are zero (or 'fill').
+
+    Parameters
+    ----------
+    path : str
+        Image file.
+
+    width : int
+        Number of bits of each word.
+
+    depth : int
+        Number of words, if it is known. Otherwise the image grows as needed.
+
+    fill : int
+        Value of the words that are not written.
+    '''
+    def __init__(self, path, width, depth=None, fill=None):
+        self.word_bytes = (width + 7) // 8
+        self.size = 0                                                       # Bytes up to the last word written
+        self.fill = fill
+        self._filled = 0                                                    # Bytes already filled
+        self._file = open(path, "w+b")
+        self._file.truncate(depth * self.word_bytes if depth else mmap.PAGESIZE)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+
+    def _fill_to(self, end):
+        if self.fill:
+            word = self.fill.to_bytes(self.word_bytes, 'little')
+            block = word * max(1, BUFFER_SIZE // self.word_bytes)           # Written a block at a time
+            for start in range(self._filled, end, len(block)):
+                size = min(len(block), end - start)
+                self._map[start:start + size] = block[:size]
+        self._filled = max(self._filled, end)
+
+    def write(self, index, value):
+        offset = index * self.word_bytes
+        end = offset + self.word_bytes
+        if end > len(self._map):
+            size = len(self._map)
+            while size < end:
+                size *= 2
+            self._map.resize(size)
+            self._file.truncate(size)
+        self._fill_to(end)
+        self._map[offset:end] = value.to_bytes(self.word_bytes, 'little')
+        self.size = max(self.size, end)
+
+    def close(self, depth=None):
+        size = max(self.size, depth * self.word_bytes if depth else 0)
+        self._fill_to(size)
+        self._map.close()
+        self._file.truncate(size)
+        self._file.close()
+
+
+class MemoryImage:
+    '''
+    Class Description
+    ------------------
+    Memory file of a register array. The address of each value is taken from its assignment: when the addresses
+    are not consecutive an '@address' record is written, or the gap is filled with 'fill' if it is given (only the
+    addresses above every address written so far are filled, so a value is never overwritten).
+
+    Parameters
+    ----------
+    path : str
+        Memory file.
+
+    width : int
+        Number of bits of each word.
+
+    depth : int
+        Number of words of the array, if it is known. It is used to fill the end of the memory.
+
+    mem_format : str
+        'hex' or 'bin' (see MEM_FORMATS).
+
+    fill : int
+        Value used to fill the gaps. None writes '@address' records instead.
+
+    raw_path : str
+        If it is given, a RawImage of the memory is also written to this file.
+
+    file : file object
+        If it is given, the memory file is written to it (e.g. an io.StringIO) instead of opening 'path', and it
+        is not closed. 'path' is still the name loaded by $readmemh.
+    '''
+    def __init__(self, path, width, depth=None, mem_format='hex', fill=None, raw_path=None, file=None):
+        if mem_format not in MEM_FORMATS:
+            raise ValueError("Unknown memory format '{:s}'.".format(mem_format))
+
+        self.path = path
+        self.width = width
+        self.depth = depth
+        self.mem_format = mem_format
+        self.fill = fill
+        self.next_address = 0
+        self.end_address = 0                                                # Address after the highest one written
+        self.count = 0
+
+        self._own_file = file is None
+        self._file = open(path, "w", buffering=BUFFER_SIZE) if file is None else file
+        self._raw = RawImage(raw_path, width, depth, fill) if raw_path else None
+        self._fill_line = None
+        if fill is not None:
+            self._fill_line = self._format('{:0{:d}x}'.format(fill, (width + 3) // 4))
+
+    def _format(self, value):
+        if self.mem_format == 'bin':
+            return ''.join(HEX_TO_BIN[c] for c in value.replace('_', ''))[-self.width:].rjust(self.width, '0') + '\n'
+        return value + '\n'
+
+    def _fill(self, address):
+        # It fills from the end of the written addresses up to 'address'
+        if self.next_address != self.end_address:
+            self._file.write('@{:x}\n'.format(self.end_address))
+        lines = address - self.end_address
+        block = max(1, BUFFER_SIZE // len(self._fill_line))                 # Lines written at a time
+        for start in range(0, lines, block):
+            self._file.write(self._fill_line * min(block, lines - start))
+
+    def write(self, address, value):
+        if address != self.next_address:
+            if self._fill_line is not None and address > self.end_address:
+                self._fill(address)
+            else:
+                self._file.write('@{:x}\n'.format(address))
+        self._file.write(self._format(value))
+        self.next_address = address + 1
+        self.end_address = max(self.end_address, self.next_address)
+        self.count += 1
+
+        if self._raw is not None:
+            self._raw.write(address, int(re.sub('[xXzZ]', '0', value), 16))  # Unknown bits are written as 0
+
+    def close(self):
+        if self._fill_line is not None and self.depth is not None and self.end_address < self.depth:
+            self._fill(self.depth)
+        if self._own_file:
+            self._file.close()
+        if self._raw is not None:
+            self._raw.close(self.depth)
+
+
+def convert(lines, output, open_memory, mem_format='hex', source='<input>'):
+    '''
+    Function Description
+    ------------------
+    Reads the lines of a verilog netlist and writes them to 'output', replacing each 'initial begin' block of
+    memory assignments by one '$readmemh' line per register array. The values of each array are written to the
+    MemoryImage returned by 'open_memory'. Nothing is read from or written to disk by this function.
+
+    Parameters
+    ----------
+    lines : iterable of str
+        Lines of the input netlist, e.g. a text file object or an io.StringIO.
+
+    output : file object
+        Where the output netlist is written, anything with a write() method.
+
+    open_memory : callable
+        open_memory(name, index, width, depth) returns the MemoryImage of the register array 'name', the
+        'index'-th one found. 'depth' is None if the array was not declared.
+
+    mem_format : str
+        'hex' ($readmemh) or 'bin' ($readmemb).
+
+    source : str
+        Name of the input, used in the error messages.
+
+    Returns a dict with the number of assignments of each register array. The memories are closed when it returns.
+    '''
+    mem_files = {}          # MemoryImage of each register array
+    depths = {}             # Number of words of each declared register array
+    assignments = {}        # Number of values of each register array
+
+    try:
+        # Flow control variables
+        begin_line = None       # 'initial begin' line of a block that we don't know yet if it has to be replaced
+        looping_mem = False
+        block_mems = []         # Register arrays assigned inside the current block
+
+        for line_number, each_line in enumerate(lines, 1):
+            if begin_line is not None:
+                # First line of an 'initial begin' block
+                if pattern_assign.match(each_line):
+                    looping_mem = True
+                    block_mems = []
+                else:
+                    output.write(begin_line)                                    # It is not a memory initialization
+                begin_line = None
+
+            if looping_mem:
+                # Looping through the assignations
+                if pattern_end.match(each_line):
+                    # If we find an 'end' line, we stop looping and add the new syntax
+                    looping_mem = False
+                    for name in block_mems:
+                        output.write('  ${:s}("{:s}", {:s});\n'.format(
+                            MEM_FORMATS[mem_format], os.path.basename(mem_files[name].path), name))
+                    continue
+
+                match_assign = pattern_assign.match(each_line)
+                if not match_assign:
+                    raise ValueError("{:s}:{:d}: unexpected line inside a memory initialization: {:s}".format(
+                        source, line_number, each_line.strip()))
+
+                name, address, width, value = match_assign.groups()
+                mem_file = mem_files.get(name)
+                if mem_file is None:
+                    mem_file = open_memory(name, len(mem_files), int(width or 4 * len(value)), depths.get(name))
+                    mem_files[name] = mem_file
+                    assignments[name] = 0
+                if assignments[name] == 0:
+                    block_mems.append(name)                                     # Each array is loaded only once
+                mem_file.write(int(address), value)                             # Store the value at its address
+                assignments[name] += 1
+
+            elif pattern_begin.match(each_line):
+                # If we find the 'initial begin' line, we wait for the next one
+                begin_line = each_line
+            else:
+                match_name = pattern_name.match(each_line)
+                if match_name:
+                    # If we find a register array definition, we store its number of words
+                    first, last = int(match_name.group(4)), int(match_name.group(5))
+                    depths[match_name.group(3)] = abs(first - last) + 1
+                # If the line is not important to this analisis, we save it as it is
+                output.write(each_line)
+
+        if begin_line is not None:
+            output.write(begin_line)
+    finally:
+        for mem_file in mem_files.values():
+            mem_file.close()
+
+    return assignments
+
+
+def convert_file(input_path, output_path, mem_dir=None, mem_template=MEM_TEMPLATE, mem_format='hex', fill=None,
+                 raw=False):
+    '''
+    Function Description
+    ------------------
+    Converts the input verilog file with convert(), writing the output verilog file and the memory file of each
+    register array.
+
+    Parameters
+    ----------
+    input_path : str
+        Input verilog file.
+
+    output_path : str
+        Output verilog file.
+
+    mem_dir : str
+        Directory of the memory files. By default, the directory of the output file.
+
+    mem_template : str
+        Name of the memory files (see MEM_TEMPLATE).
+
+    mem_format : str
+        'hex' ($readmemh) or 'bin' ($readmemb).
+
+    fill : int
+        Value used to fill the gaps between addresses (and the end of the memory). By default the gaps are skipped
+        with '@address' records.
+
+    raw : bool
+        Also writes a little-endian binary image of each memory ('.bin' instead of '.mem').
+
+    Returns a dict with the number of assignments of each register array and the size of the input file.
+    '''
+    stem = os.path.splitext(os.path.basename(input_path))[0]
+    if mem_dir is None:
+        mem_dir = os.path.dirname(output_path)
+
+    def open_memory(name, index, width, depth):
+        path = os.path.join(mem_dir, mem_filename(mem_template, stem, name, index))
+        return MemoryImage(path, width, depth, mem_format, fill, os.path.splitext(path)[0] + '.bin' if raw else None)
+
+    with open(input_path, "r") as input_file, open(output_path, "w", buffering=BUFFER_SIZE) as output_file:
+        assignments = convert(input_file, output_file, open_memory, mem_format, input_path)
+
+    return {
+        'file': input_path,
+        'memories': assignments,
+        'bytes': os.path.getsize(input_path),
+    }
+
+
+def convert_text(source, stem='input', mem_template=MEM_TEMPLATE, mem_format='hex', fill=None):
+    '''
+    Function Description
+    ------------------
+    Converts a netlist in memory, without any file: 'source' can be a string, bytes or any iterable of lines
+    (e.g. an open file). The arguments are the same as the ones of convert_file().
+
+    Returns a dict with the output netlist ('verilog'), and the name ('files') and contents ('memories') of the
+    memory file of each register array. See memory_words() to get the values of a memory.
+    '''
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = bytes(source).decode()
+    lines = io.StringIO(source) if isinstance(source, str) else source
+    output = io.StringIO()
+    files = {}
+    buffers = {}
+
+    def open_memory(name, index, width, depth):
+        files[name] = mem_filename(mem_template, stem, name, index)
+        buffers[name] = io.StringIO()
+        return MemoryImage(files[name], width, depth, mem_format, fill, file=buffers[name])
+
+    convert(lines, output, open_memory, mem_format, stem)
+    return {
+        'verilog': output.getvalue(),
+        'files': files,
+        'memories': {name: buffer.getvalue() for name, buffer in buffers.items()},
+    }
+
+
+def memory_words(text, mem_format='hex'):
+    '''It yields (address, value) for each word of the contents of a memory file, following its '@address' records.'''
+    address = 0
+    for line in text.splitlines():
+        if line.startswith('@'):
+            address = int(line[1:], 16)
+        elif line:
+            yield address, int(line, 16 if mem_format == 'hex' else 2)
+            address += 1
+
+
+def find_inputs(paths):
+    '''
+    It yields (input file, path relative to the output directory) for each file or '.v' file in a directory tree.
+    A file given twice is only yielded once, and a ValueError is raised if two different files would be written to
+    the same output (e.g. 'a/x.v' and 'b/x.v').
+    '''
+    seen = {}                                                       # Relative output path -> input file
+    for path in paths:
+        if os.path.isdir(path):
+            inputs = []
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                inputs += [os.path.join(root, filename) for filename in sorted(files) if filename.endswith('.v')]
+            pairs = [(input_path, os.path.relpath(input_path, path)) for input_path in inputs]
+        else:
+            pairs = [(path, os.path.basename(path))]
+
+        for input_path, relative in pairs:
+            key = os.path.normcase(os.path.normpath(relative))
+            if key in seen:
+                if os.path.realpath(seen[key]) == os.path.realpath(input_path):
+                    continue
+                raise ValueError("'{:s}' and '{:s}' would both be converted to '{:s}'.".format(
+                    seen[key], input_path, relative))
+            seen[key] = input_path
+            yield input_path, relative
+
+
+def _convert_job(job):
+    # The files are written to a temporary directory and moved next to the output only if the conversion succeeds
+    input_path, output_path, options = job
+    directory = os.path.dirname(output_path) or '.'
+    try:
+        os.makedirs(directory, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=directory, prefix='.convert-')
+    except OSError as e:
+        return {'file': input_path, 'error': str(e)}
+    try:
+        result = convert_file(input_path, os.path.join(tmp_dir, os.path.basename(output_path)), mem_dir=tmp_dir,
+                              **options)
+        for name in os.listdir(tmp_dir):
+            os.replace(os.path.join(tmp_dir, name), os.path.join(directory, name))
+    except Exception as e:
+        return {'file': input_path, 'error': str(e) or type(e).__name__}
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return result
+
+
+def convert_batch(paths, output_dir, jobs=None, mem_template=BATCH_MEM_TEMPLATE, **options):
+    '''
+    Function Description
+    ------------------
+    Converts every file (or '.v' file of every directory tree) in 'paths' in a process pool. The output files keep
+    the directory structure below 'output_dir', next to their memory files. Two inputs with the same output path
+    raise a ValueError before anything is converted (see find_inputs()).
+
+    The rest of the keyword arguments are passed to convert_file(). Returns the list of its results, or of
+    {'file', 'error'} for the files that could not be converted (nothing is written for them).
+    '''
+    options['mem_template'] = mem_template
+    work = [(input_path, os.path.join(output_dir, relative), options) for input_path, relative in find_inputs(paths)]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(_convert_job, work, chunksize=max(1, len(work) // (4 * (jobs or os.cpu_count() or 1)))))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replaces the memory initializations of verilog files by $readmemh.")
+    parser.add_argument('inputs', nargs='+', help="verilog files or directories")
+    parser.add_argument('-o', '--output-dir', default='converted', help="output directory (default: %(default)s)")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="number of worker processes (default: one per core)")
+    parser.add_argument('--mem-template', default=BATCH_MEM_TEMPLATE,
+                        help="name of the memory files, with the fields {stem}, {name} and {index} (default: %(default)s)")
+    parser.add_argument('--mem-format', choices=MEM_FORMATS, default='hex',
+                        help="'hex' ($readmemh) or 'bin' ($readmemb) memory files (default: %(default)s)")
+    parser.add_argument('--fill', type=lambda value: int(value, 0), default=None,
+                        help="fill the gaps between addresses with this value instead of writing '@address' records")
+    parser.add_argument('--raw', action='store_true',
+                        help="also write a little-endian binary image of each memory (.bin)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="convert only the files that changed since the last run (see incremental.py)")
+    parser.add_argument('--watch', type=float, nargs='?', const=1.0, default=None, metavar='SECONDS',
+                        help="convert the files again whenever they change, checking them every SECONDS (default: 1)")
+    args = parser.parse_args(argv)
+    options = {'mem_template': args.mem_template, 'mem_format': args.mem_format, 'fill': args.fill, 'raw': args.raw}
+
+    if args.incremental or args.watch is not None:
+        import incremental                  # It uses this module
+
+        def report(results, start=None):
+            for r in results:
+                if 'error' in r:
+                    print("{:s}: {:s}".format(r['file'], r['error']))
+                elif r['converted']:
+                    print("{:s} -> {:s} ({:d} written)".format(r['file'], r['output'], len(r['written'])))
+            if start is not None:
+                print(incremental.summary(results, time.perf_counter() - start))
+
+        if args.watch is not None:
+            print("Watching {:s} (Ctrl+C to stop)".format(", ".join(args.inputs)))
+            try:
+                incremental.watch(lambda: incremental.batch_pairs(args.inputs, args.output_dir), args.output_dir,
+                                  args.watch, args.jobs, report, **options)
+            except ValueError as e:
+                parser.error(str(e))
+            return 0
+        start = time.perf_counter()
+        try:
+            results = incremental.convert_incremental(args.inputs, args.output_dir, args.jobs, **options)
+        except ValueError as e:
+            parser.error(str(e))
+        report(results, start)
+        return 1 if any('error' in r for r in results) else 0
+
+    start = time.perf_counter()
+    try:
+        results = convert_batch(args.inputs, args.output_dir, args.jobs, **options)
+    except ValueError as e:
+        parser.error(str(e))
+    elapsed = time.perf_counter() - start
+
+    failed = [r for r in results if 'error' in r]
+    for r in failed:
+        print("{:s}: {:s}".format(r['file'], r['error']))
+    results = [r for r in results if 'error' not in r]
+
+    memories = sum(len(r['memories']) for r in results)
+    assignments = sum(sum(r['memories'].values()) for r in results)
+    size = sum(r['bytes'] for r in results)
+    print("Converted {:d} files ({:.1f} MB), {:d} memories, {:d} assignments in {:.2f} s".format(
+        len(results), size / 2**20, memories, assignments, elapsed))
+    print("{:.1f} files/s, {:.0f} assignments/s".format(len(results) / elapsed, assignments / elapsed))
+    if failed:
+        print("{:d} files failed".format(len(failed)))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,282 @@
+import argparse
+import importlib.metadata
+import os
+import re
+import sys
+
+import numpy as np      # Used external module! pip install numpy
+from nmigen import *
+from nmigen.back import rtlil, verilog
+
+# Number of words generated (and written) at once
+CHUNK = 1 << 16
+
+HEX_DIGITS = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+
+# Without inline initial values, convert_verilog() runs yosys on RTLIL without the initialization of the memory
+# (nMigen always writes one, with zeros by default, and yosys takes minutes with large memories). The function of
+# nMigen's Verilog backend that does it is not public, so only these versions are supported.
+SUPPORTED_BACKENDS = {'nmigen': '0.3', 'amaranth': '0.3'}
+
+
+def random_init(width, depth, seed, chunk=CHUNK):
+    '''
+    Function Description
+    ------------------
+    Generator of arrays with the random initial values of a memory, 'depth' words in total. The arrays are uint64
+    when width <= 64 and python ints (object) otherwise. The same seed always gives the same values.
+
+    Parameters
+    ----------
+    width : int
+        Number of bits of each word.
+
+    depth : int
+        Number of words.
+
+    seed : int
+        Seed of the values.
+
+    chunk : int
+        Number of words generated at once.
+
+    '''
+    rng = np.random.default_rng(seed)
+    words = -(-width // 32)
+    remaining = depth
+    while remaining > 0:
+        n = min(chunk, remaining)
+        remaining -= n
+        parts = rng.integers(0, 1 << 32, size=(n, words), dtype=np.uint64)
+        if width <= 64:
+            values = parts[:, 0] | (parts[:, 1] << np.uint64(32)) if words == 2 else parts[:, 0]
+            yield values & np.uint64((1 << width) - 1)
+        else:
+            parts = parts.astype(object)
+            yield sum(parts[:, i] << (32 * i) for i in range(words)) & ((1 << width) - 1)
+
+
+def hex_lines(values, width):
+    '''It returns the bytes of the '$readmemh' lines of an array of values (one zero-padded word per line).'''
+    digits = (width + 3) // 4
+    if values.dtype == object:
+        return ''.join('{:0{:d}x}\n'.format(value, digits) for value in values.tolist()).encode()
+
+    shifts = np.arange(4 * (digits - 1), -1, -4, dtype=np.uint64)
+    lines = np.empty((len(values), digits + 1), dtype=np.uint8)
+    lines[:, :digits] = HEX_DIGITS[(values[:, None] >> shifts) & np.uint64(0xf)]
+    lines[:, digits] = ord('\n')
+    return lines.tobytes()
+
+
+def write_readmemh(path, chunks, width):
+    '''It writes the arrays of 'chunks' to a '$readmemh' file. Returns the number of words written.'''
+    count = 0
+    with open(path, "wb") as f:
+        for values in chunks:
+            f.write(hex_lines(values, width))
+            count += len(values)
+    return count
+
+
+class RegisterFile(Elaboratable):
+    '''
+    Module Description
+    ------------------
+    Memory of 'depth' words of 'width' bits, with random initial values, 'read_ports' synchronous read ports and
+    'write_ports' write ports. Each port has its own address.
+
+    Parameters
+    ----------
+    width : int
+        Number of bits of each word.
+
+    depth : int
+        Number of words.
+
+    read_ports, write_ports : int
+        Number of ports.
+
+    seed : int
+        Seed of the initial values.
+
+    inline_init : bool
+        If it is True the initial values are given to the Memory, so they are written in the netlist. Otherwise the
+        values are written with write_init() to a '$readmemh' file, see convert_verilog().
+
+    simulate : bool
+        Whether the Memory can be simulated, see nMigen's Memory. It creates a Signal per word.
+
+    Attributes
+    ----------
+    rd_adr, dat_r : list of Signal
+        Address (in) and data (out) of each read port.
+
+    wr_adr, dat_w, we : list of Signal
+        Address, data and write enable (in) of each write port.
+    '''
+    def __init__(self, width=8, depth=16, read_ports=1, write_ports=1, seed=0, inline_init=True, simulate=True):
+
+        # Arguments Validation
+        if width < 1 or depth < 1:
+            raise ValueError("The arguments 'width' and 'depth' should be greater than 0.")
+        if read_ports < 0 or write_ports < 0:
+            raise ValueError("The number of ports can not be negative.")
+
+        self.width = width
+        self.depth = depth
+        self.seed = seed
+
+        # Ports Definition
+        self.rd_adr = [Signal(range(depth), name='rd_adr{:d}'.format(k)) for k in range(read_ports)]
+        self.dat_r = [Signal(width, name='dat_r{:d}'.format(k)) for k in range(read_ports)]
+        self.wr_adr = [Signal(range(depth), name='wr_adr{:d}'.format(k)) for k in range(write_ports)]
+        self.dat_w = [Signal(width, name='dat_w{:d}'.format(k)) for k in range(write_ports)]
+        self.we = [Signal(name='we{:d}'.format(k)) for k in range(write_ports)]
+
+        init = None
+        if inline_init:
+            init = [value for values in self.init_chunks() for value in values.tolist()]
+        self.mem = Memory(width=width, depth=depth, init=init, name='mem', simulate=simulate)
+
+    def init_chunks(self):
+        '''It yields the initial values of the memory, in arrays (see random_init()).'''
+        return random_init(self.width, self.depth, self.seed)
+
+    def write_init(self, path):
+        '''It writes the initial values of the memory to a '$readmemh' file.'''
+        return write_readmemh(path, self.init_chunks(), self.width)
+
+    def ports(self):
+        return [*self.rd_adr, *self.dat_r, *self.wr_adr, *self.dat_w, *self.we]
+
+    def elaborate(self, platform):
+        m = Module()
+        comb = m.d.comb
+
+        for k, (adr, dat_r) in enumerate(zip(self.rd_adr, self.dat_r)):
+            m.submodules['rdport{:d}'.format(k)] = rdport = self.mem.read_port()
+            comb += [
+                rdport.addr.eq(adr),
+                dat_r.eq(rdport.data)
+            ]
+        for k, (adr, dat_w, we) in enumerate(zip(self.wr_adr, self.dat_w, self.we)):
+            m.submodules['wrport{:d}'.format(k)] = wrport = self.mem.write_port()
+            comb += [
+                wrport.addr.eq(adr),
+                wrport.data.eq(dat_w),
+                wrport.en.eq(we)
+            ]
+
+        return m
+
+
+def rtlil_to_verilog():
+    '''
+    It returns the function of nMigen's Verilog backend that converts RTLIL text to Verilog. It is not part of the
+    public API, so a RuntimeError is raised with the versions that were not checked (see SUPPORTED_BACKENDS).
+    '''
+    module = sys.modules[verilog.convert.__module__]
+    package = module.__name__.split('.')[0]
+    try:
+        version = importlib.metadata.version(package)
+    except importlib.metadata.PackageNotFoundError:
+        version = 'unknown'
+    supported = SUPPORTED_BACKENDS.get(package)
+    convert = getattr(module, '_convert_rtlil_text', None)
+    if supported is None or not (version == supported or version.startswith(supported + '.')) or convert is None:
+        raise RuntimeError("Loading the memory with $readmemh needs one of {:s}, found {:s} {:s}.".format(
+            ", ".join("{:s} {:s}".format(*item) for item in SUPPORTED_BACKENDS.items()), package, version))
+    return convert
+
+
+def strip_meminit(text, memid):
+    '''
+    It returns the RTLIL 'text' without the '$meminit' cell of the memory 'memid'. A RuntimeError is raised if the
+    cell is not found exactly once.
+    '''
+    lines = text.splitlines(keepends=True)
+    memid_line = 'parameter \\MEMID "\\\\{:s}"'.format(memid)
+    output = []
+    removed = 0
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        indent = line[:len(line) - len(line.lstrip())]
+        if line.lstrip().startswith('cell $meminit '):
+            end = lines.index(indent + 'end\n', i)
+            if any(cell_line.strip() == memid_line for cell_line in lines[i:end]):
+                removed += 1
+                i = end + 1
+                continue
+        output.append(line)
+        i += 1
+
+    if removed != 1:
+        raise RuntimeError("Found {:d} initializations of the memory '{:s}' in the RTLIL.".format(removed, memid))
+    return ''.join(output)
+
+
+def convert_rtlil(rf, name='top'):
+    '''It returns the RTLIL of a RegisterFile.'''
+    return rtlil.convert(rf, name=name, ports=rf.ports())
+
+
+def convert_verilog(rf, name='top', mem_file=None):
+    '''
+    Function Description
+    ------------------
+    It returns the Verilog of a RegisterFile. If 'mem_file' is given the memory is loaded from that file with
+    '$readmemh', next to its declaration, instead of one assignment per word. That needs one of the
+    SUPPORTED_BACKENDS, otherwise only the public nMigen converter is used.
+
+    '''
+    if mem_file is None:
+        return verilog.convert(rf, name=name, ports=rf.ports())
+
+    text = rtlil_to_verilog()(strip_meminit(convert_rtlil(rf, name), rf.mem.name), strip_internal_attrs=True)
+    declaration = re.compile(r"^ *reg\s*\[.*?\]\s*\\?{:s}\s*\[.*?\]\s*;\n".format(re.escape(rf.mem.name)),
+                             re.MULTILINE)
+    text, count = declaration.subn(lambda match: '{:s}  initial $readmemh("{:s}", {:s});\n'.format(
+        match.group(0), mem_file, rf.mem.name), text, count=1)
+    if count != 1:
+        raise RuntimeError("The declaration of the memory '{:s}' was not found in the Verilog.".format(rf.mem.name))
+    return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generates a RegisterFile with random initial values.")
+    parser.add_argument('-w', '--width', type=int, default=8, help="bits of each word (default: %(default)s)")
+    parser.add_argument('-d', '--depth', type=int, default=16, help="number of words (default: %(default)s)")
+    parser.add_argument('-r', '--read-ports', type=int, default=1, help="number of read ports (default: %(default)s)")
+    parser.add_argument('-W', '--write-ports', type=int, default=1, help="number of write ports (default: %(default)s)")
+    parser.add_argument('-s', '--seed', type=int, default=None, help="seed of the initial values (default: a new one)")
+    parser.add_argument('-t', '--type', choices=('v', 'il'), default='v', help="Verilog or RTLIL (default: %(default)s)")
+    parser.add_argument('-o', '--output', default='testcase.v', help="output netlist (default: %(default)s)")
+    parser.add_argument('--readmemh', default=None, metavar='FILE',
+                        help="write the initial values to this file and load them with $readmemh")
+    args = parser.parse_args(argv)
+    if args.readmemh is not None and args.type != 'v':
+        parser.error("--readmemh needs a Verilog output (-t v)")
+
+    seed = args.seed if args.seed is not None else int(np.random.SeedSequence().entropy % 2**32)
+    print("RegisterFile of {:d}x{:d} bits, seed {:d}".format(args.depth, args.width, seed))
+
+    rf = RegisterFile(args.width, args.depth, args.read_ports, args.write_ports, seed,
+                      inline_init=args.readmemh is None, simulate=False)
+    mem_file = None
+    if args.readmemh is not None:
+        rf.write_init(args.readmemh)
+        mem_file = os.path.relpath(args.readmemh, os.path.dirname(os.path.abspath(args.output)))
+    if args.type == 'il':
+        text = convert_rtlil(rf)
+    else:
+        text = convert_verilog(rf, mem_file=mem_file)
+
+    with open(args.output, "w") as f:
+        f.write(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
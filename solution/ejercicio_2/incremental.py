@@ -0,0 +1,305 @@
+'''
+Incremental conversion
+----------------------
+
+Converts only the netlists that changed since their last conversion. A cache file in the output directory
+(CACHE_FILE) keeps, for every output netlist, the hash of its input, the options of the conversion and the size and
+modification time of every file written. A netlist is converted again when:
+
+  - the contents of its input changed (the hash is only computed when its size or modification time changed),
+  - the options changed, or
+  - one of its outputs is missing or was modified.
+
+The conversion is written to a temporary directory next to the outputs, and each file is moved over the old one
+with an atomic rename (os.replace()) only if its contents changed. The unchanged files keep their modification
+time, so the simulator builds that depend on them are not run again. If the conversion fails, the old outputs are
+kept.
+'''
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from extractor import BATCH_MEM_TEMPLATE, convert_file, find_inputs
+
+CACHE_FILE = ".extractor_cache.json"
+CACHE_VERSION = 1
+
+# Size of the blocks read to compute the hashes
+CHUNK_SIZE = 1 << 20
+
+
+def file_digest(path, chunk_size=CHUNK_SIZE):
+    '''It returns the BLAKE2b digest of a file, reading it by blocks.'''
+    digest = hashlib.blake2b()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_stat(path):
+    '''It returns [size, modification time in ns] of a file, as they are stored in the cache.'''
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def publish(new_path, path):
+    '''
+    It moves 'new_path' over 'path' with an atomic rename, unless both files have the same contents: then
+    'new_path' is removed and 'path' is not modified. Returns whether 'path' was written.
+    '''
+    if (os.path.isfile(path) and os.path.getsize(path) == os.path.getsize(new_path)
+            and file_digest(path) == file_digest(new_path)):
+        os.remove(new_path)
+        return False
+    os.replace(new_path, path)
+    return True
+
+
+class ConversionCache:
+    '''
+    Class Description
+    ------------------
+    Cache file of an output directory. Each entry is an output netlist, by its path relative to the directory, with
+    its 'input', the 'input_hash' and 'input_stat' of the input, the 'options' of convert_file() and the [size,
+    modification time] of each file written next to it ('outputs').
+
+    Parameters
+    ----------
+    output_dir : str
+        Directory of the outputs, where the cache file is kept.
+    '''
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, CACHE_FILE)
+        self.entries = {}
+        self.modified = False
+
+        if os.path.isfile(self.path):
+            try:
+                with open(self.path) as f:
+                    data = json.load(f)
+                if data.get('version') == CACHE_VERSION:
+                    self.entries = data['entries']
+            except (ValueError, KeyError):
+                pass                            # A broken cache file only means that everything is converted again
+
+    def key(self, output_path):
+        return os.path.relpath(output_path, self.output_dir)
+
+    def up_to_date(self, input_path, output_path, options):
+        '''It returns whether the outputs of 'output_path' are up to date with 'input_path' and 'options'.'''
+        entry = self.entries.get(self.key(output_path))
+        if entry is None or entry['input'] != input_path or entry['options'] != options:
+            return False
+
+        stat = file_stat(input_path)
+        if stat != entry['input_stat']:
+            if file_digest(input_path) != entry['input_hash']:
+                return False
+            entry['input_stat'] = stat          # Same contents (e.g. touched), the hash is not computed again
+            self.modified = True
+
+        return not self.outputs_changed(output_path)
+
+    def outputs_changed(self, output_path):
+        '''It returns whether one of the outputs of 'output_path' is missing or was modified since it was written.'''
+        entry = self.entries.get(self.key(output_path))
+        if entry is None:
+            return True
+        directory = os.path.dirname(output_path)
+        for name, stat in entry['outputs'].items():
+            path = os.path.join(directory, name)
+            if not os.path.isfile(path) or file_stat(path) != stat:
+                return True
+        return False
+
+    def record(self, result, options):
+        '''It stores the result of convert_outputs(), and removes the files of the previous conversion not written now.'''
+        key = self.key(result['output'])
+        old = self.entries.get(key)
+        if old is not None:
+            directory = os.path.dirname(result['output'])
+            for name in set(old['outputs']) - set(result['outputs']):
+                path = os.path.join(directory, name)
+                if os.path.isfile(path):
+                    os.remove(path)
+
+        self.entries[key] = {
+            'input': result['file'],
+            'input_hash': result['input_hash'],
+            'input_stat': result['input_stat'],
+            'options': options,
+            'outputs': result['outputs'],
+        }
+        self.modified = True
+
+    def save(self):
+        '''It writes the cache file (atomically) if it changed.'''
+        if not self.modified:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.output_dir, prefix=CACHE_FILE + '.')
+        with os.fdopen(fd, "w") as f:
+            json.dump({'version': CACHE_VERSION, 'entries': self.entries}, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        self.modified = False
+
+
+def convert_outputs(input_path, output_path, options):
+    '''
+    Function Description
+    ------------------
+    Converts 'input_path' with convert_file() in a temporary directory next to 'output_path', and publishes every
+    file written (see publish()). The memory files are written next to the output netlist.
+
+    Returns the result of convert_file() with the 'output' netlist, the hash and [size, modification time] of the
+    input, the [size, modification time] of each output ('outputs') and the paths of the files actually 'written'.
+    '''
+    directory = os.path.dirname(output_path)
+    os.makedirs(directory or '.', exist_ok=True)
+
+    input_stat = file_stat(input_path)          # Before reading it, a change during the conversion is seen next time
+    input_hash = file_digest(input_path)
+    tmp_dir = tempfile.mkdtemp(dir=directory or '.', prefix='.convert-')
+    try:
+        result = convert_file(input_path, os.path.join(tmp_dir, os.path.basename(output_path)), mem_dir=tmp_dir,
+                              **options)
+        outputs = {}
+        written = []
+        for name in sorted(os.listdir(tmp_dir)):
+            path = os.path.join(directory, name)
+            if publish(os.path.join(tmp_dir, name), path):
+                written.append(path)
+            outputs[name] = file_stat(path)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    result.update({
+        'output': output_path,
+        'input_hash': input_hash,
+        'input_stat': input_stat,
+        'outputs': outputs,
+        'written': written,
+        'converted': True,
+    })
+    return result
+
+
+def _convert_job(job):
+    input_path, output_path, options = job
+    try:
+        return convert_outputs(input_path, output_path, options)
+    except Exception as e:
+        return {'file': input_path, 'output': output_path, 'converted': False, 'error': str(e)}
+
+
+def update(pairs, cache, jobs=None, **options):
+    '''
+    Function Description
+    ------------------
+    Converts the (input, output netlist) pairs that are not up to date in 'cache', in a process pool if there are
+    several of them, and saves the cache.
+
+    The rest of the keyword arguments are passed to convert_file(). Returns one dict per pair: the result of
+    convert_outputs() for the ones converted, {'file', 'output', 'converted': False} for the ones up to date, or
+    the same with an 'error' for the ones that failed (their old outputs are kept).
+    '''
+    results = {}
+    work = []
+    for input_path, output_path in pairs:
+        if cache.up_to_date(input_path, output_path, options):
+            results[output_path] = {'file': input_path, 'output': output_path, 'converted': False}
+        else:
+            work.append((input_path, output_path, options))
+
+    if len(work) > 1 and jobs != 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            converted = list(pool.map(_convert_job, work))
+    else:
+        converted = [_convert_job(job) for job in work]
+
+    for result in converted:
+        if 'error' not in result:
+            cache.record(result, options)
+        results[result['output']] = result
+    cache.save()
+    return [results[output_path] for _, output_path in pairs]
+
+
+def batch_pairs(paths, output_dir):
+    '''It returns the (input, output netlist) pairs of extractor.convert_batch() for the same arguments.'''
+    return [(input_path, os.path.join(output_dir, relative)) for input_path, relative in find_inputs(paths)]
+
+
+def convert_incremental(paths, output_dir, jobs=None, mem_template=BATCH_MEM_TEMPLATE, **options):
+    '''Same as extractor.convert_batch(), but only the files that are not up to date are converted (see update()).'''
+    return update(batch_pairs(paths, output_dir), ConversionCache(output_dir), jobs, mem_template=mem_template,
+                  **options)
+
+
+def watch(get_pairs, output_dir, interval=1.0, jobs=None, report=None, rounds=None, **options):
+    '''
+    Function Description
+    ------------------
+    Converts the pairs returned by 'get_pairs()' with update(), and then checks them every 'interval' seconds:
+    the inputs whose size or modification time changed since they were last converted (and the new ones), the ones
+    whose conversion failed and the ones with an output missing or modified are converted again. It runs until it is
+    interrupted (KeyboardInterrupt), or for 'rounds' checks if it is given.
+
+    Parameters
+    ----------
+    get_pairs : callable
+        It returns the (input, output netlist) pairs, e.g. lambda: batch_pairs(paths, output_dir). It is called in
+        every check, so the files added to a directory are found.
+
+    output_dir : str
+        Directory of the cache file.
+
+    report : callable
+        It is called with the results of update() of every check with changes.
+
+    The rest of the keyword arguments are passed to convert_file().
+    '''
+    cache = ConversionCache(output_dir)
+    checked = {}                                # [size, modification time] of each input when it was last converted
+    count = 0
+    try:
+        while rounds is None or count < rounds:
+            if count:
+                time.sleep(interval)
+            count += 1
+
+            changed = []
+            stats = {}
+            for input_path, output_path in get_pairs():
+                try:
+                    stat = file_stat(input_path)
+                except FileNotFoundError:           # Removed (or being replaced) since it was listed
+                    continue
+                if checked.get(input_path) != stat or cache.outputs_changed(output_path):
+                    stats[input_path] = stat
+                    changed.append((input_path, output_path))
+
+            if changed:
+                results = update(changed, cache, jobs, **options)
+                for result in results:
+                    if 'error' not in result:       # The failed ones are tried again in the next check
+                        checked[result['file']] = stats[result['file']]
+                if report is not None:
+                    report(results)
+    except KeyboardInterrupt:
+        pass
+
+
+def summary(results, elapsed):
+    '''It returns a line with the number of files converted, up to date, failed and written.'''
+    converted = sum(r['converted'] for r in results)
+    failed = sum('error' in r for r in results)
+    written = sum(len(r.get('written', ())) for r in results)
+    return "{:d} converted, {:d} up to date, {:d} failed, {:d} files written in {:.2f} s".format(
+        converted, len(results) - converted - failed, failed, written, elapsed)
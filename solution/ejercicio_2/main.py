@@ -1,79 +1,59 @@
-import re
+import argparse
+import os
+import sys
 
-mem_filename = "memdump0.mem"
+from extractor import MEM_TEMPLATE, convert_file
+from incremental import ConversionCache, update, watch
 
-# We declare lists of strings used to store the lines that will be written to the output files
-lines_output = []
-lines_mem = []
-
-try:
-    # We open all the files that we will used to work with
-    input_file = open("testcase.v","r")
-
-    # Regex definitions
-    pattern_name = re.compile(r"\s*reg \[.*\] (\S*) \[.*\];\n")
-    pattern_begin = re.compile(r"\s*initial begin\n")
-
-    # Flow control variable
-    looping_mem = False
-
-    # Name of the register array
-    mem_name = ""
-
-    # Start reading the input verilog file
-    for each_line in input_file:
-        # Match definitions for each line
-        match_name = pattern_name.search(each_line)
-        match_begin = pattern_begin.search(each_line)
-
-
-        if match_name:
-            # If we find a register definition
-            mem_name = match_name.groups()[0]                                               # We store the name of the register array
-            lines_output.append(each_line)                                                  # We save the line
-        elif match_begin:
-            # If we find the 'initial begin' line
-            lines_output.append('  $readmemh("{:s}", {:s});\n'.format(mem_filename,mem_name))      # We add the new syntax
-            looping_mem = True                                                              # The following lines are supposed to be assignations
-        elif looping_mem:
-            # Looping through the assignations
-            pattern_end = re.compile(r"\s*end\n")
-            match_end = pattern_end.search(each_line)
-            if match_end:
-                # If we find an 'end' line, we stop looping
-                looping_mem = False
-            else:
-                # If we are looking to the assignations
-                pattern_hex = re.compile(r"\'h(.*)\;")                                      # Look for hex values
-                match_hex = pattern_hex.search(each_line)
-                lines_mem.append(match_hex.groups()[0] + '\n')                              # Store hex values
 
+def report(results):
+    for r in results:
+        if 'error' in r:
+            print("Error while converting the input verilog file: " + r['error'])
+        elif r['converted']:
+            print("{:s} converted, {:d} files written".format(r['file'], len(r['written'])))
         else:
-            # If the line is not important to this analisis, we save it as it is
-            lines_output.append(each_line)
-
-
-except Exception as e:
-    print("Error while reading input file: " + e)
-finally:
-    input_file.close()
-
-
-
-# Writing Verilog File
-try:
-    output_verilog_file = open("output.v","w")
-    output_verilog_file.writelines(lines_output)
-except Exception as e:
-    print("Error while writing output verilog file: " + e)
-finally:
-    output_verilog_file.close()
-
-# Writing Memory File
-try:
-    output_mem_file = open(mem_filename,"w")
-    output_mem_file.writelines(lines_mem)
-except Exception as e:
-    print("Error while writing output memory file: " + e)
-finally:
-    output_mem_file.close()
+            print("{:s} is up to date".format(r['file']))
+
+
+def main(argv=None):
+    '''
+    Function Description
+    ------------------
+    Converts testcase.v into output.v, the values of the first register array are written to memdump0.mem. To
+    convert many files use extractor.py, and to convert a netlist in memory use extractor.convert_text().
+
+    With --incremental the input is only converted if it changed since the last conversion, and only the outputs
+    whose contents changed are written (see incremental.py). With --watch it is converted again whenever it changes.
+
+    '''
+    parser = argparse.ArgumentParser(description="Replaces the memory initializations of a verilog file by $readmemh.")
+    parser.add_argument('input', nargs='?', default="testcase.v", help="input verilog file (default: %(default)s)")
+    parser.add_argument('-o', '--output', default="output.v", help="output verilog file (default: %(default)s)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="convert only if the input changed, and write only the outputs that changed")
+    parser.add_argument('--watch', type=float, nargs='?', const=1.0, default=None, metavar='SECONDS',
+                        help="convert the input again whenever it changes, checking it every SECONDS (default: 1)")
+    args = parser.parse_args(argv)
+
+    if args.incremental or args.watch is not None:
+        output_dir = os.path.dirname(args.output) or '.'
+        pairs = [(args.input, args.output)]
+        if args.watch is not None:
+            print("Watching " + args.input)
+            watch(lambda: pairs, output_dir, args.watch, report=report, mem_template=MEM_TEMPLATE)
+            return 0
+        results = update(pairs, ConversionCache(output_dir), mem_template=MEM_TEMPLATE)
+        report(results)
+        return 1 if 'error' in results[0] else 0
+
+    try:
+        convert_file(args.input, args.output, mem_template=MEM_TEMPLATE)
+    except Exception as e:
+        print("Error while converting the input verilog file: " + str(e))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
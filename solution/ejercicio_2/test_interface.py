@@ -1,9 +1,84 @@
+import os
+import random
+from collections import deque
+from itertools import zip_longest
+from pathlib import Path
+
 import pytest
 
-import main     # Runs the main program
+import main
+from extractor import BATCH_MEM_TEMPLATE, convert_batch, convert_file, convert_text, memory_words, pattern_assign
+from incremental import CHUNK_SIZE, batch_pairs, convert_incremental, file_digest, watch
+
+CONTEXT_LINES = 3
+
+
+def first_difference(path, expected_path, context=CONTEXT_LINES):
+    '''
+    Function Description
+    ------------------
+    It reads both files line by line until the first line that differs. Returns its line number, the memory address
+    of that line (in a '.mem' file, or from a 'mem[i] = ...' assignment) and the lines of each file around it.
+
+    '''
+    before = deque(maxlen=context)
+    memory_file = path.endswith('.mem')
+    address = 0                                                     # Address of the next word of a memory file
+    with open(path, "r") as f, open(expected_path, "r") as expected_f:
+        lines = zip_longest(f, expected_f)
+        for line_number, (line, expected) in enumerate(lines, 1):
+            if line != expected:
+                after = [pair for _, pair in zip(range(context), lines)]
+                first = line_number - len(before)
+                window = [(first + i, l, e) for i, (l, e) in enumerate([*before, (line, expected), *after])]
+
+                text = expected if expected is not None else line
+                if not memory_file:
+                    match = pattern_assign.match(text)
+                    address = int(match.group(2)) if match else None
+                elif text.startswith('@'):
+                    address = None
+                return line_number, address, window
+
+            before.append((line, expected))
+            if memory_file and line.startswith('@'):
+                address = int(line[1:], 16)
+            elif memory_file and line.strip():
+                address += 1
+    return None
+
+
+def assert_same_file(path, expected_path, chunk_size=CHUNK_SIZE, context=CONTEXT_LINES):
+    '''
+    Function Description
+    ------------------
+    Checks that a file is the same as the expected one without loading them: the sizes and digests are compared
+    first, and only on a mismatch the files are read again to report the first differing line, its memory address
+    and a few lines around it (instead of the diff of the whole files).
+
+    '''
+    if (os.path.getsize(path) == os.path.getsize(expected_path) and
+            file_digest(path, chunk_size) == file_digest(expected_path, chunk_size)):
+        return
+
+    line_number, address, window = first_difference(path, expected_path, context)
+    message = ["{:s} differs from {:s} at line {:d}{:s}:".format(
+        path, expected_path, line_number, '' if address is None else ' (memory address {:d})'.format(address))]
+    for number, line, expected in window:
+        mark = '>' if number == line_number else ' '
+        message.append("{:s}{:8d} got:      {:s}".format(mark, number, '<EOF>' if line is None else line.rstrip('\n')))
+        message.append("{:s}{:8s} expected: {:s}".format(mark, '', '<EOF>' if expected is None else expected.rstrip('\n')))
+    pytest.fail('\n'.join(message), pytrace=False)
 
 
-def test_verilog():
+@pytest.fixture(scope="module")
+def converted(tmp_path_factory):
+    '''Runs the main program on testcase.v, the output files are written to a temporary directory.'''
+    output_dir = tmp_path_factory.mktemp("main")
+    assert main.main(["testcase.v", "-o", str(output_dir / "output.v")]) == 0
+    return output_dir
+
+def test_verilog(converted):
     '''
     Test Description
     ------------------
@@ -11,50 +86,273 @@ def test_verilog():
 
     '''
 
-    input = ""
-    expected = ""
-    try:
-        input_file = open("output.v","r")
-        input = input_file.read()
-    except Exception as e:
-        print("Error while reading input verilog file: " + e)
-    finally:
-        input_file.close()
+    assert_same_file(str(converted / "output.v"), "expected/expected.v")
 
-    try:
-        expected_file = open("expected/expected.v","r")
-        expected = expected_file.read()
-    except Exception as e:
-        print("Error while reading expected verilog file: " + e)
-    finally:
-        expected_file.close()
+def test_mem_file(converted):
+    '''
+    Test Description
+    ------------------
+    Checks if the output memory map file is the same as the expected. Both were generated with the testcase.v file.
+
+    '''
 
-    assert input == expected
+    assert_same_file(str(converted / "memdump0.mem"), "expected/memdump0.mem")
 
-def test_mem_file():
+def test_convert_text():
     '''
     Test Description
     ------------------
-    Checks if the output memory map file is the same as the expected. Both were generated with the testcase.v file.
+    Converts testcase.v in memory, from a string and from an open file. The result must be the same as the expected
+    files.
+
+    '''
+
+    expected = Path("expected/expected.v").read_text()
+    expected_mem = Path("expected/memdump0.mem").read_text()
+    with open("testcase.v", "r") as f:
+        from_file = convert_text(f, stem="testcase")
+
+    for result in (convert_text(Path("testcase.v").read_text()), convert_text(Path("testcase.v").read_bytes()),
+                   from_file):
+        assert result['verilog'] == expected
+        assert result['files'] == {'mem': 'memdump0.mem'}
+        assert result['memories'] == {'mem': expected_mem}
+
+def test_fuzz_in_memory():
+    '''
+    Test Description
+    ------------------
+    Converts a thousand random netlists in memory, with several register arrays of random width and depth, whose
+    words are assigned in random order. The words read back from each memory must be the assigned ones.
+
+    '''
+
+    rng = random.Random(1234)
+    for _ in range(1000):
+        memories = {}
+        lines = ["module top(clk);\n", "  input clk;\n"]
+        for index in range(rng.randint(1, 3)):
+            name = "mem{:d}".format(index)
+            width, depth = rng.randint(1, 40), rng.randint(1, 32)
+            words = {address: rng.getrandbits(width) for address in rng.sample(range(depth), rng.randint(1, depth))}
+            memories[name] = words
+            lines.append("  reg [{:d}:0] {:s} [{:d}:0];\n".format(width - 1, name, depth - 1))
+            lines.append("  initial begin\n")
+            lines.extend("    {:s}[{:d}] = {:d}'h{:0{:d}x};\n".format(name, address, width, value, (width + 3) // 4)
+                         for address, value in words.items())
+            lines.append("  end\n")
+        lines.append("endmodule\n")
+
+        result = convert_text(lines, mem_template=BATCH_MEM_TEMPLATE)
+
+        assert "initial begin" not in result['verilog']
+        for name, words in memories.items():
+            assert '  $readmemh("input_{:s}.mem", {:s});\n'.format(name, name) in result['verilog']
+            assert dict(memory_words(result['memories'][name])) == words
+
+def test_compare_report(tmp_path):
+    '''
+    Test Description
+    ------------------
+    Compares two memory files that differ in one word: only that line, its address and its context are reported.
+
+    '''
+
+    words = ["{:02x}\n".format(i % 256) for i in range(1000)]
+    (tmp_path / "expected.mem").write_text("@10\n" + "".join(words))
+    words[500] = "zz\n"
+    (tmp_path / "out.mem").write_text("@10\n" + "".join(words))
+
+    assert_same_file(str(tmp_path / "expected.mem"), str(tmp_path / "expected.mem"), chunk_size=64)
+    with pytest.raises(pytest.fail.Exception) as error:
+        assert_same_file(str(tmp_path / "out.mem"), str(tmp_path / "expected.mem"), chunk_size=64)
+
+    message = str(error.value)
+    assert "at line 502 (memory address 516)" in message
+    assert "got:      zz" in message and "expected: f4" in message
+    assert len(message.splitlines()) == 1 + 2 * (2 * CONTEXT_LINES + 1)
+
+def test_multiple_memories(tmp_path):
+    '''
+    Test Description
+    ------------------
+    Converts a directory with a module that has two register arrays (in two blocks) and a block that is not a
+    memory initialization. Each array must get its own memory file.
 
     '''
 
-    input = ""
-    expected = ""
-    try:
-        input_file = open("memdump0.mem","r")
-        input = input_file.read()
-    except Exception as e:
-        print("Error while reading input verilog file: " + e)
-    finally:
-        input_file.close()
+    source = Path("testcase.v").read_text()
+    source = source.replace("  reg [7:0] mem [15:0];\n",
+                            "  reg [7:0] mem [15:0];\n"
+                            "  reg [3:0] rom [1:0];\n"
+                            "  initial begin\n    rom[0] = 4'h1;\n    rom[1] = 4'ha;\n  end\n"
+                            "  initial begin\n    x = 1'h0;\n  end\n")
+    (tmp_path / "in").mkdir()
+    (tmp_path / "in" / "top.v").write_text(source)
+
+    results = convert_batch([str(tmp_path / "in")], str(tmp_path / "out"), jobs=1, mem_template=BATCH_MEM_TEMPLATE)
+
+    assert results[0]['memories'] == {'rom': 2, 'mem': 16}
+    assert (tmp_path / "out" / "top_rom.mem").read_text() == "1\na\n"
+    assert (tmp_path / "out" / "top_mem.mem").read_text() == Path("expected/memdump0.mem").read_text()
+
+    output = (tmp_path / "out" / "top.v").read_text()
+    assert '  $readmemh("top_rom.mem", rom);\n  initial begin\n    x = 1\'h0;\n  end\n' in output
+    assert '  $readmemh("top_mem.mem", mem);\n' in output
+
+def test_batch_errors(tmp_path):
+    '''
+    Test Description
+    ------------------
+    Two inputs with the same name must be rejected before anything is converted. A broken input must be reported
+    without writing any of its outputs, and the rest of the batch must still be converted.
+
+    '''
+
+    source = Path("testcase.v").read_text()
+    for directory in ("a", "b"):
+        (tmp_path / directory).mkdir()
+        (tmp_path / directory / "x.v").write_text(source)
+    (tmp_path / "b" / "y.v").write_text(source.replace("    mem[3] = 8'h", "    mem3 = 8'h"))
+    out = tmp_path / "out"
+
+    with pytest.raises(ValueError, match="x.v"):
+        convert_batch([str(tmp_path / "a" / "x.v"), str(tmp_path / "b" / "x.v")], str(out), jobs=1)
+    assert not out.exists()
+
+    results = convert_batch([str(tmp_path / "b")], str(out), jobs=1)
+    assert [r['file'] for r in results] == [str(tmp_path / "b" / "x.v"), str(tmp_path / "b" / "y.v")]
+    assert results[0]['memories'] == {'mem': 16}
+    assert "unexpected line" in results[1]['error']
+    assert sorted(path.name for path in out.iterdir()) == ["x.v", "x_mem.mem"]
+
+def test_sparse_memory(tmp_path):
+    '''
+    Test Description
+    ------------------
+    Converts a memory whose addresses have gaps and are out of order. The address of each value must be kept with
+    '@address' records, or the gaps filled, and the binary image must have each word at its address.
+
+    '''
+
+    source = ("module top;\n"
+              "  reg [15:0] rom [7:0];\n"
+              "  initial begin\n"
+              "    rom[2] = 16'h1234;\n"
+              "    rom[3] = 16'habcd;\n"
+              "    rom[6] = 16'h00ff;\n"
+              "    rom[0] = 16'h0001;\n"
+              "  end\n"
+              "endmodule\n")
+    (tmp_path / "top.v").write_text(source)
+
+    convert_file(str(tmp_path / "top.v"), str(tmp_path / "out.v"), raw=True)
+    assert (tmp_path / "memdump0.mem").read_text() == "@2\n1234\nabcd\n@6\n00ff\n@0\n0001\n"
+    assert (tmp_path / "memdump0.bin").read_bytes() == bytes.fromhex("010000003412cdab00000000ff000000")
+
+    convert_file(str(tmp_path / "top.v"), str(tmp_path / "out.v"), mem_format='bin', fill=0)
+    assert (tmp_path / "memdump0.mem").read_text() == ("0000000000000000\n" * 2 + "0001001000110100\n"
+                                                       "1010101111001101\n" + "0000000000000000\n" * 2 +
+                                                       "0000000011111111\n@0\n0000000000000001\n@7\n"
+                                                       "0000000000000000\n")
+    assert '  $readmemb("memdump0.mem", rom);\n' in (tmp_path / "out.v").read_text()
+
+def test_generator_readmemh(tmp_path):
+    '''
+    Test Description
+    ------------------
+    Generates the same RegisterFile with its initial values inlined and with a '$readmemh' file. Converting the
+    inlined netlist must give the same memory file, and the other netlist must not have any assignment.
+
+    '''
+    pytest.importorskip("nmigen")
+    from generate import RegisterFile, convert_verilog
+
+    rf = RegisterFile(width=12, depth=100, read_ports=2, write_ports=2, seed=7)
+    (tmp_path / "inline.v").write_text(convert_verilog(rf))
+    convert_file(str(tmp_path / "inline.v"), str(tmp_path / "out.v"))
+
+    rf = RegisterFile(width=12, depth=100, read_ports=2, write_ports=2, seed=7, inline_init=False)
+    assert rf.write_init(str(tmp_path / "init.mem")) == 100
+    assert (tmp_path / "init.mem").read_text() == (tmp_path / "memdump0.mem").read_text()
+
+    output = convert_verilog(rf, mem_file="init.mem")
+    assert '  initial $readmemh("init.mem", mem);\n' in output
+    assert "mem[0] =" not in output
+
+def test_incremental(tmp_path):
+    '''
+    Test Description
+    ------------------
+    Converts a directory incrementally several times. Only the files whose input changed must be converted again,
+    only the outputs whose contents changed must be written (the rest keep their modification time), and a failed
+    conversion must keep the old outputs.
+
+    '''
+
+    source = Path("testcase.v").read_text()
+    (tmp_path / "in").mkdir()
+    (tmp_path / "in" / "a.v").write_text(source)
+    (tmp_path / "in" / "b.v").write_text(source)
+    out = tmp_path / "out"
+
+    def run():
+        return {os.path.basename(r['file']): r for r in convert_incremental([str(tmp_path / "in")], str(out), jobs=1)}
+
+    results = run()
+    assert all(r['converted'] and len(r['written']) == 2 for r in results.values())
+    assert (out / "a_mem.mem").read_text() == Path("expected/memdump0.mem").read_text()
+    mtimes = {path.name: path.stat().st_mtime_ns for path in out.iterdir()}
+
+    # Nothing changed, or only the modification time of an input
+    os.utime(tmp_path / "in" / "b.v")
+    assert not any(r['converted'] for r in run().values())
+
+    # A comment changes the netlist but not the memory file
+    (tmp_path / "in" / "a.v").write_text(source + "// comment\n")
+    results = run()
+    assert not results['b.v']['converted']
+    assert results['a.v']['written'] == [str(out / "a.v")]
+    assert (out / "a_mem.mem").stat().st_mtime_ns == mtimes["a_mem.mem"]
+    assert (out / "b.v").stat().st_mtime_ns == mtimes["b.v"]
+
+    # A modified output is written again
+    (out / "b_mem.mem").write_text("00\n")
+    assert run()['b.v']['written'] == [str(out / "b_mem.mem")]
+
+    # A broken input is reported, and its outputs are kept
+    (tmp_path / "in" / "a.v").write_text(source.replace("    mem[3] = 8'h", "    mem3 = 8'h"))
+    results = run()
+    assert "unexpected line" in results['a.v']['error']
+    assert (out / "a_mem.mem").stat().st_mtime_ns == mtimes["a_mem.mem"]
+    assert sorted(path.name for path in out.iterdir()) == [".extractor_cache.json", "a.v", "a_mem.mem", "b.v",
+                                                           "b_mem.mem"]
+
+def test_watch(tmp_path):
+    '''
+    Test Description
+    ------------------
+    Watches a directory for a few checks. A failed conversion must be tried again in the next check, and a deleted
+    output must be written again, even if their inputs did not change.
+
+    '''
+
+    source = Path("testcase.v").read_text()
+    (tmp_path / "in").mkdir()
+    (tmp_path / "in" / "a.v").write_text(source.replace("    mem[3] = 8'h", "    mem3 = 8'h"))
+    (tmp_path / "in" / "b.v").write_text(source)
+    out = tmp_path / "out"
+
+    calls = []
 
-    try:
-        expected_file = open("expected/memdump0.mem","r")
-        expected = expected_file.read()
-    except Exception as e:
-        print("Error while reading expected verilog file: " + e)
-    finally:
-        expected_file.close()
+    def report(results):
+        calls.append({os.path.basename(r['file']): 'error' if 'error' in r else r['converted'] for r in results})
+        if len(calls) == 1:
+            (out / "b_mem.mem").unlink()
+        elif len(calls) == 2:
+            (tmp_path / "in" / "a.v").write_text(source)
 
-    assert input == expected
+    watch(lambda: batch_pairs([str(tmp_path / "in")], str(out)), str(out), interval=0, jobs=1, report=report,
+          rounds=4, mem_template=BATCH_MEM_TEMPLATE)
+    assert calls == [{'a.v': 'error', 'b.v': True}, {'a.v': 'error', 'b.v': True}, {'a.v': True}]
+    assert (out / "b_mem.mem").read_text() == (out / "a_mem.mem").read_text()